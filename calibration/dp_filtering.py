@@ -10,11 +10,17 @@ reading saved data
 """
 import numpy as np
 import matplotlib.pyplot as plt
+import os
+import sys
 
 from scipy import signal
 from scipy import interpolate
 from scipy import misc
 
+# the sensor log reader lives with the monitor code
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'monitor'))
+from sensor import rawlog
+
 
 flowcal = np.loadtxt('Flow_Calibration.txt',delimiter = '\t',skiprows = 1)
 
@@ -111,7 +117,8 @@ def calculate_breath_params(i_min,i,time, vol):
     
 #%% 
 
-time,p1,p2,dp_raw = np.loadtxt('1589499917_sensor_raw.txt',delimiter = '\t',skiprows = 1,unpack = True)
+# works with the old text logs and the binary *_sensor_raw.bin logs
+time,p1,p2,dp_raw = rawlog.load_sensor_data('1589499917_sensor_raw.txt',skiprows = 1)
 #time,p1,p2,dp_raw = np.loadtxt('Simulated_Data.txt',delimiter = '\t',skiprows = 1,unpack = True)
 i_raw = np.arange(len(time))
 ts = 0.01# sampling time
@@ -3,8 +3,9 @@
 Module containing the Alarms class
 which mnages the alarm thresholds
 '''
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5 import QtCore
+from utils.uicache import load_ui
 
 
 class AlarmScrollBar(QtWidgets.QScrollBar):
@@ -85,7 +86,7 @@ class Alarms(QtWidgets.QWidget):
         Grabs child widgets.
         """
         super(Alarms, self).__init__(*args)
-        uic.loadUi("alarms/alarms.ui", self)
+        load_ui("alarms/alarms.ui", self)
 
         self.layout = self.findChild(QtWidgets.QGridLayout, "monitors_layout")
         self.label_alarmname = self.findChild(
@@ -3,7 +3,8 @@
 Alarm bar helper
 """
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
+from utils.uicache import load_ui
 
 
 class AlarmsBar(QtWidgets.QWidget):
@@ -18,4 +19,4 @@ class AlarmsBar(QtWidgets.QWidget):
         Grabs child widgets.
         """
         super(AlarmsBar, self).__init__(*args)
-        uic.loadUi("alarms/alarmsbar.ui", self)
+        load_ui("alarms/alarmsbar.ui", self)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+benchmark.py
+
+Times each stage of the path from reading the sensor to updating the
+display, using the fake sensor and the recorded data in calibration/, and
+reports the spread of the cost of each call (p50/p99 in us) and the
+highest sample rate the fast processing can keep up with.
+
+These are the numbers to use when picking fastdata_interval, plot_interval
+and acquisition_interval for a given board.
+
+Run it from the monitor directory:
+    python benchmark.py             all stages
+    python benchmark.py n=5000      number of timed calls per stage
+    python benchmark.py headless    skip the stages that need Qt widgets
+
+A stage that can't run fails the benchmark (exit status 1) after the rest
+have run, unless it was skipped on purpose with headless.
+
+"""
+
+import contextlib
+import gc
+import glob
+import io
+import os
+import sys
+import time
+import numpy as np
+import yaml
+
+main_path = os.getcwd()
+sys.path.insert(1, main_path)
+
+from sensor import rawlog
+from sensor import sensor
+
+
+class stage_skipped(Exception):
+    # raised by a stage that was asked not to run (eg. the Qt ones when headless)
+    pass
+
+
+def time_calls(function, n_calls, setup = None):
+    # time n_calls calls of function, returns the time of each call in us.
+    # anything the function prints is thrown away so the terminal isn't timed
+    times = np.empty(n_calls)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(n_calls):
+            if not setup is None:
+                setup(i)
+            t0 = time.perf_counter_ns()
+            function()
+            times[i] = time.perf_counter_ns() - t0
+    return times/1000.0
+
+
+class benchmark(object):
+    """
+    Runs the stages and collects the results.
+
+    Constituents:
+        results =   list of (stage name, array of call times in us)
+        notes   =   list of summary lines printed after the table
+        failed  =   names of the stages that couldn't run
+        threads =   the loop and alarm QThreads made by the stages, stopped by close()
+    """
+
+    def __init__(self, config, n_calls = 2000, headless = False):
+        self.config = config
+        self.n_calls = n_calls
+        self.headless = headless
+        self.results = []
+        self.notes = []
+        self.failed = []
+        self.threads = []
+
+    def add(self, name, times):
+        self.results.append((name, times))
+        return times
+
+    def skip(self, name, e):
+        self.notes.append(f"{name}: skipped ({e})")
+
+    def fail(self, name, e):
+        self.failed.append(name)
+        self.notes.append(f"{name}: FAILED ({type(e).__name__}: {e})")
+
+    def run(self):
+        # each stage runs on its own, if one can't run here the rest still do
+        for stage in (self.bench_sensor, self.bench_fast_loop, self.bench_pipeline_rate,
+                      self.bench_slow_loop, self.bench_data_filler, self.bench_alarms):
+            try:
+                stage()
+            except stage_skipped as e:
+                self.skip(stage.__name__, e)
+            except Exception as e:
+                self.fail(stage.__name__, e)
+
+    def close(self):
+        # stop the threads and let them go while Qt is still there to delete them,
+        # rather than leaving it to the garbage collection at exit
+        for thread in self.threads:
+            thread.quit()
+            thread.wait()
+        self.threads.clear()
+        self.fast_loop = None
+        gc.collect()
+
+    def bench_sensor(self):
+        fake = sensor.fakesensor(main_path = main_path)
+        self.read_times = self.add('sensor.read', time_calls(fake.read, self.n_calls))
+
+    def bench_fast_loop(self):
+        from data_handler.data_handler import fast_loop
+
+        # one sample per update: the loop reads the sensor itself
+        config = dict(self.config)
+        config['threaded_acquisition'] = False
+        # step through the recording one sample per read, the wall clock barely moves here
+        config['replay_realtime'] = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop = fast_loop(main_path, config, simulation = True)
+        self.threads.append(loop)
+        self.add('fast_loop.update (1 sample)', time_calls(loop.update, self.n_calls))
+
+        # threaded acquisition: each update processes the block of samples read since the last one
+        config['threaded_acquisition'] = True
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop = fast_loop(main_path, config, simulation = True)
+        self.threads.append(loop)
+        n_block = max(int(round(config['fastdata_interval']/config['acquisition_interval'])), 1)
+        buffer = loop.acquisition.buffer
+        fake = loop.sensor
+        clock = [time.time()]
+
+        def fill_block(i):
+            for j in range(n_block):
+                fake.read()
+                clock[0] += config['acquisition_interval']/1000.0
+                buffer.put(clock[0], fake.p1, fake.p2, fake.dp, fake.flow)
+
+        self.add(f'fast_loop.update ({n_block} sample block)', time_calls(loop.update, self.n_calls, setup = fill_block))
+        self.fast_loop = loop
+
+    def bench_pipeline_rate(self):
+        # push each recording through the fast pipeline one sample at a time
+        # and in blocks, to get the sustainable sample rate
+        from data_handler.pipeline import fast_pipeline
+
+        files = [main_path + '/calibration/Simulated_Data.txt'] + sorted(glob.glob(main_path + '/calibration/*_sensor_raw.*'))
+        calibration = sensor.fakesensor(main_path = main_path).calibration
+        per_sample = []
+        for filename in files:
+            t, p1, p2, dp = rawlog.load_sensor_data(filename)
+            t = np.asarray(t) - t[0] + time.time()
+            flow = calibration(p2 - p1)
+            n = min(len(t), self.n_calls*5)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                pipeline = fast_pipeline(self.config, ts_sample = self.config['acquisition_interval'])
+                t0 = time.perf_counter()
+                # the recorded dp, as the block path gets
+                for i in range(n):
+                    pipeline.process_sample(None, t[i], p1[i], p2[i], dp[i], flow[i])
+                t_sample = (time.perf_counter() - t0)/n
+
+                pipeline = fast_pipeline(self.config, ts_sample = self.config['acquisition_interval'])
+                t0 = time.perf_counter()
+                for start in range(0, n, 64):
+                    stop = min(start + 64, n)
+                    pipeline.process_block(t[start:stop], p1[start:stop], p2[start:stop], dp[start:stop], flow[start:stop])
+                t_block = (time.perf_counter() - t0)/n
+
+            per_sample.append(t_sample)
+            self.notes.append(f"{os.path.basename(filename)}: {n} samples, {1.0/t_sample:.0f} samples/s one at a time, {1.0/t_block:.0f} samples/s in blocks of 64")
+
+        # the fast loop has to read and process each sample within the sample interval
+        read_p99 = np.percentile(self.read_times, 99) if hasattr(self, 'read_times') else 0.0
+        worst = max(per_sample)*1e6 + read_p99
+        self.notes.append(f"max sustainable sample rate (read + process one sample, worst recording): {1e6/worst:.0f} Hz")
+
+    def bench_slow_loop(self):
+        from data_handler.data_handler import slow_loop
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop = slow_loop(main_path, self.config)
+        self.threads.append(loop)
+        fastloop = self.fast_loop
+        loop.connect_fast_loop(fastloop)
+        self.add('slow_loop.update', time_calls(loop.update, self.n_calls))
+
+        # breath parameters on a breath from the simulated recording
+        from data_handler.replay import replay_engine
+        engine = replay_engine(main_path, self.config, main_path + '/calibration/Simulated_Data.txt')
+        breaths = []
+        engine.fast_pipeline.on_new_breath = breaths.append
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine.run()
+        if len(breaths) == 0:
+            raise ValueError('no breath found in the simulated data')
+        loop.update_breath_data(breaths[-1])
+        self.add('calculate_breath_params', time_calls(loop.pipeline.calculate_breath_params, self.n_calls))
+
+    def _qt_app(self):
+        if self.headless:
+            raise stage_skipped('headless')
+        from PyQt5 import QtWidgets
+        app = QtWidgets.QApplication.instance()
+        if app is None:
+            self.app = QtWidgets.QApplication(sys.argv)
+        return QtWidgets
+
+    def bench_data_filler(self):
+        self._qt_app()
+        import pyqtgraph as pg
+        from data_handler.data_filler import DataFiller
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            filler = DataFiller(self.config)
+            self.plots = []
+            for name in self.config['plots']:
+                plot = pg.PlotWidget()
+                filler.connect_plot(name, plot)
+                self.plots.append(plot)
+
+        fastdata = self.fast_loop.fastdata
+        names = list(fastdata.all_fields.keys())
+        plotted = [self.config['plots'][name]['observable'] for name in self.config['plots']]
+
+        def add_points():
+            for key in names:
+                filler.add_data_point(key, fastdata.all_fields[key])
+
+        def update_plots():
+            for name in plotted:
+                filler.update_plot(name)
+
+        def frame():
+            add_points()
+            update_plots()
+
+        self.add('DataFiller.add_data_point (all fields)', time_calls(add_points, self.n_calls))
+        self.add('DataFiller.update_plot (all plots)', time_calls(update_plots, self.n_calls))
+        self.frame_times = self.add('plot frame (add + update)', time_calls(frame, self.n_calls))
+
+    def bench_alarms(self):
+        self._qt_app()
+        from monitor_class.Monitor import Monitor
+        from alarms.guialarms import GuiAlarms
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            monitors = {name : Monitor(name, self.config) for name in self.config['monitors']}
+            alarms = GuiAlarms(self.config, monitors)
+            for monitor in monitors.values():
+                monitor.connect_gui_alarm(alarms)
+            alarms.arm_alarms()
+        self.threads.append(alarms._audio_alarm)
+
+        # typical values, inside the default alarm ranges
+        data = {'pip' : 20.0, 'peep' : 5.0, 'mve_meas' : 8.0, 'vt' : 450.0, 'rr' : 15.0,
+                'ie' : 2.0, 'c' : 30.0, 'dt_last' : 2.0}
+        self.add('GuiAlarms.set_data', time_calls(lambda: alarms.set_data(data), self.n_calls))
+
+    def report(self):
+        print()
+        print(f"{'stage':<42}{'p50 (us)':>12}{'p99 (us)':>12}{'max (us)':>12}")
+        for name, times in self.results:
+            print(f"{name:<42}{np.percentile(times, 50):>12.1f}{np.percentile(times, 99):>12.1f}{np.max(times):>12.1f}")
+        print()
+        for note in self.notes:
+            print(note)
+
+        # how much of each loop's time budget the worst case uses
+        for name, times in self.results:
+            if name.startswith('fast_loop.update'):
+                budget = self.config['fastdata_interval']*1000.0
+                print(f"{name} p99 uses {100*np.percentile(times, 99)/budget:.1f}% of fastdata_interval ({self.config['fastdata_interval']} ms)")
+        if hasattr(self, 'frame_times'):
+            budget = self.config['plot_interval']*1000.0
+            print(f"plot frame p99 uses {100*np.percentile(self.frame_times, 99)/budget:.1f}% of plot_interval ({self.config['plot_interval']} ms)")
+
+
+if __name__ == "__main__":
+    n_calls = 2000
+    for arg in sys.argv[1:]:
+        if arg.startswith('n='):
+            n_calls = int(arg.split('=')[1])
+
+    with open(main_path + '/config/default_settings.yaml') as f:
+        config = yaml.load(f, Loader = yaml.FullLoader)
+
+    bench = benchmark(config, n_calls = n_calls, headless = 'headless' in sys.argv)
+    bench.run()
+    bench.report()
+    bench.close()
+    if len(bench.failed) > 0:
+        print(f"failed: {', '.join(bench.failed)}")
+        sys.exit(1)
@@ -0,0 +1,314 @@
+"""
+A headless emulator of the ESP32 firmware's serial protocol, for testing
+ESP32Serial without the hardware or a display.
+
+It opens a pseudo-terminal and answers the same "get <name>", "set <name>
+<value>" and "get all" lines as the firmware, with "valore=<value>" replies,
+so everything in ESP32Serial (the parsing, the pipelining and the retries)
+runs as it would on the Raspberry Pi. The pressure and flow come from the
+PEEP breath model the FakeESP32Serial uses, and the link can be made worse
+on purpose: each reply can be delayed (latency plus random jitter, keeping
+the replies in order as a serial line does), lose a byte or have a byte
+garbled.
+
+Run from the monitor directory:
+    python -m communication.esp32emulator                       print the port and serve until Ctrl-C
+    python -m communication.esp32emulator bench                 run ESP32Serial against it and report
+    python -m communication.esp32emulator bench n=2000 latency=0.005 jitter=0.002 drop=0.01 garble=0.01 seed=1
+"""
+
+import os
+import random
+import select
+import sys
+import time
+import tty
+from collections import deque
+from threading import Thread
+
+import numpy as np
+
+from communication.peep import PEEP
+
+
+class ESP32Emulator:
+    """
+    Emulates the ESP32 at the other end of a pseudo-terminal.
+
+    Class members:
+    - port: the device name of the pseudo-terminal to open, eg. with ESP32Serial
+    - latency: delay of each reply, in seconds
+    - jitter: standard deviation of the random extra delay, in seconds
+    - drop_rate: probability that a byte of a reply is lost
+    - garble_rate: probability that a byte of a reply is changed
+    - set_params: the values set with "set", returned by "get"
+    - counts: number of commands received, replies sent, bytes dropped and garbled
+    """
+
+    def __init__(self, get_all_fields, latency=0.0, jitter=0.0, drop_rate=0.0,
+                 garble_rate=0.0, seed=None, verbose=False):
+        """
+        Constructor
+
+        Opens the pseudo-terminal. Call start() to start answering.
+
+        arguments:
+        - get_all_fields: the observables returned by "get all", in order
+        - latency, jitter, drop_rate, garble_rate: see the class members
+        - seed: seed of the random faults, for repeatable runs
+        - verbose: print every command
+        """
+        self.get_all_fields = list(get_all_fields)
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.garble_rate = garble_rate
+        self.verbose = verbose
+        self._random = random.Random(seed)
+
+        self._master, self._slave = os.openpty()
+        # no echo and no line editing, like the ESP32's USB serial port
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        self.peep = PEEP()
+        self._lung_recruit_stop_time = 0
+
+        self.set_params = {
+            "run": 0,
+            "mode": 0,
+            "backup": 0,
+            "alarm": 0,
+            "warning": 0,
+            "temperature": 40,
+            "rate": 17.0,
+            "ratio": 2 / 3,
+            "ptarget": 37.7,
+            "pcv_trigger_enable": 1,
+            "pcv_trigger": 7,
+            "assist_ptrigger": 7.0,
+            "assist_flow_min": 47.0,
+            "pressure_support": 27.,
+            "backup_min_time": 17.0,
+            "backup_enable": 1,
+            "pause_lg_p": 37,
+            "pause_lg_time": 7.0}
+
+        self.counts = {"commands": 0, "replies": 0, "dropped": 0, "garbled": 0}
+
+        self._replies = deque()
+        self._t_last_reply = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """
+        Starts answering on a background thread.
+        """
+        self._running = True
+        self._thread = Thread(target=self._serve, name="esp32emulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops answering and closes the pseudo-terminal.
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def get(self, name):
+        """
+        The value the firmware would return for "get <name>".
+
+        arguments:
+        - name: the parameter or observable name
+
+        returns: the value as a string
+        """
+        if name == "pressure":
+            value = self.peep.pressure()
+        elif name == "flow":
+            value = self.peep.flow()
+        elif name == "peep":
+            value = self.peep.peeps["baseline"] + np.random.normal(scale=0.2)
+        elif name == "peak":
+            value = self.peep.peeps["baseline"] + self.peep.peeps["max"] + np.random.normal(scale=0.5)
+        elif name == "pause_lg_time":
+            value = max(self._lung_recruit_stop_time - time.time(), 0)
+        elif name in self.set_params:
+            return str(self.set_params[name])
+        else:
+            value = self._random.uniform(10, 100)
+        return "%.2f" % value
+
+    def set(self, name, value):
+        """
+        What the firmware does for "set <name> <value>".
+
+        returns: the reply value, "OK"
+        """
+        if name == "pause_lg" and int(float(value)) == 1:
+            self._lung_recruit_stop_time = time.time() + float(self.set_params["pause_lg_time"])
+        self.set_params[name] = value
+        return "OK"
+
+    def answer(self, line):
+        """
+        The reply to one command line.
+
+        arguments:
+        - line: the command, without the line terminator
+
+        returns: the reply as a string, or None if the command is empty
+        """
+        words = line.split()
+        if not words:
+            return None
+        if words == ["get", "all"]:
+            value = ",".join(self.get(name) for name in self.get_all_fields)
+        elif words[0] == "get" and len(words) == 2:
+            value = self.get(words[1])
+        elif words[0] == "set" and len(words) == 3:
+            value = self.set(words[1], words[2])
+        else:
+            value = "ERROR"
+        return "valore=" + value
+
+    def _damage(self, reply):
+        # drop and garble bytes of a reply, as a noisy line would
+        if not (self.drop_rate or self.garble_rate):
+            return reply
+        damaged = bytearray()
+        for byte in reply:
+            x = self._random.random()
+            if x < self.drop_rate:
+                self.counts["dropped"] += 1
+                continue
+            if x < self.drop_rate + self.garble_rate:
+                self.counts["garbled"] += 1
+                byte = self._random.randrange(32, 127)
+            damaged.append(byte)
+        return bytes(damaged)
+
+    def _queue_reply(self, reply):
+        # replies go out in order, so each one waits for the one before it
+        delay = self.latency + abs(self._random.gauss(0, self.jitter)) if self.jitter else self.latency
+        t_send = max(time.monotonic() + delay, self._t_last_reply)
+        self._t_last_reply = t_send
+        self._replies.append((t_send, self._damage((reply + "\r\n").encode())))
+
+    def _serve(self):
+        # read commands, queue the replies and write them when they're due
+        buffer = b""
+        while self._running:
+            timeout = 0.05
+            if self._replies:
+                timeout = min(max(self._replies[0][0] - time.monotonic(), 0), timeout)
+            readable, _, _ = select.select([self._master], [], [], timeout)
+
+            if readable:
+                buffer += os.read(self._master, 4096)
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    line = line.decode(errors="replace").strip()
+                    if self.verbose:
+                        print("esp32emulator: %s" % line)
+                    reply = self.answer(line)
+                    if reply is not None:
+                        self.counts["commands"] += 1
+                        self._queue_reply(reply)
+
+            now = time.monotonic()
+            while self._replies and self._replies[0][0] <= now:
+                os.write(self._master, self._replies.popleft()[1])
+                self.counts["replies"] += 1
+
+
+def bench(emulator, config, n_requests):
+    """
+    Runs ESP32Serial against the emulator: pipelined "get all"s, then sets
+    each followed by a get of the same value, and a batch of sets and gets.
+    Prints the throughput and how many requests failed or came back wrong.
+
+    The protocol has no checksum, so with dropped or garbled bytes some
+    damaged replies still parse (a digit lost or changed) and come back
+    wrong, as do the gets after a set that failed.
+
+    arguments:
+    - emulator: a started ESP32Emulator
+    - config: the configuration, with the "get_all_fields"
+    - n_requests: the number of requests of each kind
+    """
+    from communication.esp32serial import ESP32Serial, ESP32Exception
+
+    esp32 = ESP32Serial({"port": emulator.port, "get_all_fields": config["get_all_fields"]},
+                        timeout=max(0.1, 4*(emulator.latency + 3*emulator.jitter)))
+
+    def run(name, requests, check):
+        t_start = time.perf_counter()
+        requests = list(requests)
+        failed = wrong = 0
+        for i, request in enumerate(requests):
+            try:
+                if not check(i, request.result()):
+                    wrong += 1
+            except ESP32Exception:
+                failed += 1
+        t_run = time.perf_counter() - t_start
+        print("%-12s %6d requests in %6.2f s, %8.0f requests/s, %d failed, %d wrong" % (
+            name, len(requests), t_run, len(requests)/t_run, failed, wrong))
+
+    n_fields = len(config["get_all_fields"])
+    run("get all", (esp32.get_all_async() for i in range(n_requests)),
+        lambda i, values: len(values) == n_fields)
+
+    def set_and_get():
+        for i in range(n_requests):
+            yield esp32.set_async("bench_value", i)
+            yield esp32.get_async("bench_value")
+    run("set + get", set_and_get(),
+        lambda i, value: value == ("OK" if i % 2 == 0 else str(i//2)))
+
+    names = ["bench_%d" % j for j in range(8)]
+    def batches():
+        for i in range(n_requests//8):
+            yield esp32.set_many_async({name: i for name in names})
+            yield esp32.get_many_async(names)
+    run("batch of 8", batches(),
+        lambda i, values: all(value == ("OK" if i % 2 == 0 else str(i//2)) for value in values.values()))
+
+    esp32.close()
+    print("emulator: %(commands)d commands, %(replies)d replies, "
+          "%(dropped)d bytes dropped, %(garbled)d bytes garbled" % emulator.counts)
+
+
+if __name__ == "__main__":
+    from utils import configcache
+
+    options = {"n": 1000, "latency": 0.0, "jitter": 0.0, "drop": 0.0, "garble": 0.0, "seed": None}
+    for arg in sys.argv[1:]:
+        if "=" in arg:
+            key, value = arg.split("=", 1)
+            options[key] = float(value)
+
+    config, _ = configcache.load(os.getcwd() + "/config/default_settings.yaml")
+    emulator = ESP32Emulator(config["get_all_fields"], latency=options["latency"],
+                             jitter=options["jitter"], drop_rate=options["drop"],
+                             garble_rate=options["garble"],
+                             seed=None if options["seed"] is None else int(options["seed"]),
+                             verbose="verbose" in sys.argv)
+    emulator.start()
+
+    if "bench" in sys.argv:
+        bench(emulator, config, int(options["n"]))
+    else:
+        print("esp32emulator: answering on %s (Ctrl-C to stop)" % emulator.port)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    emulator.stop()
@@ -2,11 +2,14 @@
 Library to interface with the ESP32
 """
 
-from threading import Lock
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread, current_thread
+from PyQt5 import QtCore
 import serial  # pySerial
 from . import ESP32Alarm, ESP32Warning
 
-__all__ = ("ESP32Serial", "ESP32Exception")
+__all__ = ("ESP32Serial", "ESP32Request", "ESP32Exception")
 
 
 class ESP32Exception(Exception):
@@ -32,16 +35,86 @@ class ESP32Exception(Exception):
             "ERROR in %s: line: '%s'; output: %s" % (verb, line, output))
 
 
-class ESP32Serial:
+class ESP32Request(Future):
+    """
+    A command, or a batch of commands, queued for the ESP32: a Future that
+    the I/O thread resolves with the parsed replies, or with an
+    ESP32Exception if it has failed `retries` times.
+    """
+
+    def __init__(self, verb, name, lines, parse, retries):
+        """
+        Contructor
+
+        arguments:
+        - verb           the transmit verb = {get, set, batch}
+        - name           the parameter name (or "all" for get all, or the
+                         names in a batch)
+        - lines          the list of lines to transmit, binary encoded
+        - parse          the function that turns the list of replies into
+                         the result, raising an exception if they're bad
+        - retries        how many times to send it before giving up
+        """
+
+        super(ESP32Request, self).__init__()
+        self.verb = verb
+        self.name = name
+        self.lines = lines
+        self.parse = parse
+        self.retries = retries
+        self.outputs = []
+
+    def command(self):
+        """
+        returns: the command(s) as a string
+        """
+
+        return "; ".join(line.decode().strip() for line in self.lines)
+
+    def report(self):
+        """
+        returns: what the ESP32 replied to each command, as a string
+        """
+
+        replies = []
+        for i, line in enumerate(self.lines):
+            if i < len(self.outputs) and self.outputs[i].endswith(b"\n"):
+                reply = self.outputs[i].decode(errors="replace").strip()
+            else:
+                reply = "no reply"
+            replies.append("%s -> %s" % (line.decode().strip(), reply))
+        return "; ".join(replies)
+
+
+class ESP32Serial(QtCore.QObject):
     """
     Main class for interfacing with the ESP32 via a serial connection.
+
+    The serial line is driven by an I/O thread. Commands are queued and
+    the thread sends them in windows of up to max_in_flight commands at a
+    time (a batch from transaction_async() is always sent whole, in one
+    write), then reads the replies, which come back in the order the commands
+    were sent. The replies carry no reference to their command, so a window
+    is only resolved once all of its replies have arrived and parsed: if a
+    reply times out or is garbled the line is resynchronised and the whole
+    window is sent again (get and set are safe to repeat, and the windows
+    keep the commands in order). The futures resolve in the order the
+    commands were queued.
+
+    get(), set(), get_all() and the other wrappers wait for the reply as
+    before; the *_async versions return the ESP32Request (a Future) straight
+    away and can call a callback on the Qt (GUI) thread when it's done, so
+    a slow or flaky link doesn't block the GUI.
     """
 
+    # (callback, request) from the I/O thread, delivered on the GUI thread
+    _request_done = QtCore.pyqtSignal(object, object)
+
     def __init__(self, config, **kwargs):
         """
         Contructor
 
-        Opens a serial connection to the MVM ESP32
+        Opens a serial connection to the MVM ESP32 and starts the I/O thread
 
         arguments:
         - config         the configuration object containing at least the
@@ -52,14 +125,23 @@ class ESP32Serial:
         - baudrate       the preferred baudrate, default 115200
         - terminator     the line terminator, binary encoded, default
                          b'\n'
-        - timeout        sets the read() timeout in seconds
+        - timeout        sets the read() timeout in seconds: how long to
+                         wait for each reply
+        - retries        how many times to send a command before giving
+                         up, default 3
+        - max_in_flight  how many commands to send before reading the
+                         replies, default 4
+        - verbose        print every command, default False
         """
 
-        self.lock = Lock()
+        super(ESP32Serial, self).__init__()
 
-        baudrate = kwargs["baudrate"] if "baudrate" in kwargs else 115200
-        timeout = kwargs["timeout"] if "timeout" in kwargs else 1
-        self.term = kwargs["terminator"] if "terminator" in kwargs else b'\n'
+        baudrate = kwargs.pop("baudrate", 115200)
+        timeout = kwargs.pop("timeout", 1)
+        self.term = kwargs.pop("terminator", b'\n')
+        self.retries = kwargs.pop("retries", 3)
+        self.max_in_flight = kwargs.pop("max_in_flight", 4)
+        self.verbose = kwargs.pop("verbose", False)
         self.connection = serial.Serial(port=config["port"],
                                         baudrate=baudrate, timeout=timeout,
                                         **kwargs)
@@ -69,6 +151,15 @@ class ESP32Serial:
         while self.connection.read():
             pass
 
+        self._pending = deque()
+        self._condition = Condition()
+        self._closing = False
+        self._request_done.connect(self._call_back)
+
+        self._thread = Thread(target=self._io_loop, name="esp32serial",
+                              daemon=True)
+        self._thread.start()
+
     def __del__(self):
         """
         Destructor.
@@ -76,9 +167,23 @@ class ESP32Serial:
         Closes the connection.
         """
 
-        with self.lock:
-            if hasattr(self, "connection"):
-                self.connection.close()
+        self.close()
+
+    def close(self):
+        """
+        Stops the I/O thread, fails the commands still queued and closes
+        the connection.
+        """
+
+        if not hasattr(self, "_condition"):
+            return
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+        if self._thread.is_alive() and current_thread() is not self._thread:
+            self._thread.join()
+        if hasattr(self, "connection"):
+            self.connection.close()
 
     def _parse(self, result):
         """
@@ -97,6 +202,339 @@ class ESP32Serial:
             raise Exception("protocol error: 'valore=' expected")
         return value.strip()
 
+    def _parse_all(self, result):
+        """
+        Parses the reply to "get all"
+
+        arguments:
+        - result         what the ESP replied as a binary buffer
+
+        returns: a dict with the get_all_fields as keys and values as strings
+        """
+
+        values = self._parse(result).split(',')
+
+        if len(values) != len(self.get_all_fields):
+            raise Exception("get_all answer mismatch: expected: %s, got %s" % (
+                self.get_all_fields, values))
+
+        return dict(zip(self.get_all_fields, values))
+
+    def _parse_batch(self, commands, results):
+        """
+        Parses the replies to a batch of commands together
+
+        arguments:
+        - commands       the list of (verb, name[, value]) tuples
+        - results        what the ESP replied to each, as binary buffers
+
+        returns: the list of values, one per command
+        """
+
+        values = []
+        errors = []
+        for command, result in zip(commands, results):
+            try:
+                values.append(self._parse(result))
+            except Exception as exc: # pylint: disable=W0703
+                errors.append("%s %s: %s" % (command[0], command[1], str(exc)))
+        if errors:
+            raise Exception("; ".join(errors))
+        return values
+
+    def _submit(self, verb, name, commands, parse, callback):
+        """
+        Queues a command, or a batch of them, for the I/O thread
+
+        arguments:
+        - verb           the transmit verb = {get, set, batch}
+        - name           the parameter name(s)
+        - commands       the list of command lines as strings
+        - parse          the function that parses the list of replies
+        - callback       (optional) called with the request on the GUI
+                         thread when it's done
+
+        returns: the ESP32Request
+        """
+
+        if self.verbose:
+            for command in commands:
+                print("ESP32Serial-DEBUG: %s" % command.strip())
+
+        request = ESP32Request(verb, name,
+                               [command.encode() for command in commands],
+                               parse, self.retries)
+        if callback is not None:
+            request.add_done_callback(
+                lambda done: self._request_done.emit(callback, done))
+
+        with self._condition:
+            if self._closing:
+                request.set_exception(ESP32Exception(
+                    verb, request.command(), "connection closed"))
+                return request
+            self._pending.append(request)
+            self._condition.notify()
+        return request
+
+    def _call_back(self, callback, request):
+        """
+        Calls a request's callback, on the GUI thread
+        """
+
+        callback(request)
+
+    def _next_window(self):
+        """
+        Waits for commands to be queued and takes up to max_in_flight
+        commands off the queue (or one batch, however long it is).
+
+        returns: the list of requests, empty when closing
+        """
+
+        with self._condition:
+            while not self._pending and not self._closing:
+                self._condition.wait()
+            if self._closing:
+                return []
+            window = [self._pending.popleft()]
+            n_lines = len(window[0].lines)
+            while self._pending and n_lines + len(self._pending[0].lines) <= self.max_in_flight:
+                n_lines += len(self._pending[0].lines)
+                window.append(self._pending.popleft())
+            return window
+
+    def _exchange(self, window):
+        """
+        Sends a window of commands and reads their replies.
+
+        returns: the list of results, or None if a reply timed out or
+        couldn't be parsed
+        """
+
+        self.connection.write(b"".join(line for request in window
+                                       for line in request.lines))
+
+        results = []
+        for request in window:
+            request.outputs = []
+            for line in request.lines:
+                output = self.connection.read_until(self.term)
+                request.outputs.append(output)
+                if not output.endswith(self.term):
+                    print("ERROR: %s timed out: %s" %
+                          (line.decode().strip(), output.decode(errors="replace").strip()))
+                    return None
+            try:
+                results.append(request.parse(request.outputs))
+            except Exception as exc: # pylint: disable=W0703
+                print("ERROR: %s failing: %s %s" %
+                      (request.verb, request.report(), str(exc)))
+                return None
+        return results
+
+    def _resync(self, window):
+        """
+        After a failed window: waits for the line to go quiet and drops
+        whatever is left of the replies, then puts the commands back at the
+        front of the queue, or fails the ones that are out of retries.
+        """
+
+        while self.connection.read_until(self.term):
+            pass
+        self.connection.reset_input_buffer()
+
+        retry = []
+        for request in window:
+            request.retries -= 1
+            if request.retries > 0:
+                retry.append(request)
+            else:
+                request.set_exception(ESP32Exception(
+                    request.verb, request.command(), request.report()))
+
+        with self._condition:
+            self._pending.extendleft(reversed(retry))
+
+    def _io_loop(self):
+        """
+        The I/O thread: sends the queued commands and resolves their
+        futures until the connection is closed.
+        """
+
+        while True:
+            window = self._next_window()
+            if not window:
+                break
+
+            try:
+                results = self._exchange(window)
+            except Exception as exc: # pylint: disable=W0703
+                print("ERROR: serial connection failing: %s" % str(exc))
+                results = None
+
+            if results is None:
+                try:
+                    self._resync(window)
+                except Exception as exc: # pylint: disable=W0703
+                    for request in window:
+                        request.set_exception(ESP32Exception(
+                            request.verb, request.command(), str(exc)))
+                continue
+
+            for request, result in zip(window, results):
+                request.set_result(result)
+
+        with self._condition:
+            for request in self._pending:
+                request.set_exception(ESP32Exception(
+                    request.verb, request.command(), "connection closed"))
+            self._pending.clear()
+
+    def set_async(self, name, value, callback=None):
+        """
+        Queues a set command
+
+        arguments:
+        - name           the parameter name as a string
+        - value          the value to assign to the variable as any type
+                         convertible to string
+        - callback       (optional) called with the request on the GUI
+                         thread when it's done
+
+        returns: the ESP32Request, whose result is an "OK" string in case
+        of success.
+        """
+
+        # I know about Python 3.7 magic string formatting capability
+        # but I don't really remember now the version running on
+        # Raspbian
+        command = 'set ' + name + ' ' + str(value) + '\r\n'
+        return self._submit("set", name, [command],
+                            lambda results: self._parse(results[0]), callback)
+
+    def get_async(self, name, callback=None):
+        """
+        Queues a get command
+
+        arguments:
+        - name           the parameter name as a string
+        - callback       (optional) called with the request on the GUI
+                         thread when it's done
+
+        returns: the ESP32Request, whose result is the requested value
+        """
+
+        command = 'get ' + name + '\r\n'
+        return self._submit("get", name, [command],
+                            lambda results: self._parse(results[0]), callback)
+
+    def get_all_async(self, callback=None):
+        """
+        Queues a get all command
+
+        arguments:
+        - callback       (optional) called with the request on the GUI
+                         thread when it's done
+
+        returns: the ESP32Request, whose result is a dict as for get_all()
+        """
+
+        return self._submit("get", "all", ["get all\r\n"],
+                            lambda results: self._parse_all(results[0]),
+                            callback)
+
+    def _batch(self, commands, callback, by_name=False):
+        """
+        Queues a batch of commands
+
+        arguments:
+        - commands       a list of ("get", name) and ("set", name, value)
+                         tuples
+        - callback       (optional) called with the request on the GUI
+                         thread when it's done
+        - by_name        the result is a dict of the values by name rather
+                         than a list
+
+        returns: the ESP32Request
+        """
+
+        lines = []
+        for command in commands:
+            if command[0] == "set":
+                lines.append('set ' + command[1] + ' ' + str(command[2]) + '\r\n')
+            elif command[0] == "get":
+                lines.append('get ' + command[1] + '\r\n')
+            else:
+                raise ValueError("unknown ESP32 command %s" % str(command))
+
+        names = [command[1] for command in commands]
+        if by_name:
+            parse = lambda results: dict(zip(names, self._parse_batch(commands, results)))
+        else:
+            parse = lambda results: self._parse_batch(commands, results)
+        return self._submit("batch", names, lines, parse, callback)
+
+    def transaction_async(self, commands, callback=None):
+        """
+        Queues a batch of commands, written to the ESP32 in one go. The
+        replies are parsed together: if any of them is missing or bad the
+        whole batch is sent again, and if it keeps failing there is one
+        ESP32Exception reporting the reply to every command.
+
+        arguments:
+        - commands       a list of ("get", name) and ("set", name, value)
+                         tuples
+        - callback       (optional) called with the request on the GUI
+                         thread when it's done
+
+        returns: the ESP32Request, whose result is the list of the replies'
+        values, in the order of the commands
+        """
+
+        return self._batch(list(commands), callback)
+
+    def get_many_async(self, names, callback=None):
+        """
+        Queues the gets of several parameters as one batch
+
+        arguments:
+        - names          the parameter names
+        - callback       (optional) called with the request on the GUI
+                         thread when it's done
+
+        returns: the ESP32Request, whose result is a dict of the values
+        (as strings) by name
+        """
+
+        return self._batch([("get", name) for name in names], callback,
+                           by_name=True)
+
+    def set_many_async(self, values, callback=None):
+        """
+        Queues the sets of several parameters as one batch
+
+        arguments:
+        - values         dict of the values by parameter name
+        - callback       (optional) called with the request on the GUI
+                         thread when it's done
+
+        returns: the ESP32Request, whose result is a dict of the replies
+        ("OK" in case of success) by name
+        """
+
+        return self._batch([("set", name, value) for name, value in values.items()],
+                           callback, by_name=True)
+
+    def transaction(self, commands):
+        """
+        Batch of commands, waiting for the replies. See transaction_async.
+
+        returns: the list of the replies' values
+        """
+
+        return self.transaction_async(commands).result()
+
     def set(self, name, value):
         """
         Set command wrapper
@@ -109,26 +547,7 @@ class ESP32Serial:
         returns: an "OK" string in case of success.
         """
 
-        print("ESP32Serial-DEBUG: set %s %s" % (name, value))
-
-        with self.lock:
-            # I know about Python 3.7 magic string formatting capability
-            # but I don't really remember now the version running on
-            # Raspbian
-            command = 'set ' + name + ' ' + str(value) + '\r\n'
-            self.connection.write(command.encode())
-
-            result = b""
-            retry = 10
-            while retry:
-                retry -= 1
-                try:
-                    result = self.connection.read_until(terminator=self.term)
-                    return self._parse(result)
-                except Exception as exc: # pylint: disable=W0703
-                    print("ERROR: set failing: %s %s" %
-                          (result.decode(), str(exc)))
-            raise ESP32Exception("set", command, result.decode())
+        return self.set_async(name, value).result()
 
     def set_watchdog(self):
         """
@@ -149,23 +568,7 @@ class ESP32Serial:
         returns: the requested value
         """
 
-        print("ESP32Serial-DEBUG: get %s" % name)
-
-        with self.lock:
-            command = 'get ' + name + '\r\n'
-            self.connection.write(command.encode())
-
-            result = b""
-            retry = 10
-            while retry:
-                retry -= 1
-                try:
-                    result = self.connection.read_until(terminator=self.term)
-                    return self._parse(result)
-                except Exception as exc: # pylint: disable=W0703
-                    print("ERROR: get failing: %s %s" %
-                          (result.decode(), str(exc)))
-            raise ESP32Exception("get", command, result.decode())
+        return self.get_async(name).result()
 
     def get_all(self):
         """
@@ -176,28 +579,7 @@ class ESP32Serial:
         strings.
         """
 
-        print("ESP32Serial-DEBUG: get all")
-
-        with self.lock:
-            self.connection.write(b"get all\r\n")
-
-            result = b""
-            retry = 10
-            while retry:
-                retry -= 1
-                try:
-                    result = self.connection.read_until(terminator=self.term)
-                    values = self._parse(result).split(',')
-
-                    if len(values) != len(self.get_all_fields):
-                        raise Exception("get_all answer mismatch: expected: %s, got %s" % (
-                            self.get_all_fields, values))
-
-                    return dict(zip(self.get_all_fields, values))
-                except Exception as exc: # pylint: disable=W0703
-                    print("ERROR: get failing: %s %s" %
-                          (result.decode(), str(exc)))
-            raise ESP32Exception("get", "get all", result.decode())
+        return self.get_all_async().result()
 
     def get_alarms(self):
         """
@@ -5,10 +5,11 @@ ESP32 chip isn't available.
 
 import random
 import time
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5.QtGui import QTextCursor
 from communication.peep import PEEP
-from . import ESP32Alarm, ESP32Warning
+from . import ESP32Alarm, ESP32Warning, ESP32Request
+from utils.uicache import load_ui
 
 
 class FakeMonitored(QtWidgets.QWidget):
@@ -26,7 +27,7 @@ class FakeMonitored(QtWidgets.QWidget):
         - is_random: Boolean to indicate using randomized data.
         """
         super(FakeMonitored, self).__init__()
-        uic.loadUi('communication/input_monitor_widget.ui', self)
+        load_ui('communication/input_monitor_widget.ui', self)
 
         self.generator = generator
 
@@ -65,7 +66,7 @@ class FakeESP32Serial(QtWidgets.QMainWindow):
     def __init__(self, config):
         super(FakeESP32Serial, self).__init__()
 
-        uic.loadUi('communication/fakeesp32.ui', self)
+        load_ui('communication/fakeesp32.ui', self)
         self.get_all_fields = config["get_all_fields"]
         self.observables = {name: None for name in self.get_all_fields}
 
@@ -310,6 +311,106 @@ class FakeESP32Serial(QtWidgets.QMainWindow):
 
         return dict(zip(self.get_all_fields, values))
 
+    def _done(self, verb, name, function, callback):
+        """
+        Makes an already resolved ESP32Request, like the ones the real
+        ESP32Serial returns from the *_async methods.
+
+        arguments:
+        - verb           the transmit verb = {get, set}
+        - name           the parameter name
+        - function       called to get the result
+        - callback       (optional) called with the request when it's done
+
+        returns: the ESP32Request
+        """
+
+        request = ESP32Request(verb, name, [], None, 0)
+        try:
+            request.set_result(function())
+        except Exception as exc: # pylint: disable=W0703
+            request.set_exception(exc)
+        if callback is not None:
+            callback(request)
+        return request
+
+    def set_async(self, name, value, callback=None):
+        """
+        Set command, returning a Future as ESP32Serial.set_async does.
+        """
+
+        return self._done("set", name, lambda: self.set(name, value), callback)
+
+    def get_async(self, name, callback=None):
+        """
+        Get command, returning a Future as ESP32Serial.get_async does.
+        """
+
+        return self._done("get", name, lambda: self.get(name), callback)
+
+    def get_all_async(self, callback=None):
+        """
+        Get all command, returning a Future as ESP32Serial.get_all_async does.
+        """
+
+        return self._done("get", "all", self.get_all, callback)
+
+    def _run_batch(self, commands):
+        """
+        Runs a batch of commands, all at once.
+
+        arguments:
+        - commands       a list of ("get", name) and ("set", name, value)
+                         tuples
+
+        returns: the list of the replies
+        """
+
+        results = []
+        for command in commands:
+            if command[0] == "set":
+                results.append(self.set(command[1], command[2]))
+            elif command[0] == "get":
+                results.append(self.get(command[1]))
+            else:
+                raise ValueError("unknown ESP32 command %s" % str(command))
+        return results
+
+    def transaction_async(self, commands, callback=None):
+        """
+        Batch of commands, returning a Future as ESP32Serial.transaction_async does.
+        """
+
+        commands = list(commands)
+        return self._done("batch", [command[1] for command in commands],
+                          lambda: self._run_batch(commands), callback)
+
+    def get_many_async(self, names, callback=None):
+        """
+        Batch of gets, returning a Future as ESP32Serial.get_many_async does.
+        """
+
+        names = list(names)
+        return self._done("batch", names, lambda: dict(zip(
+            names, self._run_batch([("get", name) for name in names]))), callback)
+
+    def set_many_async(self, values, callback=None):
+        """
+        Batch of sets, returning a Future as ESP32Serial.set_many_async does.
+        """
+
+        names = list(values)
+        return self._done("batch", names, lambda: dict(zip(
+            names, self._run_batch([("set", name, value) for name, value in values.items()]))),
+                          callback)
+
+    def transaction(self, commands):
+        """
+        Batch of commands, waiting for the replies as ESP32Serial.transaction does.
+        """
+
+        return self._run_batch(list(commands))
+
     def get_alarms(self):
         """
         Get the alarms from the ESP32
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+breath_index.py
+
+Index of the last breaths: one record per breath with where it starts and
+ends in the fast data (as sample counts, see RingBuffer.count), when, and
+the breath parameters once the slow loop has calculated them.
+
+The records are kept in a RingBuffer with a structured dtype, so the index
+has a fixed size, adding a breath is O(1), and the last N breaths or the
+breaths in a time range are a slice of it rather than a new search of the
+waveforms. The waveform of a breath that is still in the fast data vectors
+is a view of them, see samples().
+
+The fast pipeline appends the records, the slow pipeline works out the
+parameters. Only the fast pipeline's thread writes to the records: the slow
+pipeline hands the parameters over with set_params(), which queues them,
+and the fast pipeline fills them in with apply_params() each time it runs.
+Records are addressed by breath number (0 for the first breath since the
+index was made), which doesn't change as later breaths are added.
+
+"""
+
+from collections import deque
+
+import numpy as np
+
+from utils.ringbuffer import RingBuffer
+
+
+# breath parameters recorded for each breath (attributes of breath_par)
+PARAMS = ('pip', 'peep', 'pp', 'vt', 'mve_inf', 'rr', 'ie', 'c')
+
+# i_* are the sample counts of the start of inspiration, end of inspiration
+# and end of expiration (the start of the next breath), t_* their times
+FIELDS = [('number', np.int64),
+          ('i_start', np.int64), ('i_insp_end', np.int64), ('i_end', np.int64),
+          ('t_start', float), ('t_insp_end', float), ('t_end', float)] + [(name, float) for name in PARAMS]
+
+
+class breath_index(object):
+    """
+    Constituents:
+        records =   RingBuffer of the records of the last `size` breaths, oldest first
+        count   =   number of breaths added (the number of the next breath)
+        pending =   (number, parameters) handed over by set_params() and not yet filled in
+    """
+
+    def __init__(self, size = 1024):
+        self.records = RingBuffer(size, dtype = FIELDS)
+        self.pending = deque()
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def count(self):
+        return self.records.count
+
+    def add(self, breathdata):
+        """
+        Adds a record for a breath that has just ended and returns its
+        number. The parameters are nan until set_params() is called.
+        """
+        number = self.records.count
+        self.records.append((number,
+                             breathdata.isi, breathdata.iei, breathdata.iee,
+                             breathdata.tsi, breathdata.tei, breathdata.tee) + (np.nan,)*len(PARAMS))
+        return number
+
+    def get(self, number):
+        # the record of breath number, or None if it's no longer (or not yet) held
+        records = self.records.view()
+        i = number - (self.records.count - len(records))
+        if i < 0 or i >= len(records):
+            return None
+        return records[i]
+
+    def set_params(self, number, breathpar):
+        """
+        Hands over the parameters of breath number from a breath_par, to be
+        filled in by the next apply_params(). This can be called from
+        another thread than the one adding the breaths.
+        """
+        values = tuple(np.nan if getattr(breathpar, name) is None else getattr(breathpar, name) for name in PARAMS)
+        self.pending.append((number, values))
+
+    def apply_params(self):
+        """
+        Fills in the parameters handed over with set_params(), from the
+        thread that adds the breaths. Returns the number of breaths filled
+        in; the ones that are no longer held are dropped.
+        """
+        n_set = 0
+        while len(self.pending) > 0:
+            number, values = self.pending.popleft()
+            record = self.get(number)
+            if record is None:
+                continue
+            # the record is a view into both copies of the ring, so set it through the buffer
+            record = record.copy()
+            for name, value in zip(PARAMS, values):
+                record[name] = value
+            if self.records.set_at(number, record):
+                n_set += 1
+        return n_set
+
+    def last(self, n = 1):
+        # the records of the last n breaths, oldest first. This is a view, not a copy!
+        records = self.records.view()
+        return records[max(len(records) - n, 0):]
+
+    def between(self, t_start, t_end):
+        # the records of the breaths that started from t_start up to t_end. This is a view, not a copy!
+        records = self.records.view()
+        t = records['t_start']
+        return records[np.searchsorted(t, t_start, side = 'left'):np.searchsorted(t, t_end, side = 'right')]
+
+    def samples(self, record, buffer):
+        """
+        View of the samples of one breath in a fast data RingBuffer (eg.
+        fastdata.buffers['p1']), from the start of inspiration up to the
+        end of expiration, or None if they're no longer all held.
+        """
+        if record['i_start'] < 0:
+            return None
+        data = buffer.view()
+        offset = buffer.count - len(data)
+        start = record['i_start'] - offset
+        stop = record['i_end'] - offset
+        if start < 0 or stop > len(data):
+            return None
+        return data[start:stop]
+
+    def clear(self):
+        self.records.clear()
+        self.pending.clear()
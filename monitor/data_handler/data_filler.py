@@ -9,12 +9,16 @@ All credit to the MVM group
 Source: https://github.com/MechanicalVentilatorMilano/gui
 
 '''
-from copy import copy
 from ast import literal_eval  # to convert a string to list
 import numpy as np
-from PyQt5 import QtGui, QtCore
+from PyQt5 import QtGui, QtCore, QtWidgets
 import pyqtgraph as pg
 
+from utils.ringbuffer import RingBuffer
+from utils.estimators import WindowedMinMax
+from utils.decimator import MinMaxDecimator
+from utils import configcache
+
 
 class DataFiller():
     #pylint: disable=too-many-instance-attributes
@@ -31,15 +35,21 @@ class DataFiller():
     Attributes:
         _qtgraphs           (dict) All PlotItems
         _plots              (dict) All PlotDataItems
-        _data               (dict) The data for all plots
-        _historic_data      (dict) The historic data for all plots
+        _data               (dict) The data for all plots (RingBuffers when scrolling)
+        _decimators         (dict) The min/max decimated data drawn for long plots (MinMaxDecimators)
+        _historic_range     (dict) Running min/max of the historic data for all plots (WindowedMinMax)
         _default_yrange     (dict) The default y ranges per plot
         _yrange             (dict) The current y ranges per plot
+        _xrange             (dict) The x ranges last set per plot
         _monitors           (dict) The monitors to which to send data
         _colors             (dict) The plot color
+        _pens               (dict) The pens the plots are drawn with
         _config             (dict) The config dict
+        _cfg                (ConfigNode) The compiled config, read as attributes
         _n_samples          (int) The number of samples to plot
         _n_historic_samples (int) The number of samples to keep for historic data
+        _n_columns          (int) The number of min/max columns to draw, if fewer than the samples
+        _decimation         (int) The factor the number of columns is divided by
         _sampling           (float) The time interval between samples
         _time_window        (float) The number of seconds shown
         _xdata              (array) The data along x
@@ -51,32 +61,41 @@ class DataFiller():
         _looping_restart    (bool) True if the loop is starting from the beginning again
     '''
 
-    def __init__(self, config):
+    def __init__(self, config, cfg = None):
         '''
         Constructor
 
         arguments:
         - config: the config dictionary
+        - cfg: the compiled config (see utils/configcache.py), compiled from config if not given
         '''
         self._qtgraphs = {}
         self._plots = {}
         self._data = {}
-        self._historic_data = {}
+        self._decimators = {}
+        self._historic_range = {}
         self._default_yrange = {}
         self._yrange = {}
+        self._xrange = {}
         self._monitors = {}
         self._colors = {}
+        self._pens = {}
         self._config = config
-        self._display_time = self._config['display_time']
-        self._sampling = self._config['plot_interval']
-        self._n_samples = self._config['nsamples'] #int(self._display_time*1000/self._sampling )
+        if cfg is None:
+            cfg = configcache.compile_config(config)
+        self._cfg = cfg
+        self._display_time = self._cfg.display_time
+        self._sampling = self._cfg.plot_interval
+        self._n_samples = self._cfg.nsamples #int(self._display_time*1000/self._sampling )
         self._n_historic_samples = 2*self._n_samples
+        self._n_columns = self._cfg.get('plot_columns', self._n_samples)
+        self._decimation = 1
 
         self._time_window = self._n_samples * self._sampling/1000  # seconds
         self._xdata = np.linspace(0,self._time_window,  self._n_samples)
         self._frozen = False
         self._first_plot = None
-        self._looping = self._config['use_looping_plots']
+        self._looping = self._cfg.use_looping_plots
         self._looping_data_idx = {}
         self._looping_lines = {}
         self._x_label = None
@@ -87,8 +106,26 @@ class DataFiller():
         self._sampling = sample_interval #ms
         self._time_window = self._n_samples * self._sampling/1000  # seconds
         self._xdata = np.linspace(0,self._time_window,  self._n_samples)
+        for decimator in self._decimators.values():
+            decimator.set_x(self._xdata)
+
+    def _make_decimator(self, name):
+        '''
+        Sets up the min/max decimation of a plot, if drawing it as columns
+        means drawing fewer points than there are samples.
+
+        arguments:
+        - name: the plot name
+        '''
+        n_columns = max(self._n_columns//self._decimation, 1)
+        if 2*n_columns >= self._n_samples:
+            self._decimators.pop(name, None)
+            return
+        decimator = MinMaxDecimator(self._n_samples, n_columns, looping=self._looping)
+        decimator.set_x(self._xdata)
+        decimator.rebuild(self._get_data(name), self._looping_data_idx.get(name, 0))
+        self._decimators[name] = decimator
 
-    
     def connect_plot(self, plotname, plot):
         '''
         Connects a plot to this class by
@@ -98,8 +135,8 @@ class DataFiller():
         - plotname: the name of the plot
         - plot: the PlotItem from the ui file
         '''
-        plot_config = self._config['plots'][plotname]
-        name = plot_config['observable']
+        plot_config = self._cfg.plots[plotname]
+        name = plot_config.observable
 
         # Link X axes if we've already seen a plot
         if self._first_plot:
@@ -107,37 +144,45 @@ class DataFiller():
         else:
             self._first_plot = plot
 
+        # the pen is made once here, not on every update
+        self._colors[name] = plot_config.color
+        self._pens[name] = pg.mkPen(self.parse_color(self._colors[name]), width=self._cfg.line_width)
+
         self._qtgraphs[name] = plot
-        self._plots[name] = plot.plot()
-        self._data[name] = np.linspace(0, 0, self._n_samples)
-        self._historic_data[name] = np.linspace(0, 0, self._n_historic_samples)
+        self._plots[name] = plot.plot(pen=self._pens[name])
+        self._data[name] = self._new_data_vector()
+
+        # the historic data starts out as zeros, like the plot data
+        self._historic_range[name] = WindowedMinMax(self._n_historic_samples)
+        self._historic_range[name].extend(np.zeros(self._n_historic_samples))
         self._yrange[name] = None
-        self._plots[name].setData(copy(self._xdata), copy(self._data[name]))
-        self._colors[name] = plot_config['color']
+        self._xrange[name] = None
         self._looping_data_idx[name] = 0
+        self._make_decimator(name)
+        self._draw(name, self._xdata)
 
         # Set the Y axis
-        y_axis_label = plot_config['name']
+        y_axis_label = plot_config.name
         y_axis_label += ' '
-        y_axis_label += plot_config['units']
+        y_axis_label += plot_config.units
         plot.setLabel(axis='left', text=y_axis_label)
 
         # Set the X axis
-        if self._config['show_x_axis_labels'] and 'bot' in plotname:# and not self._looping:
+        if self._cfg.show_x_axis_labels and 'bot' in plotname:# and not self._looping:
             self.add_x_axis_label(plot)
             
         # Remove x ticks, if selected
-        if not self._config['show_x_axis_ticks']:
-        #if self._looping or not self._config['show_x_axis_ticks']:
+        if not self._cfg.show_x_axis_ticks:
+        #if self._looping or not self._cfg.show_x_axis_ticks:
             plot.getAxis('bottom').setTicks([])
             plot.getAxis('bottom').setStyle(tickTextOffset=0, tickTextHeight=0)
 
         # Customize the axis color
-        color = self.parse_color(self._config['axis_line_color'])
+        color = self.parse_color(self._cfg.axis_line_color)
         plot.getAxis('bottom').setPen(
-            pg.mkPen(color, width=self._config['axis_line_width']))
+            pg.mkPen(color, width=self._cfg.axis_line_width))
         plot.getAxis('left').setPen(
-            pg.mkPen(color, width=self._config['axis_line_width']))
+            pg.mkPen(color, width=self._cfg.axis_line_width))
 
         if self._looping:
             self.add_looping_lines(name, plot)
@@ -146,8 +191,8 @@ class DataFiller():
         self.set_default_x_range(name)
 
         # Fix the y axis range
-        value_min = plot_config['min']
-        value_max = plot_config['max']
+        value_min = plot_config.min
+        value_max = plot_config.max
         ymin = value_min - (value_max - value_min) * 0.1
         ymax = value_max + (value_max - value_min) * 0.1
         self._default_yrange[name] = [ymin, ymax]
@@ -158,7 +203,7 @@ class DataFiller():
         plot.setMenuEnabled(False)
 
         print('NORMAL: Connected plot',
-              plot_config['name'], 'with variable', name)
+              plot_config.name, 'with variable', name)
 
     def set_default_y_range(self, name):
         '''
@@ -182,7 +227,7 @@ class DataFiller():
         # Also set the width (space) on the left of the Y axis (for the label
         # and ticks)
         self._qtgraphs[name].getAxis('left').setWidth(
-            self._config['left_ax_label_space'])
+            self._cfg.left_ax_label_space)
 
     def set_y_range(self, name):
         '''
@@ -192,13 +237,14 @@ class DataFiller():
         arguments:
         - name: the plot name to set the y range
         '''
-        if name not in self._historic_data or name not in self._qtgraphs:
+        if name not in self._historic_range or name not in self._qtgraphs:
             raise Exception('Cannot set y range for graph',
                             name, 'as it doesn\'t exist.')
 
-        # Calculate the max and min using the larger historical data sample
-        ymax = np.max(self._historic_data[name])
-        ymin = np.min(self._historic_data[name])
+        # The max and min of the larger historical data sample are kept
+        # up to date as the points come in
+        ymax = self._historic_range[name].max
+        ymin = self._historic_range[name].min
 
         if ymax == ymin:
             return
@@ -207,6 +253,10 @@ class DataFiller():
         ymax += span * 0.1
         ymin -= span * 0.1
 
+        # Only touch the axis if the range has changed
+        if self._yrange[name] == (ymin, ymax):
+            return
+
         # Save the range for future use
         self._yrange[name] = (ymin, ymax)
 
@@ -255,8 +305,8 @@ class DataFiller():
             # cropped on the top
             yrange -= yrange * 0.2
 
-            major_step = yrange / (self._config['n_major_ticks'] - 1)
-            minor_step = major_step / (self._config['n_minor_ticks'] - 1)
+            major_step = yrange / (self._cfg.n_major_ticks - 1)
+            minor_step = major_step / (self._cfg.n_minor_ticks - 1)
 
             if major_step == 0 or minor_step == 0:
                 ax.setTickSpacing()
@@ -271,7 +321,20 @@ class DataFiller():
         arguments:
         - name: the plot name to set the x range
         '''
-        self._qtgraphs[name].setXRange(0,self._time_window)
+        self._xrange[name] = (0, self._time_window)
+        self._qtgraphs[name].setXRange(*self._xrange[name])
+
+    def _update_x_range(self, name, xrange):
+        '''
+        Sets the X axis range of the plot, if it's not already set to that.
+
+        arguments:
+        - name: the plot name to set the x range
+        - xrange: (min, max)
+        '''
+        if self._xrange[name] != xrange:
+            self._xrange[name] = xrange
+            self._qtgraphs[name].setXRange(*xrange)
 
     def add_x_axis_label(self, plot):
         #pylint: disable=invalid-name
@@ -284,11 +347,11 @@ class DataFiller():
         arguments:
         - plot: the PlotDataItem to add the label
         '''
-        self._x_label = QtGui.QGraphicsTextItem()
+        self._x_label = QtWidgets.QGraphicsTextItem()
         self._x_label.setVisible(True)
         self._x_label.setHtml(
             '<p style="color: %s">Time [s]:</p>' %
-            self._config["axis_line_color"])
+            self._cfg.axis_line_color)
 
         # Find the position of the label
         br = self._x_label.boundingRect()
@@ -333,12 +396,12 @@ class DataFiller():
         name = monitor.observable
         self._monitors[name] = monitor
 
-        self._data[name] = np.linspace(0, 0, self._n_samples)
+        self._data[name] = self._new_data_vector()
 
         self._looping_data_idx[name] = 0
 
         if name not in self._data:
-            self._data[name] = np.linspace(0, 0, self._n_samples)
+            self._data[name] = self._new_data_vector()
 
         print('NORMAL: Connected monitor',
               monitor.configname, 'with variable', name)
@@ -355,10 +418,13 @@ class DataFiller():
 
         #print('NORMAL: Received data for monitor', name)
 
-        if name in self._historic_data:
-            # Save to the historic data dict
-            self._historic_data[name][:-1] = self._historic_data[name][1:]
-            self._historic_data[name][-1] = data_point
+        if name in self._historic_range:
+            # Add to the running min/max of the historic data
+            self._historic_range[name].push(data_point)
+
+        if name in self._decimators:
+            # Update the min/max of the column the point falls in
+            self._decimators[name].push(data_point)
 
         if name in self._data:
             if self._looping:
@@ -372,11 +438,9 @@ class DataFiller():
                     self._looping_restart = True
                     
             else:
-                # Scrolling plots - shift data 1 sample left
-                self._data[name][:-1] = self._data[name][1:]
-
-                # add the last data point
-                self._data[name][-1] = data_point
+                # Scrolling plots - add the last data point, the oldest
+                # one drops off the start of the ring buffer
+                self._data[name].append(data_point)
                 
     def update_all_plots(self):
         
@@ -404,29 +468,58 @@ class DataFiller():
             xdata = self._xdata
             is_xy = False
         else:
-            xdata = self._data[xdata_name]
+            xdata = self._get_data(xdata_name)
             is_xy = True
         
         if not self._frozen:
             # Update the displayed plot with current data.
             # In frozen mode, we don't update the display.
-            color = self._colors[name]
-            color = color.replace('rgb', '')
-            color = literal_eval(color)
-            self._plots[name].setData(
-                copy(xdata),
-                copy(self._data[name]),
-                pen=pg.mkPen(color, width=self._config['line_width']))
+            # The arrays are handed over as they are, without copies: the
+            # plot redraws from them on every setData, and the pen was set
+            # when the plot was connected.
+            if is_xy:
+                self._plots[name].setData(xdata, self._get_data(name))
+            else:
+                self._draw(name, xdata)
             if is_xy:
-                self._qtgraphs[name].setXRange(*self._yrange[xdata_name])
+                self._update_x_range(name, self._yrange[xdata_name])
             else:
-                self.set_default_x_range(name)
+                self._update_x_range(name, (0, self._time_window))
             self.set_y_range(name)
 
             if self._looping:
                 x_val = xdata[self._looping_data_idx[name]] #- self._sampling 0.1
                 self._looping_lines[name].setValue(x_val)
 
+    def _draw(self, name, xdata):
+        '''
+        Hands the data of a plot to pyqtgraph: the min/max columns
+        if the plot is decimated, otherwise every point.
+
+        arguments:
+        - name: the plot name
+        - xdata: the x values of the full data vector
+        '''
+        if name in self._decimators:
+            decimator = self._decimators[name]
+            self._plots[name].setData(decimator.x, decimator.view())
+        else:
+            self._plots[name].setData(xdata, self._get_data(name))
+
+    def set_decimation(self, factor):
+        '''
+        Draws the plots with factor times fewer min/max columns, so the
+        peaks aren't lost. 1 draws the number of columns in the config.
+
+        arguments:
+        - factor: (int) the decimation factor
+        '''
+        if factor == self._decimation:
+            return
+        self._decimation = factor
+        for name in self._plots:
+            self._make_decimator(name)
+
     def freeze(self):
         '''
         Enter "frozen" mode, where plots are not updated, and mouse/zoom
@@ -434,6 +527,12 @@ class DataFiller():
         '''
         self._frozen = True
 
+        # draw every point, so there's detail to zoom in on. The plots
+        # keep the arrays they're given, and the data keeps coming in
+        # while frozen, so they get copies that stay as they are
+        for name in self._plots:
+            self._plots[name].setData(self._xdata.copy(), np.array(self._get_data(name)))
+
         for plot in self._qtgraphs.values():
             plot.setMouseEnabled(x=True, y=True)
 
@@ -474,10 +573,33 @@ class DataFiller():
         if name in self._monitors:
             last_data_idx = self._looping_data_idx[name] - \
                 1 if self._looping else -1
-            self._monitors[name].update_value(self._data[name][last_data_idx])
+            self._monitors[name].update_value(self._get_data(name)[last_data_idx])
         else:
             return
 
+    def _new_data_vector(self):
+        '''
+        Makes the vector that holds the data for one plot or monitor,
+        starting out full of zeros.
+        Looping plots overwrite the data in place, scrolling
+        plots append to a ring buffer.
+        '''
+        if self._looping:
+            return np.linspace(0, 0, self._n_samples)
+        return RingBuffer(self._n_samples, fill=0.0)
+
+    def _get_data(self, name):
+        '''
+        Returns the data for plot or monitor 'name' as an array,
+        ordered with the oldest point first.
+
+        arguments:
+        - name: the name of the plot or monitor
+        '''
+        if self._looping:
+            return self._data[name]
+        return self._data[name].view()
+
     def parse_color(self, rgb_string):
         #pylint: disable=no-self-use
         '''
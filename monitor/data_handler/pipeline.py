@@ -0,0 +1,1133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pipeline.py
+
+The signal processing behind the fast and slow loops, without any Qt.
+
+fast_pipeline takes in sensor samples (one at a time or in blocks) and does
+the breath detection and volume integration, slow_pipeline calculates the
+breath parameters and the slowly updated values from what the fast pipeline
+produces. fast_loop and slow_loop in data_handler.py are the QThreads that
+run these on timers and hand the results to the GUI through signals, but
+everything here is plain python/numpy so it can also be run directly, eg.
+on a recorded sensor log (see replay.py).
+
+"""
+
+import time
+import numpy as np
+from datetime import datetime
+
+from utils import utils
+from utils.ringbuffer import RingBuffer, ring_field
+from utils.estimators import WindowedMean, WindowedSlope, WindowedMinMax
+from utils.snapshot import VersionedSnapshot
+from utils.extrema import ExtremaDetector, NEW_MINIMUM
+from data_handler.breath_index import breath_index
+
+
+# values the fast pipeline publishes for the slow pipeline after each update
+SNAPSHOT_FIELDS = ('count', 'n', 't_first', 't_last', 'fs', 'inflow_sum', 'outflow_sum')
+
+
+# blocks of up to this many samples go through process_sample one at a time: the
+# array setup of process_block costs more than the per-sample loop saves on them
+SMALL_BLOCK = 8
+
+
+# fields in the sample blocks handed to the GUI: (fast data vector, scale to the plotted units)
+BLOCK_FIELDS = {'pressure' : ('p1', 1.0), 'flow' : ('flow', 1.0), 'volume' : ('vol', 1000.0)}
+
+
+def fast_snapshot(fastdata):
+    # the summary of the fast data vectors that the slow loop works from
+    t = fastdata.buffers['t']
+    return {'count' : t.count, 'n' : len(t), 't_first' : t.first(), 't_last' : t.last(),
+            'fs' : fastdata.fs, 'inflow_sum' : fastdata.inflow.sum, 'outflow_sum' : fastdata.outflow.sum}
+
+
+"""
+# Define the fast and slow data objects that will be passed to the GUI thread
+"""
+class fast_data(object):
+    # the data vectors live in fixed size ring buffers which are appended to
+    # in place, the attributes below are ordered views into those buffers
+    p1 = ring_field('p1')
+    p2 = ring_field('p2')
+    dp = ring_field('dp')
+    flow = ring_field('flow')
+    flow_raw = ring_field('flow_raw')
+    dflow = ring_field('dflow')
+    insp = ring_field('insp')
+    vol_raw = ring_field('vol_raw')
+    vol_drift = ring_field('vol_drift')
+    vol = ring_field('vol')
+    t = ring_field('t')
+
+    def __init__(self, n_samples = 0, headroom = 0):
+
+        self.buffers = dict()
+
+        # pressures
+        self.buffers['p1'] = RingBuffer(n_samples, headroom = headroom)
+        self.buffers['p2'] = RingBuffer(n_samples, headroom = headroom)
+        self.buffers['dp'] = RingBuffer(n_samples, headroom = headroom)
+
+        # flow
+        self.buffers['flow'] = RingBuffer(n_samples, headroom = headroom)
+        self.buffers['flow_raw'] = RingBuffer(n_samples, headroom = headroom)
+        self.buffers['dflow'] = RingBuffer(n_samples, headroom = headroom)
+        self.buffers['insp'] = RingBuffer(n_samples, dtype = bool, headroom = headroom)
+
+        # volume
+        self.buffers['vol_raw'] = RingBuffer(n_samples, headroom = headroom)
+        self.buffers['vol_drift'] = RingBuffer(n_samples, headroom = headroom) # the drift volume which is the spline line through the detrended volume
+        self.buffers['vol'] = RingBuffer(n_samples, headroom = headroom)
+
+        # time
+        self.buffers['t'] = RingBuffer(n_samples, headroom = headroom)     # ctime in seconds
+        self.fs = []
+
+        # running sums of the inspired and expired flow over the vectors
+        self.inflow = WindowedMean(n_samples)
+        self.outflow = WindowedMean(n_samples)
+
+        # all_fields (this is how the data filler wants data)
+        self.all_fields = dict()
+
+    @property
+    def t_obj(self):
+        # datetime objects of the samples. only made when someone asks for them
+        return [datetime.fromtimestamp(t) for t in self.t]
+
+    @property
+    def dt(self):
+        # dt since first sample in vector. only calculated when someone asks for it
+        t = self.t
+        if len(t) == 0:
+            return t
+        return t - t[0]
+
+class breath_data(object):
+    # vectors that just hold the last full breath of data
+    p = ring_field('p')
+    flow = ring_field('flow')
+    vol = ring_field('vol')
+    dt = ring_field('dt')
+
+    def __init__(self, n_samples = 0):
+        self.buffers = dict()
+        self.buffers['p'] = RingBuffer(n_samples)
+        self.buffers['flow'] = RingBuffer(n_samples)
+        self.buffers['vol'] = RingBuffer(n_samples)
+        self.buffers['dt'] = RingBuffer(n_samples)
+
+        # running min/max of the pressure and volume over the breath
+        self.p_range = WindowedMinMax(n_samples)
+        self.vol_range = WindowedMinMax(n_samples)
+        self.reset()
+    
+    def reset(self):
+        for buffer in self.buffers.values():
+            buffer.clear()
+        self.p_range.clear()
+        self.vol_range.clear()
+        self.tsi = float() # time of start of inspriation
+        self.tei = float() # time of end of inspriation
+        self.tee = float() # time of end of expriration
+
+        # the same as sample counts of the fast data (-1 if not seen yet), and
+        # the breath's number in the breath index once it's been added
+        self.isi = -1
+        self.iei = -1
+        self.iee = -1
+        self.number = -1
+
+
+
+
+class slow_data(object):
+    def __init__(self):
+
+
+        self.t_last = datetime.utcnow().timestamp()
+        self.dt_last = 0.0
+        
+        # pi GPIO state
+        self.lowbatt = None
+        self.charging = None
+
+    def print_data(self):
+        print('Parameters Checked Regularly by Slow Loop:')
+        print(f'Time Since Last Detected Breath (s) = {self.dt_last}')
+        print('Device Parameters:')
+        print(f'Plugged In = {self.charging}')
+        print(f'Low Battery = {self.lowbatt}')
+
+class breath_par(object):
+    # holds breath parameters as calculated from breath data
+    
+    def __init__(self):
+        ## THINGS THAT HOLD SINGLE VALUES ##
+        # respiratory parameters from last breath
+        self.pip = None
+        self.peep = None
+        self.pp = None
+        self.vt = None
+        self.mve_inf = None
+        self.mve_meas = None
+        self.rr = None
+        self.ie = None
+        self.c = None
+        
+    def print_data(self):
+        print('Respiratory Parameters:')
+        print(f'PIP = {self.pip}')
+        print(f'PEEP = {self.peep}')
+        print(f'PP = {self.pp}')
+        print(f'VT = {self.vt}')
+        print(f'MVE Inferred = {self.mve_inf}')
+        print(f'MVE Measured = {self.mve_meas}')
+        print(f'RR = {self.rr}')
+        print(f'I:E = {self.ie}')
+        print(f'C = {self.c}')
+        print()
+
+
+class sample_block(object):
+    """
+    The samples added to the fast data since the last block was taken, in
+    the units that are plotted.
+
+    Constituents:
+        count   =   sample count at the end of the block
+        n       =   number of samples in the block
+        dropped =   samples that were overwritten before they were taken
+        t       =   sample times (s)
+        fields  =   dict of arrays, see BLOCK_FIELDS
+    """
+
+    def __init__(self, count = 0, t = None, fields = None, dropped = 0):
+        self.count = count
+        self.t = np.zeros(0) if t is None else t
+        self.n = len(self.t)
+        self.fields = dict() if fields is None else fields
+        self.dropped = dropped
+
+
+"""
+# Define the fast and slow pipelines
+"""
+class fast_pipeline(object):
+
+    """
+    Turns the sensor samples into the realtime data vectors (fastdata) and
+    the data of each breath (breathdata).
+
+    When a breath event is detected the matching callback is called if it's
+    been set:
+        on_new_inhale()             at the start of each inhale
+        on_new_breath(breathdata)   with the data of the breath that just ended
+    """
+
+    def __init__(self, config, ts_sample = None, correct_vol = False, verbose = False):
+
+        # run in verbose mode?
+        self.verbose = verbose
+
+        self.config = config
+
+        # time to display is the approx time to show on the screen in seconds
+        self.time_to_display = self.config['display_time'] #s
+
+        # time between loop updates
+        self.ts = self.config['fastdata_interval'] #ms
+
+        # time between samples
+        if ts_sample is None:
+            ts_sample = self.ts
+        self.ts_sample = ts_sample #ms
+
+        # real sample rate
+        self.ts_real = []
+
+        # length of vectors
+        self.num_samples_to_hold = int(self.time_to_display*1000/self.ts_sample )
+        if self.verbose:
+            print(f"fastloop: num samples to hold = {self.num_samples_to_hold}")
+
+        # Define the instance of the object that will hold all the data
+        # the vectors are preallocated to hold num_samples_to_hold points, plus
+        # a slow loop interval of headroom so the views of a published snapshot
+        # stay intact while the slow loop works on them
+        self.snapshot_headroom = int(np.ceil(self.config['slowdata_interval']/self.ts_sample))
+        self.fastdata = fast_data(self.num_samples_to_hold, headroom = self.snapshot_headroom)
+
+        # versioned snapshot of the fast data, published after every update for the slow loop
+        self.snapshot = VersionedSnapshot(SNAPSHOT_FIELDS)
+
+        # the breath data is double buffered: the last full breath is handed off
+        # to main/slowloop while the current breath is filled in the other one
+        self.breathdata_buffers = [breath_data(self.num_samples_to_hold), breath_data(self.num_samples_to_hold)]
+        self.breathdata = self.breathdata_buffers[0]
+
+        # sample frequency - starts out as 1/self.ts but then is updated to the real fs
+        self.fastdata.fs = 1.0/self.ts
+
+        # should we try to do a realtime spline correction to the volume?
+            # this makes the plots better but stresses the pi to do these calculations fast.
+            # practical limit for this seems to be with loop clock at 25 ms
+        self.correct_vol = correct_vol
+
+        # the volume minima the correction pins to zero, found as the samples come in
+        # (the same limits breath_detect_coarse used: at least 0.05 L deep, 0.3 s wide and 1.5 s apart)
+        self.vol_minima = ExtremaDetector(prominence = 0.05, distance = 1.5, max_minimum = -0.05, width = 0.3)
+
+        #define if we're inspiring or expiring
+        self.insp = False
+        self.exp = False
+
+        self.vol_integral_to_now = 0.0
+        self.vol_offset = 0.0#self.sensor.dp2flow(self.sensor.dp)/(self.fastdata.fs*60.0)
+        print('##### INITIAL VOLUME OFFSET = ',self.vol_offset)
+        self.flow_drift_poly = None
+        self.vol_drift_poly = None
+        self.vol_concavity = None
+        self.time_last_breath = 0
+        self.time_last_exhale = 0
+
+        # number of samples used to calculate the flow slope
+        self.dflow_window = 50
+
+        # streaming estimates of the flow slope and the real time between samples
+        self.dflow_estimator = WindowedSlope(self.dflow_window, min_count = self.dflow_window + 1)
+        self.ts_estimator = WindowedSlope(self.num_samples_to_hold, min_count = 2, default = np.nan)
+
+        # where to log the raw sensor data, if anywhere (a rawlog.raw_log_writer)
+        self.sensor_datafile = None
+
+        # breath event callbacks
+        self.on_new_inhale = None
+        self.on_new_breath = None
+
+        # sample count up to which the samples have been taken with take_block
+        self.count_taken = 0
+
+        # index of the last breaths, a record is added as each one ends
+        self.breaths = breath_index(self.config.get('breath_index_size', 1024))
+
+    def update_vol_offset(self):
+        self.vol_offset = np.min(self.fastdata.vol)
+        print('\n\n######## NEW VOLUME OFFSET = ',self.vol_offset,'\n\n')
+        self.recalculate_vol()
+        
+    def update_flow_trend(self):
+        flow_threshold = 5.0
+        self.flow_drift_poly = np.polyfit(self.fastdata.t[np.abs(self.fastdata.flow_raw) < flow_threshold], self.fastdata.flow_raw[np.abs(self.fastdata.flow_raw) < flow_threshold],1)
+        print(f'\nfastloop: Updated flow trend equation: F = {self.flow_drift_poly[0]}*t + {self.flow_drift_poly[1]} \n')
+    
+    def update_vol_trend(self):
+        max_slope = 0.01
+        
+        # fit a line through the volume
+        # we will remove this line and then add the offset (the minimum of the volume)
+        self.vol_drift_poly = np.polyfit(self.fastdata.t, self.fastdata.vol_raw,1)
+        if self.vol_drift_poly[1] > max_slope:
+            self.vol_drift_poly[1] = max_slope
+        elif self.vol_drift_poly[1] < (-1.0*max_slope):
+            self.vol_drift_poly[1] = -1.0*max_slope
+        self.vol_offset = np.min(self.fastdata.vol_raw - np.polyval(self.vol_drift_poly, self.fastdata.t))
+        print(f'\n\nfastloop: Updated flow trend equation: V = {self.vol_drift_poly[0]}*t + {self.vol_drift_poly[1]}')
+        #print(f'fastloop: volume offset = {self.vol_offset}\n\n')
+        self.recalculate_vol()
+    
+    def recalculate_vol(self):
+        # the corrected volume is built up one point at a time, so if the drift
+        # correction changes the whole stored vector has to be redone
+        if self.correct_vol:
+            return
+        self.snapshot.begin()
+        if self.vol_drift_poly is None:
+            self.fastdata.vol_drift = 0.0*self.fastdata.vol_raw
+        else:
+            self.fastdata.vol_drift = np.polyval(self.vol_drift_poly,self.fastdata.t)
+        self.fastdata.vol = self.fastdata.vol_raw - self.fastdata.vol_drift - self.vol_offset
+        self.publish_snapshot()
+        
+        
+    def restart_integral(self,time):
+        
+        
+        
+        integral_since_restart = np.sum(self.fastdata.vol_raw[self.fastdata.t > time])/(self.fastdata.fs*60.0)
+        print('restarting the integral at time: ',time, ', sum since restart = : ',integral_since_restart)
+        
+        self.vol_integral_to_now = integral_since_restart
+
+    def process_sample(self, t_obj, t_sample, p1, p2, dp, flow):
+        """
+        Adds one sensor sample to the data vectors, and runs the breath
+        detection and volume integration on it.
+
+        t_obj       =   datetime of the sample (not kept, fastdata.t_obj makes them from the times)
+        t_sample    =   time of the sample in seconds
+        p1, p2, dp  =   pressures in cmH20
+        flow        =   flow in slpm
+        """
+        # the ring buffers that hold the data vectors
+        buffers = self.fastdata.buffers
+
+        # readers of the last snapshot have to know the data is changing
+        self.snapshot.begin()
+
+        # fill in the parameters of the breaths the slow loop has finished with
+        self.breaths.apply_params()
+
+        # record the sample time
+        buffers['t'].append(t_sample)
+
+        # if there's at least two elements in the vector, calculate the real average delta between samples
+        # the mean of the deltas is just the time spanned by the vector over the number of deltas
+        ts = self.ts_estimator.push(t_sample)
+        if self.ts_estimator.ready:
+            self.ts_real = np.abs(ts)
+            self.fastdata.fs = 1.0/self.ts_real
+
+
+
+        # store the sensor pressure and flow data
+        buffers['p1'].append(p1)
+        buffers['p2'].append(p2)
+        buffers['dp'].append(dp)
+        #newflow = self.sensor.dp2flow(self.sensor.dp)
+        
+        buffers['flow'].append(flow)
+        
+        #self.fastdata.flow_raw =    self.add_new_point(self.fastdata.flow_raw, newflow, self.num_samples_to_hold)
+        #self.fastdata.flow = signal.detrend(self.fastdata.flow,type = 'constant')
+        
+        """
+        # apply the linear fit to the stored flow data
+        if not(self.flow_drift_poly is None):
+            self.fastdata.flow = self.fastdata.flow_raw - np.polyval(self.flow_drift_poly,self.fastdata.t)
+        else:
+            self.fastdata.flow = np.copy(self.fastdata.flow_raw)
+        """
+        
+        # build up a vector of the flow slope (ie the volume concavity)
+        buffers['dflow'].append(self.dflow_estimator.push(flow))
+        self.fastdata.inflow.push(max(flow, 0.0))
+        self.fastdata.outflow.push(min(flow, 0.0))
+        
+        
+        """
+        # build up the flow second derivative
+        if len(self.fastdata.flow)> N:
+            self.fastdata.d2flow = self.add_new_point(self.fastdata.d2flow,np.mean(self.fastdata.dflow[-N+1:] - self.fastdata.dflow[-N:-1]),self.num_samples_to_hold)
+        else:
+            self.fastdata.d2flow = self.add_new_point(self.fastdata.d2flow,0,self.num_samples_to_hold)
+        """
+        
+        # if the flow and flow slope are below a threshold, AND we're not in the inspiratory phase, OR it's been too long since the last breath, then zero the volume)
+        # the newest values
+        flow_now = buffers['flow'].last()
+        dflow_now = buffers['dflow'].last()
+        t_now = buffers['t'].last()
+
+        no_flow = (np.abs(dflow_now) < 0.1) & (np.abs(flow_now) < 5.0)
+        not_expiratory_phase = (self.insp == False)
+        too_long_since_last_breath = ((t_now - self.time_last_breath)) > 10
+        
+        if (no_flow & not_expiratory_phase) or (too_long_since_last_breath):
+            buffers['vol_raw'].append(0.0)
+        else:
+            buffers['vol_raw'].append(flow_now/(self.fastdata.fs*60.0)+self.vol_integral_to_now)
+        
+        # trigger a new breath if the slope flow is above a threshold and it's been long enough since the last breath
+        started_inspiring = (dflow_now > 0.25) & (flow_now > 10.0)
+        sufficient_time_since_last_breath =   (t_now - self.time_last_breath) > 1.0                                   
+        if (started_inspiring) & (sufficient_time_since_last_breath):
+            self.insp = True   
+            self.vol_integral_to_now = 0.0
+            self.time_last_breath = t_now
+            #beep()
+            print("\n\n\nfastloop: #### NEW INHALE ####\n\n\n")
+            if not self.on_new_inhale is None:
+                self.on_new_inhale()
+            
+            # mark the current time as the end of exhalation
+            i_now = buffers['t'].count - 1
+            self.breathdata.tee = t_now
+            self.breathdata.iee = i_now
+            self.breathdata.number = self.breaths.add(self.breathdata)
+            
+            # blast out the new breath data to main
+            if not self.on_new_breath is None:
+                self.on_new_breath(self.breathdata)
+            
+            # start filling the other breath buffer so the one we just sent isn't touched
+            self.swap_breathdata()
+            # mark the time of the start of inspiration
+            self.breathdata.tsi = t_now
+            self.breathdata.isi = i_now
+            
+        else:
+            self.vol_integral_to_now = buffers['vol_raw'].last()
+        
+        # trigger the end of inspiration
+        if (dflow_now < -0.25) & (flow_now < -10.0) & ((t_now - self.time_last_exhale)>1.0):
+            self.insp = False
+            self.time_last_exhale = t_now
+            #self.new_exhale.emit()
+            print("\n\n\nfastloop: #### NEW EXHALE ####\n\n\n")
+            # mark the time of the end of inspiration
+            self.breathdata.tei = t_now
+            self.breathdata.iei = buffers['t'].count - 1
+            
+            
+        buffers['insp'].append(self.insp)
+        
+        #    self.vol_concavity = np.mean(np.gradient(np.gradient(self.fastdata.vol_raw[-10:])))
+        # 
+        #    if self.vol_concavity > 0:
+        #        #beep()
+        
+        
+        #self.fastdata.flow = signal.detrend(self.fastdata.flow,type = 'constant')
+        #self.fastdata.vol_raw = self.add_new_point(self.fastdata.vol_raw, (np.sum(self.fastdata.flow) + self.vol_integral_to_now)/(self.fastdata.fs*60.0),self.num_samples_to_hold)
+        #self.fastdata.vol_raw = integrate.cumtrapz(self.fastdata.flow, initial = self.vol_integral_to_now)/(self.fastdata.fs*60.0)
+        #self.fastdata.vol_raw = signal.detrend(self.fastdata.vol_raw)
+        
+
+        #dp_zero = np.mean(self.fastdata.dp[np.abs(self.fastdata.dp)<0.0])
+        #if np.isnan(dp_zero):
+        #    dp_zero = 0.0
+
+        #flow_zero = self.sensor.dp2flow(dp_zero)
+
+        #self.fastdata.dp[np.abs(self.fastdata.dp)<0.0] = 0.0
+
+        #self.fastdata.flow = self.sensor.dp2flow(self.fastdata.dp)# - flow_zero
+
+        # apply a median filter
+        #self.fastdata.flow = signal.medfilt(self.fastdata.flow,3)
+
+        # log the data if we're in logdata mode
+        if not self.sensor_datafile is None:
+            self.log_raw_sensor_data()
+
+        # calculate the raw volume
+        #self.fastdata.vol_raw = np.cumsum(self.fastdata.flow)/(self.fastdata.fs*60.0)
+        #self.fastdata.vol_raw = signal.detrend(self.fastdata.vol_raw)
+
+        vol_raw_now = buffers['vol_raw'].last()
+        if self.correct_vol:
+            # make room for the new point, the correction fills it in
+            buffers['vol_drift'].append(0.0)
+            buffers['vol'].append(vol_raw_now)
+            try:
+                # correct the volume by pinning its minima to zero
+                self.apply_vol_corr(1)
+            except Exception as e:
+                print("fastloop: error in volume spline correction: ",e)
+                print("fastloop: could not apply vol spline correction. using raw volume instead...")
+                self.fastdata.vol = self.fastdata.vol_raw
+                self.fastdata.vol_drift = 0.0*self.fastdata.vol_raw
+
+        else:
+            # only the newest point needs to be corrected, the rest of the vector was
+            # done on previous loops (see recalculate_vol if the correction changes)
+            if self.vol_drift_poly is None:
+                vol_drift_now = 0.0
+            else:
+                vol_drift_now = np.polyval(self.vol_drift_poly,t_now)
+            
+            buffers['vol_drift'].append(vol_drift_now)
+            buffers['vol'].append(vol_raw_now - vol_drift_now - self.vol_offset)
+            
+            
+        
+        # send data to the datafiller
+        p1_now = buffers['p1'].last()
+        vol_now = buffers['vol'].last()
+        self.fastdata.all_fields.update({'pressure' : p1_now})
+        self.fastdata.all_fields.update({'flow' : flow_now})
+        #self.fastdata.all_fields.update({'volume' : self.fastdata.vol[-1]*1000 - self.vol_offset}) # in mL
+        self.fastdata.all_fields.update({'volume' : vol_now*1000}) # in mL
+
+        
+        # fill the data in the breathdata object
+        self.breathdata.buffers['p'].append(p1_now)
+        self.breathdata.buffers['flow'].append(flow_now)
+        self.breathdata.buffers['vol'].append(vol_now*1000)
+        self.breathdata.buffers['dt'].append(t_now - self.breathdata.tsi)
+        self.breathdata.p_range.push(p1_now)
+        self.breathdata.vol_range.push(vol_now*1000)
+
+        self.publish_snapshot()
+
+    def process_block(self, t_block, p1_block, p2_block, dp_block, flow_block):
+        """
+        Adds a block of sensor samples to the data vectors. This does exactly
+        what calling process_sample on each sample in turn would do, but the
+        per-sample work is done on whole arrays, so the cost of a loop
+        iteration doesn't grow with the number of samples that piled up.
+        Blocks of up to SMALL_BLOCK samples are quicker one at a time, so
+        they're handed to process_sample.
+
+        t_block     =   times of the samples in seconds
+        p1, p2, dp  =   pressures in cmH20
+        flow        =   flow in slpm
+        """
+        t_block = np.asarray(t_block, dtype = float)
+        flow_block = np.asarray(flow_block, dtype = float)
+        n_new = len(t_block)
+        if n_new == 0:
+            return
+        if n_new <= SMALL_BLOCK:
+            for i in range(n_new):
+                self.process_sample(None, t_block[i], p1_block[i], p2_block[i], dp_block[i], flow_block[i])
+            return
+        buffers = self.fastdata.buffers
+        i_new = np.arange(n_new)
+        self.snapshot.begin()
+        self.breaths.apply_params()
+
+        # real sample rate, from the time spanned by the vector after each sample is added
+        ts_real = np.abs(self.ts_estimator.extend(t_block))
+        with np.errstate(divide = 'ignore'):
+            fs = np.where(np.isnan(ts_real), self.fastdata.fs, 1.0/ts_real)
+        if self.ts_estimator.ready:
+            self.ts_real = ts_real[-1]
+        self.fastdata.fs = fs[-1]
+
+        # flow slope, same as in process_sample
+        dflow = self.dflow_estimator.extend(flow_block)
+        self.fastdata.inflow.extend(np.maximum(flow_block, 0.0))
+        self.fastdata.outflow.extend(np.minimum(flow_block, 0.0))
+
+        # find the breaths. the thresholds are the same as in process_sample, but
+        # a trigger only counts if it's more than a second after the last one
+        started_inspiring = (dflow > 0.25) & (flow_block > 10.0)
+        stopped_inspiring = (dflow < -0.25) & (flow_block < -10.0)
+        inhales = []
+        time_last_breath = self.time_last_breath
+        for i in np.flatnonzero(started_inspiring):
+            if (t_block[i] - time_last_breath) > 1.0:
+                inhales.append(i)
+                time_last_breath = t_block[i]
+        exhales = []
+        time_last_exhale = self.time_last_exhale
+        for i in np.flatnonzero(stopped_inspiring):
+            if (t_block[i] - time_last_exhale) > 1.0:
+                exhales.append(i)
+                time_last_exhale = t_block[i]
+
+        # inspiratory phase after each sample, and before it
+        event = np.zeros(n_new, dtype = np.int8)
+        event[inhales] = 1
+        event[exhales] = -1
+        last_event = np.maximum.accumulate(np.where(event != 0, i_new, -1))
+        insp = np.where(last_event >= 0, event[np.maximum(last_event, 0)] > 0, self.insp)
+        insp_before = np.concatenate(([self.insp], insp[:-1]))
+
+        # time of the last breath before each sample
+        is_inhale = event > 0
+        last_inhale = np.maximum.accumulate(np.where(is_inhale, i_new, -1))
+        t_last_breath = np.where(last_inhale >= 0, t_block[np.maximum(last_inhale, 0)], self.time_last_breath)
+        t_last_breath_before = np.concatenate(([self.time_last_breath], t_last_breath[:-1]))
+
+        # if the flow and flow slope are below a threshold, AND we're not in the inspiratory phase, OR it's been too long since the last breath, then zero the volume)
+        no_flow = (np.abs(dflow) < 0.1) & (np.abs(flow_block) < 5.0)
+        too_long_since_last_breath = (t_block - t_last_breath_before) > 10
+        zero_vol = (no_flow & (insp_before == False)) | too_long_since_last_breath
+
+        # integrate the volume. the integral starts again from zero after a
+        # zeroed sample or a new inhale, so accumulate each run in between on
+        # its own, starting from the integral carried over from before
+        vol_inc = flow_block/(fs*60.0)
+        vol_raw = np.zeros(n_new)
+        restart = zero_vol | is_inhale
+        restarts = np.flatnonzero(restart)
+        run_starts = np.flatnonzero((zero_vol == False) & np.concatenate(([True], restart[:-1])))
+        for start in run_starts:
+            # the run goes up to the next restart, including it if it's an inhale
+            k = np.searchsorted(restarts, start)
+            if k < len(restarts):
+                stop = restarts[k] + (0 if zero_vol[restarts[k]] else 1)
+            else:
+                stop = n_new
+            carry = self.vol_integral_to_now if start == 0 else 0.0
+            vol_raw[start:stop] = np.add.accumulate(np.concatenate(([carry], vol_inc[start:stop])))[1:]
+        if restart[-1]:
+            self.vol_integral_to_now = 0.0
+        else:
+            self.vol_integral_to_now = vol_raw[-1]
+
+        # store everything
+        buffers['t'].extend(t_block)
+        buffers['p1'].extend(p1_block)
+        buffers['p2'].extend(p2_block)
+        buffers['dp'].extend(dp_block)
+        buffers['flow'].extend(flow_block)
+        buffers['dflow'].extend(dflow)
+        buffers['vol_raw'].extend(vol_raw)
+        buffers['insp'].extend(insp)
+
+        if not self.sensor_datafile is None:
+            self.log_raw_sensor_data(n_new)
+
+        if self.correct_vol:
+            # make room for the new points, the correction fills them in
+            buffers['vol_drift'].extend(np.zeros(n_new))
+            buffers['vol'].extend(vol_raw)
+            try:
+                self.apply_vol_corr(n_new)
+            except Exception as e:
+                print("fastloop: error in volume spline correction: ",e)
+                print("fastloop: could not apply vol spline correction. using raw volume instead...")
+                self.fastdata.vol = self.fastdata.vol_raw
+                self.fastdata.vol_drift = 0.0*self.fastdata.vol_raw
+            vol = self.fastdata.vol[-n_new:]
+        else:
+            if self.vol_drift_poly is None:
+                vol_drift = np.zeros(n_new)
+            else:
+                vol_drift = np.polyval(self.vol_drift_poly,t_block)
+            vol = vol_raw - vol_drift - self.vol_offset
+            buffers['vol_drift'].extend(vol_drift)
+            buffers['vol'].extend(vol)
+
+        # send data to the datafiller
+        self.fastdata.all_fields.update({'pressure' : buffers['p1'].last()})
+        self.fastdata.all_fields.update({'flow' : flow_block[-1]})
+        self.fastdata.all_fields.update({'volume' : vol[-1]*1000}) # in mL
+
+        # fill the breath data, handing off each breath as a new inhale comes in
+        p1_block = np.asarray(p1_block, dtype = float)
+        count_start = buffers['t'].count - n_new
+        start = 0
+        for i in np.flatnonzero(event):
+            self.fill_breathdata(t_block[start:i], p1_block[start:i], flow_block[start:i], vol[start:i])
+            start = i
+            if event[i] > 0:
+                self.insp = True
+                self.time_last_breath = t_block[i]
+                print("\n\n\nfastloop: #### NEW INHALE ####\n\n\n")
+                if not self.on_new_inhale is None:
+                    self.on_new_inhale()
+                self.breathdata.tee = t_block[i]
+                self.breathdata.iee = count_start + i
+                self.breathdata.number = self.breaths.add(self.breathdata)
+                if not self.on_new_breath is None:
+                    self.on_new_breath(self.breathdata)
+                self.swap_breathdata()
+                self.breathdata.tsi = t_block[i]
+                self.breathdata.isi = count_start + i
+            else:
+                self.insp = False
+                self.time_last_exhale = t_block[i]
+                print("\n\n\nfastloop: #### NEW EXHALE ####\n\n\n")
+                self.breathdata.tei = t_block[i]
+                self.breathdata.iei = count_start + i
+        self.fill_breathdata(t_block[start:], p1_block[start:], flow_block[start:], vol[start:])
+
+        self.publish_snapshot()
+
+    def publish_snapshot(self):
+        self.snapshot.publish(fast_snapshot(self.fastdata))
+
+    def take_block(self):
+        """
+        Returns a sample_block of the samples added since the last call.
+        This can be called from another thread than the one updating the
+        pipeline (but only from one).
+        """
+        while True:
+            version, snapshot = self.snapshot.read()
+            count = snapshot['count']
+            if not count:
+                return sample_block(self.count_taken)
+
+            n_new = count - self.count_taken
+            n = min(n_new, snapshot['n'])
+            t = self.snapshot_view('t', count)
+            views = {name : self.snapshot_view(vector, count) for name, (vector, scale) in BLOCK_FIELDS.items()}
+            if t is None or any(view is None for view in views.values()):
+                # the pipeline has moved on too far since the snapshot, get a newer one
+                continue
+            t = np.array(t[len(t) - n:])
+            fields = {name : views[name][len(views[name]) - n:]*BLOCK_FIELDS[name][1] for name in views}
+
+            # make sure nothing was changed while copying (seqlock style): the
+            # copy is only good if no write has started since the snapshot, as
+            # the volume correction rewrites samples that are already held.
+            # otherwise let the pipeline get on with it and try again
+            if not self.snapshot.changed_since(version):
+                break
+            time.sleep(0)
+
+        self.count_taken = count
+        return sample_block(count, t, fields, dropped = n_new - n)
+
+    def take_vectors(self, names):
+        """
+        Returns a dict of copies of the named fast data vectors, all as they
+        were at the same sample count. Like take_block this can be called
+        from another thread than the one updating the pipeline.
+        """
+        while True:
+            version, snapshot = self.snapshot.read()
+            count = snapshot['count']
+            if not count:
+                return {name : np.array(self.fastdata.buffers[name].view()[:0]) for name in names}
+            views = {name : self.snapshot_view(name, count) for name in names}
+            if any(view is None for view in views.values()):
+                continue
+            vectors = {name : np.array(view) for name, view in views.items()}
+
+            # same check as take_block: no write started while copying
+            if not self.snapshot.changed_since(version):
+                return vectors
+            time.sleep(0)
+
+    def snapshot_view(self, name, count):
+        """
+        The named fast data vector as it was when the snapshot with this
+        count was published (no copy), or None if it's since been overwritten.
+        """
+        return self.fastdata.buffers[name].view_at(count)
+
+    def fill_breathdata(self, t, p, flow, vol):
+        # add a block of samples to the current breath
+        self.breathdata.buffers['p'].extend(p)
+        self.breathdata.buffers['flow'].extend(flow)
+        self.breathdata.buffers['vol'].extend(vol*1000)
+        self.breathdata.buffers['dt'].extend(t - self.breathdata.tsi)
+        self.breathdata.p_range.extend(p)
+        self.breathdata.vol_range.extend(vol*1000)
+
+    def swap_breathdata(self):
+        # switch to filling the other breath data buffer, and clear it out
+        if self.breathdata is self.breathdata_buffers[0]:
+            self.breathdata = self.breathdata_buffers[1]
+        else:
+            self.breathdata = self.breathdata_buffers[0]
+        self.breathdata.reset()
+
+    def log_raw_sensor_data(self, n_samples = 1):
+        # write out the last n_samples samples
+        self.sensor_datafile.write_columns(self.fastdata.t[-n_samples:], self.fastdata.p1[-n_samples:],
+                                           self.fastdata.p2[-n_samples:], self.fastdata.dp[-n_samples:])
+
+
+    def apply_vol_corr(self, n_new):
+        # this corrects the volume by pinning all the minima to zero: the drift is the piecewise
+        # linear line through the minima, carried on past the first and last ones.
+        # only the n_new new samples are looked at for minima, and only the drift
+        # from the minimum before the last one that changed on has to be redone
+        buffers = self.fastdata.buffers
+        t = buffers['t'].view()
+        vol_raw = buffers['vol_raw'].view()
+        n_new = min(n_new, len(t))
+
+        t_redo = t[-n_new]
+        for i in range(len(t) - n_new, len(t)):
+            if self.vol_minima.push(t[i], vol_raw[i]) & NEW_MINIMUM:
+                anchors = self.vol_minima.minima_t
+                if len(anchors) == 2:
+                    # the first line through two minima, the whole drift changes
+                    t_redo = -np.inf
+                elif len(anchors) > 2:
+                    t_redo = min(t_redo, anchors[-2])
+
+        if self.verbose and t_redo < t[-n_new]:
+            print(f"fastloop: found volume minimum at t = {self.vol_minima.minima_t.last()}")
+
+        # redo the drift and corrected volume from t_redo on
+        start = np.searchsorted(t, t_redo, side = 'left')
+        vol_drift = self.vol_drift_at(t[start:])
+        buffers['vol_drift'].set_last(vol_drift)
+        buffers['vol'].set_last(vol_raw[start:] - vol_drift)
+
+    def vol_drift_at(self, t):
+        # the volume drift at times t: the piecewise linear line through the volume minima
+        t_min = self.vol_minima.minima_t.view()
+        vol_min = self.vol_minima.minima_x.view()
+        if len(t_min) < 2:
+            return np.zeros(len(t))
+        drift = np.interp(t, t_min, vol_min)
+
+        # before the first and after the last minimum carry on the line through the two end ones
+        before = t < t_min[0]
+        drift[before] = vol_min[0] + (t[before] - t_min[0])*(vol_min[1] - vol_min[0])/(t_min[1] - t_min[0])
+        after = t > t_min[-1]
+        drift[after] = vol_min[-1] + (t[after] - t_min[-1])*(vol_min[-1] - vol_min[-2])/(t_min[-1] - t_min[-2])
+        return drift
+
+
+class slow_pipeline(object):
+
+    """
+    Calculates the breath parameters from the breath data handed over by
+    the fast pipeline, and the values that are updated on the slow loop
+    clock (time since the last breath, measured minute volume).
+    """
+
+    def __init__(self, config, verbose = False):
+
+        # print stuff for debugging?
+        self.verbose = verbose
+
+        self.config = config
+
+        # the data from the fast pipeline that the calculations are done on
+        self.fastdata = fast_data()
+        self.breathdata = breath_data()
+
+        # the fast pipeline whose published snapshots are read, if it's been
+        # connected. otherwise the fastdata handed over is read directly
+        self.fast_source = None
+
+        # set up a place to store the slow data that is calculated each update
+        self.slowdata = slow_data()
+
+        # set up a place to store the breath parameters calculated from the last breath
+        self.breathpar = breath_par()
+
+        self.t_last_prev = 0
+
+        # the indices of the volume minima
+        self.i_min_vol = []
+
+        # times from the last breath
+        self.tsi = datetime.utcnow().timestamp() # start time of inspiration (absolute time)
+        self.dtsi = [] # start time of inspiration (dt since start)
+        self.dtei = [] # end time of inspiration (dt since start)
+        self.dtee = [] # end time of expiration (dt since start)
+
+    def connect_fast_pipeline(self, fast_source):
+        # read the snapshots published by this fast pipeline from now on
+        self.fast_source = fast_source
+        self.fastdata = fast_source.fastdata
+
+    def read_snapshot(self):
+        # a consistent summary of the fast data, even while the fast pipeline is updating it
+        if self.fast_source is None:
+            return fast_snapshot(self.fastdata)
+        version, snapshot = self.fast_source.snapshot.read()
+        return snapshot
+
+    def update(self, t):
+        """
+        Updates the slow data at time t (s) from the current fast data.
+        Returns False if there's no data to work with yet.
+        """
+        snapshot = self.read_snapshot()
+        if not snapshot['n']:
+            return False
+
+        # how long since the last breath
+        self.slowdata.dt_last = (t - self.slowdata.t_last)
+
+        # now measure the realtime value (it fluctuates but stays near the real value, and is valuable if no breaths are delivered)
+            # we don't display a full minute so need to scale answer
+        scale = 60.0/(snapshot['t_last'] - snapshot['t_first'])
+        mve_meas_in = np.abs(snapshot['inflow_sum']/(snapshot['fs']*60.0)*scale)
+        mve_meas_out = np.abs(snapshot['outflow_sum']/(snapshot['fs']*60.0)*scale)
+        #average the flow in and out to get a sensible result regardless of flow sensor drift
+        self.slowdata.mve_meas = ( np.mean([mve_meas_in, mve_meas_out]))
+        return True
+
+    def find_vol_min(self):
+        """
+        ## find the min of the volume signal using peak finder ##
+
+        """
+        # scipy takes a while to import, so it's left until it's needed
+        from scipy import signal
+
+        # step 0: detrend the volume
+        self.fastdata.vol = signal.detrend(self.fastdata.vol)
+        
+        # step 1: find index of min and max
+        self.i_min_vol = utils.breath_detect_coarse(-1*self.fastdata.vol, fs = self.fastdata.fs,minpeak = 0.0)
+
+        if self.verbose:
+            print(f"slowloop: found {len(self.i_min_vol)} peaks at dt = {self.fastdata.dt[self.i_min_vol]}")
+
+
+    def calculate_breath_params(self):
+        """
+        
+        This calcuates the breath parameters from the last breath,
+        which is the data that has been passed to it from the fastloop as
+        the "breathdata" object:
+            
+        ## BREATH DATA OBJECT HOLDS:
+        self.p      =   pressure waveform during last breath
+        self.flow   =   flow waveform during last breath
+        self.vol    =   volume waveform during last breath
+        self.dt     =   time during last breath (in seconds) since start of breath
+        self.tsi    =   absolute time of start of inspriation
+        self.tei    =   absolute time of end of inspriation
+        self.tee    =   absolute time of end of expriration
+        
+        This blindly assumes that the breath data is for a good breath, and 
+        goes ahead with the calculation. 
+
+        The function populates the following values in the slowdata object:
+
+        ## THINGS THAT HOLD SINGLE VALUES ##
+        # respiratory parameters from last breath
+        self.pip = []
+        self.peep = []
+        self.pp = []
+        self.vt = []
+        self.mve = []
+        self.rr = []
+        self.ie = []
+        self.c = []
+        
+        
+        After recalcuating the breath parameters, it signals to the main loop
+        that there is new slowloop data.
+        """
+        print('slowloop: trying to calculate breath params')
+        if len(self.breathdata.p)>0:
+            # calculate the relative times of the end of inspriation and the end of expiration
+            self.dtsi = 0.0
+            self.dtei = self.breathdata.tei - self.breathdata.tsi
+            self.dtee = self.breathdata.tee - self.breathdata.tsi
+            
+            # record the time of the last breath
+            self.slowdata.t_last = self.breathdata.tee
+            
+            # get tidal volume (in mL) and the end inspiration time (both defined at vol peak over last breath)
+            self.breathpar.vt = self.breathdata.vol_range.max
+            
+            # get pip: peak pressure over last breath
+            self.breathpar.pip = self.breathdata.p_range.max
+        
+            # get respiratory rate (to one decimal place)
+            self.breathpar.rr = (60.0/(self.breathdata.tee - self.breathdata.tsi))
+        
+            # get i:e ratio (to one decimal place)
+            dt_exp = self.breathdata.tee - self.breathdata.tei
+            dt_insp = self.breathdata.tei - self.breathdata.tsi
+            self.breathpar.ie = np.abs(dt_exp) / np.abs(dt_insp)
+            
+            #print('slowloop: tsi = ',self.breathdata.tsi)
+            #print('slowloop: tei = ',self.breathdata.tei)
+            #print('slowloop: tee = ',self.breathdata.tee)
+            
+            # get minute volume
+            # first infer it from the last breath: RR * VT
+            self.breathpar.mve_inf = ( (self.breathpar.rr * self.breathpar.vt/1000.0))
+            
+            # get peep: average pressure over the 50 ms about the end of expiration
+            dt_peep = 0.05
+            self.breathpar.peep =  np.mean(self.breathdata.p[(self.breathdata.dt>=self.dtee-(dt_peep))])
+            
+            # get pp: plateau pressure -- defined as mean pressure over 50 ms before the end of inspiration
+            dt_pip = 0.05
+            self.breathpar.pp = (np.mean(self.breathdata.p[(self.breathdata.dt>=self.dtei-dt_pip) & (self.breathdata.dt<=self.dtei)]))
+            
+            # get static lung compliance. Cstat = VT/(PP - PEEP), reference: https://www.mdcalc.com/static-lung-compliance-cstat-calculation#evidence
+            self.breathpar.c = ( self.breathpar.vt/(self.breathpar.pp - self.breathpar.peep))
+            
+            # hand the parameters over for the breath's record in the breath index
+            if not self.fast_source is None and self.breathdata.number >= 0:
+                self.fast_source.breaths.set_params(self.breathdata.number, self.breathpar)
+            
+            return self.breathpar
+        else:
+            print('slowloop: no breathdata to calculate breath parameters on')
+            return None
+
+    def calculate_breath_params_from_fastdata(self):
+        """
+
+        ## THINGS THAT HOLD SINGLE VALUES ##
+        # respiratory parameters from last breath
+        self.pip = []
+        self.peep = []
+        self.pp = []
+        self.vt = []
+        self.mve = []
+        self.rr = []
+        self.ie = []
+        self.c = []
+        """
+        print('slowloop: trying to calculate breath params')
+        
+        if len(self.i_min_vol) >= 2:
+            # define the last breath
+            self.tsi = self.fastdata.t[self.i_min_vol[-2]]
+            self.tee = self.fastdata.t[self.i_min_vol[-1]]
+            self.dtsi = self.fastdata.dt[self.i_min_vol[-2]]
+            self.dtee = self.fastdata.dt[self.i_min_vol[-1]]
+
+            # update the time of the last breath
+            self.slowdata.t_last = ( self.tee )
+            #print(f'slowloop: self.slowdata.t_last = {self.slowdata.t_last}, self.t_last_prev = {self.t_last_prev}, delta = {self.slowdata.t_last - self.t_last_prev}')
+            #if the "last breath" has changed by more than some threshold time, it's a new breath
+            if (self.slowdata.t_last - self.t_last_prev) > 0.5:
+                self.slowdata.newbreath_detected = True
+                print('slowloop: new breath detected')
+                self.t_last_prev = self.slowdata.t_last
+            else:
+                #self.dt_last_prev = self.slowdata.t_last
+                self.slowdata.newbreath_detected = False
+                print('slowloop: NO new breath detected')
+            # index range of the last breath
+            index_range = np.arange(self.i_min_vol[-2],self.i_min_vol[-1]+1)
+
+
+            # get tidal volume (in mL) and the end inspiration time (both defined at vol peak over last breath)
+            self.slowdata.vt = ( np.max(self.fastdata.vol[index_range])*1000)
+            self.i_max_vol_last = index_range[np.argmax(self.fastdata.vol[index_range])]
+            self.dtei = self.fastdata.dt[self.i_max_vol_last]
+
+            # get pip: peak pressure over last breath
+            self.slowdata.pip = ( np.max(self.fastdata.p1[index_range]))
+            
+           
+            # get respiratory rate (to one decimal place)
+            self.slowdata.rr = (60.0/(self.dtee - self.dtsi))
+
+            # get i:e ratio (to one decimal place)
+            dt_exp = self.dtee - self.dtei
+            dt_insp = self.dtei - self.dtsi
+            self.slowdata.ie = ( np.abs(dt_exp / dt_insp))
+
+            # get minute volume
+            # first infer it from the last breath: RR * VT
+            self.slowdata.mve_inf = ( (self.slowdata.rr * self.slowdata.vt/1000.0))
+
+
+            # get peep: average pressure over the 50 ms about the end of expiration
+            dt_peep = 0.05
+            self.slowdata.peep = ( np.mean(self.fastdata.p1[(self.fastdata.dt>=self.dtee-(dt_peep/2)) & (self.fastdata.dt<=self.dtee+(dt_peep/2))]))
+
+            # get pp: plateau pressure -- defined as mean pressure over 50 ms before the end of inspiration
+            dt_pip = 0.05
+            self.slowdata.pp = (np.mean(self.fastdata.p1[(self.fastdata.dt>=self.dtei-dt_pip) & (self.fastdata.dt<=self.dtei)]))
+
+            # get static lung compliance. Cstat = VT/(PP - PEEP), reference: https://www.mdcalc.com/static-lung-compliance-cstat-calculation#evidence
+            self.slowdata.c = ( self.slowdata.vt/(self.slowdata.pp - self.slowdata.peep))
+
+            """
+            # round the pip and peep and vt
+            self.slowdata.pip = np.round(self.slowdata.pip,1)
+            self.slowdata.peep = np.round(self.slowdata.peep,1)
+            self.slowdata.pp = np.round(self.slowdata.pp,1)
+            self.slowdata.vt = np.round(self.slowdata.vt,1)
+            """
+                
+            
+
+
+        else:
+            print("slowloop: no breath detected!")
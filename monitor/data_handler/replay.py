@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+replay.py
+
+Replays a recorded sensor log (text or binary, see sensor/rawlog.py)
+through the same fast and slow processing pipelines the monitor uses, and
+collects the breath parameters it comes up with. This doesn't need Qt or a
+display, so recorded sessions can be processed anywhere.
+
+There are two ways to run it:
+    realtime:   the samples are fed in at their recorded times (optionally
+                sped up), the same way the fast loop would get them live
+    batch:      the whole recording goes through as fast as the CPU can
+                manage, so hours of data can be checked in seconds
+
+The flow is zeroed the way the sensor's set_zero_flow() does it: the mean dp
+of the first samples of the recording (100 by default, zero=<n> to change
+it, zero=0 to leave dp as it was recorded) is taken as the dp offset, so the
+recording should start with no flow. Logs with timestamps that are too
+coarse to tell the samples apart (eg. whole seconds) get evenly spaced
+sample times over the recording.
+
+From the monitor directory:
+    python data_handler/replay.py calibration/1590534414_sensor_raw.txt
+    python data_handler/replay.py calibration/Simulated_Data.txt realtime speed=4
+    python data_handler/replay.py calibration/1588972688_sensor_raw.txt zero=0
+
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import yaml
+
+# add the main directory to the front of the PATH, ahead of this directory,
+# so the data_handler package is found rather than data_handler.py
+main_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, main_path)
+
+from data_handler.pipeline import fast_pipeline, slow_pipeline
+from sensor import flowcal
+from sensor import rawlog
+from sensor import sensor
+
+
+# breath parameters that are recorded for each breath
+BREATH_PARAMS = ('pip', 'peep', 'pp', 'vt', 'mve_inf', 'rr', 'ie', 'c')
+
+
+class replay_engine(object):
+    """
+    Constituents:
+        t, p1, p2, dp, flow =   the recording, t shifted to start at t_start
+        dp_offset           =   the dp subtracted before converting to flow
+        breaths             =   list of dicts of breath parameters, one per breath
+        mve_meas            =   list of (t, measured minute volume) from each slow loop update
+    """
+
+    def __init__(self, main_path, config, datafile, mouthpiece = 'iqspiro', skiprows = 0, t_start = None, zero_samples = 100, verbose = False):
+        self.main_path = main_path
+        self.verbose = verbose
+
+        # load the recording
+        t, p1, p2, dp = rawlog.load_sensor_data(datafile, skiprows = skiprows)
+        if t_start is None:
+            t_start = datetime.utcnow().timestamp()
+        self.t = np.asarray(t, dtype = float) - t[0] + t_start
+        self.p1 = np.asarray(p1, dtype = float)
+        self.p2 = np.asarray(p2, dtype = float)
+
+        # the fast data vectors should span the display time at the recorded sample rate
+        self.config = config
+        self.ts_recorded = np.median(np.diff(self.t))*1000.0 if len(self.t) > 1 else 0.0 #ms
+        if not self.ts_recorded > 0:
+            # the timestamps don't tell the samples apart (eg. they're whole seconds),
+            # so spread the samples evenly over the recording, or at the configured
+            # interval if it doesn't span any time at all
+            duration = self.t[-1] - self.t[0]
+            if duration > 0:
+                self.ts_recorded = duration/(len(self.t) - 1)*1000.0
+            else:
+                self.ts_recorded = float(self.config['fastdata_interval'])
+            print(f"replay: timestamps too coarse, using {self.ts_recorded:.2f} ms between samples")
+            self.t = self.t[0] + np.arange(len(self.t))*self.ts_recorded/1000.0
+
+        self.fast_pipeline = fast_pipeline(self.config, ts_sample = self.ts_recorded, verbose = verbose)
+        self.slow_pipeline = slow_pipeline(self.config, verbose = verbose)
+        self.slow_pipeline.connect_fast_pipeline(self.fast_pipeline)
+
+        # convert to flow the same way the sensor does: dp is recalculated from the pressures,
+        # less the zero flow offset (see sensor.set_zero_flow)
+        self.calibration = flowcal.load_flow_calibration(main_path + sensor.calibration_files[mouthpiece.lower()],
+                                                         lut_dp_max = self.config.get('flow_lut_dp_max', None))
+        self.dp = self.p2 - self.p1
+        self.dp_offset = np.mean(self.dp[:zero_samples]) if zero_samples > 0 else 0.0
+        self.dp = self.dp - self.dp_offset
+        self.flow = self.calibration(self.dp)
+
+        # each finished breath goes straight to the breath parameter calculation
+        self.fast_pipeline.on_new_breath = self.breath_received
+
+        self.breaths = []
+        self.mve_meas = []
+
+    def __len__(self):
+        return len(self.t)
+
+    def breath_received(self, breathdata):
+        self.slow_pipeline.breathdata = breathdata
+        breathpar = self.slow_pipeline.calculate_breath_params()
+        if breathpar is None:
+            return
+
+        # the parameters go through the breath index like they do in the
+        # monitor, and each breath is read back from its record. this runs
+        # in the fast pipeline's thread, so the record can be filled in now
+        breaths = self.fast_pipeline.breaths
+        breaths.apply_params()
+        record = breaths.get(breathdata.number)
+        if record is None:
+            return
+        breath = {'tsi' : float(record['t_start']), 'tee' : float(record['t_end'])}
+        for name in BREATH_PARAMS:
+            breath[name] = float(record[name])
+        self.breaths.append(breath)
+
+    def run(self, realtime = False, speed = 1.0):
+        """
+        Feeds the whole recording through the loops. In realtime mode the
+        samples are handed over in fast loop sized blocks at their recorded
+        times (divided by speed), otherwise in slow loop sized blocks with
+        no waiting.
+        """
+        if realtime:
+            block_interval = self.config['fastdata_interval']/1000.0
+        else:
+            block_interval = self.config['slowdata_interval']/1000.0
+        slow_interval = self.config['slowdata_interval']/1000.0
+
+        # split the recording into blocks of block_interval of recorded time
+        edges = np.arange(self.t[0] + block_interval, self.t[-1] + block_interval, block_interval)
+        stops = np.searchsorted(self.t, edges, side = 'right')
+
+        t_wall_start = time.monotonic()
+        t_last_slow = self.t[0]
+        start = 0
+        for stop in stops:
+            if stop == start:
+                continue
+            if realtime:
+                # wait until the last sample in the block would have been read
+                wait = (self.t[stop - 1] - self.t[0])/speed - (time.monotonic() - t_wall_start)
+                if wait > 0:
+                    time.sleep(wait)
+
+            self.fast_pipeline.process_block(self.t[start:stop], self.p1[start:stop], self.p2[start:stop],
+                                             self.dp[start:stop], self.flow[start:stop])
+            start = stop
+
+            # slow updates happen on the recorded clock
+            if (self.t[stop - 1] - t_last_slow) >= slow_interval:
+                t_last_slow = self.t[stop - 1]
+                self.slow_pipeline.update(t_last_slow)
+                self.mve_meas.append((t_last_slow, self.slow_pipeline.slowdata.mve_meas))
+
+        self.run_time = time.monotonic() - t_wall_start
+        return self.breaths
+
+    def print_summary(self):
+        duration = self.t[-1] - self.t[0]
+        print(f"replay: {len(self)} samples ({duration:.1f} s recorded) in {self.run_time:.2f} s, {len(self)/self.run_time:.0f} samples/s")
+        print(f"replay: {len(self.breaths)} breaths")
+        print('\t'.join(['tsi'] + list(BREATH_PARAMS)))
+        for breath in self.breaths:
+            values = [f"{breath['tsi'] - self.t[0]:.2f}"]
+            for name in BREATH_PARAMS:
+                values.append('None' if breath[name] is None else f"{breath[name]:.2f}")
+            print('\t'.join(values))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python replay.py <sensor log> [realtime] [speed=<factor>] [hamilton] [zero=<samples>]")
+        print("  zero=<n>   zero the flow on the mean dp of the first n samples (default 100, 0 = don't)")
+        sys.exit(1)
+
+    datafile = sys.argv[1]
+    realtime = 'realtime' in sys.argv
+    speed = 1.0
+    zero_samples = 100
+    for arg in sys.argv[2:]:
+        if arg.startswith('speed='):
+            speed = float(arg.split('=')[1])
+        elif arg.startswith('zero='):
+            zero_samples = int(arg.split('=')[1])
+    mouthpiece = 'hamilton' if 'hamilton' in sys.argv else 'iqspiro'
+
+    with open(main_path + '/config/default_settings.yaml') as f:
+        config = yaml.load(f, Loader = yaml.FullLoader)
+
+    engine = replay_engine(main_path, config, datafile, mouthpiece = mouthpiece, zero_samples = zero_samples,
+                           verbose = 'verbose' in sys.argv)
+    engine.run(realtime = realtime, speed = speed)
+    engine.print_summary()
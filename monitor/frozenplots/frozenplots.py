@@ -5,9 +5,10 @@ This includes freezing, unfreezing, scaling, and translating plots as well as a
 """
 import numpy as np
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5 import QtCore
 from pyqtgraph import InfiniteLine, TextItem, SignalProxy, PlotDataItem
+from utils.uicache import load_ui
 
 
 class Cursor():
@@ -143,7 +144,7 @@ class FrozenPlotsBottomMenu(QtWidgets.QWidget):
         Grabs child widgets.
         """
         super(FrozenPlotsBottomMenu, self).__init__(*args)
-        uic.loadUi("frozenplots/frozenplots_bottom.ui", self)
+        load_ui("frozenplots/frozenplots_bottom.ui", self)
 
         self.button_reset_zoom = self.findChild(
             QtWidgets.QPushButton, "button_reset_zoom")
@@ -225,7 +226,7 @@ class FrozenPlotsRightMenu(QtWidgets.QWidget):
         Grabs child widgets.
         """
         super(FrozenPlotsRightMenu, self).__init__(*args)
-        uic.loadUi("frozenplots/frozenplots_right.ui", self)
+        load_ui("frozenplots/frozenplots_right.ui", self)
 
         self.yzoom_top = self.findChild(QtWidgets.QWidget, "yzoom_top")
         self.yzoom_mid = self.findChild(QtWidgets.QWidget, "yzoom_mid")
@@ -267,7 +268,7 @@ class YZoom(QtWidgets.QWidget):
         Grabs child widgets.
         """
         super(YZoom, self).__init__(*args)
-        uic.loadUi("frozenplots/y_zoom.ui", self)
+        load_ui("frozenplots/y_zoom.ui", self)
 
         self.button_plus = self.findChild(QtWidgets.QPushButton, "y_plus")
         self.button_minus = self.findChild(QtWidgets.QPushButton, "y_minus")
@@ -370,7 +371,7 @@ class XZoom(QtWidgets.QWidget):
         Grabs child widgets.
         """
         super(XZoom, self).__init__(*args)
-        uic.loadUi("frozenplots/x_zoom.ui", self)
+        load_ui("frozenplots/x_zoom.ui", self)
 
         self.button_plus = self.findChild(QtWidgets.QPushButton, "x_plus")
         self.button_minus = self.findChild(QtWidgets.QPushButton, "x_minus")
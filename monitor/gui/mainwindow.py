@@ -12,10 +12,11 @@ This is where the mainwindow of the GUI is defined
 @author: nlourie
 """
 
-from PyQt5 import uic, QtCore, QtGui, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets
 import pyqtgraph as pg
 import os
 import sys
+import time
 import numpy as np
 
 # add the wsp directory to the PATH
@@ -37,6 +38,12 @@ from alarm_handler import AlarmHandler
 from tools.tools import tools
 from statistics.statsbar import statsbar
 from statistics.statistics import Statset
+from statistics.trends import TrendStore
+from utils import probes
+from utils import startup
+from utils.governor import RefreshGovernor
+from utils.uicache import load_ui
+from utils import configcache
 
 #from communication.fake_esp32serial import FakeESP32Serial
 #from alarm_handler import AlarmHandler
@@ -52,8 +59,6 @@ class MainWindow(QtWidgets.QMainWindow):
     monitors.
     """
 
-    # this is a signal that sends fastdata from the mainloop to the slowloop
-    request_from_slowloop = QtCore.pyqtSignal(object)
     request_to_update_cal = QtCore.pyqtSignal(object)
     update_vol_offset = QtCore.pyqtSignal(float)
     restart_looping_plot = QtCore.pyqtSignal()
@@ -62,14 +67,15 @@ class MainWindow(QtWidgets.QMainWindow):
     sensor_initialized = QtCore.pyqtSignal() # emits once the sensor has done its initial rezero process
 
     
-    def __init__(self,  config, main_path, mode = 'normal', diagnostic = False, verbose = False,simulation = False,logdata = False,*args, **kwargs):
+    def __init__(self,  config, main_path, cfg = None, mode = 'normal', diagnostic = False, verbose = False,simulation = False,logdata = False,*args, **kwargs):
 
         """
         Initializes the main window
         """
 
         super(MainWindow, self).__init__(*args, **kwargs)
-        uic.loadUi('mainwindow.ui', self)  # Load the .ui file
+        load_ui('mainwindow.ui', self)  # Load the .ui file
+        startup.mark('main window ui')
 
         # set mode
         if mode.lower() == 'debug':
@@ -86,11 +92,14 @@ class MainWindow(QtWidgets.QMainWindow):
         if 'raspberrypi' in os.uname():
             self.showFullScreen()
         
-        # configuration
+        # configuration: the dict, and the compiled config for the values read every frame
         self.config = config
+        if cfg is None:
+            cfg = configcache.compile_config(config)
+        self.cfg = cfg
 
         # data filler
-        self.data_filler = data_filler.DataFiller(config = self.config)
+        self.data_filler = data_filler.DataFiller(config = self.config, cfg = self.cfg)
 
         # run in verbose mode? do this if requested specifically or if running in debug mode
         self.verbose = (verbose) or (self.mode_verbose)
@@ -136,9 +145,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.slow_loop.new_slowdata.connect(self.update_slow_data)
         #self.restart_looping_plot.connect(self.fast_loop.sensor.update_ambient_pressure)
         self.slow_loop.new_breathpar.connect(self.update_breath_params)
-        # if the slowloop requests new data, send it the current fastdata
-        self.slow_loop.request_fastdata.connect(self.slowloop_request)
-        self.request_from_slowloop.connect(self.slow_loop.update_fast_data)
+        # the slowloop reads the snapshots the fastloop publishes
+        self.slow_loop.connect_fast_loop(self.fast_loop)
 
         # rezero the volume offset
         #self.update_vol_offset.connect(self.fast_loop.update_vol_offset)
@@ -352,10 +360,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.statline = self.statplot.plot([0],[0],     pen=pen, symbol='o', symbolSize=20, symbolBrush=('y'))
         
         # set up the statistics set which will hold useful statistics about the breaths
-        self.statset = Statset()
+        self.statset = Statset(self.config.get('stats_window', 10))
         for name in self.config['statistics']:
             self.statset.add_stat(name)
             #print("found statistic: ",name)
+        # the long term trends of the breath parameters (kept across stats resets)
+        self.trends = TrendStore(self.config['trends'])
+
         # set the current stat that will be shown (by default its the first one in the config)
         self.current_stat = self.config['statistics'][0]
         print('mainloop: current stat = ',self.current_stat)
@@ -535,6 +546,12 @@ class MainWindow(QtWidgets.QMainWindow):
             layout.addWidget(self.graph2)
             layout.addWidget(self.graph3)
 
+            # live readout of the timing probes
+            self.timing_label = QtWidgets.QLabel()
+            self.timing_label.setFont(QtGui.QFont('Monospace', 9))
+            self.timing_label.setStyleSheet('QLabel {color: white; background-color: black;}')
+            layout.addWidget(self.timing_label)
+
             widget = QtWidgets.QWidget()
             widget.setLayout(layout)
 
@@ -580,14 +597,46 @@ class MainWindow(QtWidgets.QMainWindow):
             
 
 
+        # frame scheduler: the screen is redrawn once per frame by update_frame.
+        # the slots that receive new data just mark which parts of the screen
+        # need redrawing (see mark_dirty), the plots are redrawn every frame.
+        # each region is kept with the time it was first marked since it was last redrawn
+        self.dirty = dict()
+
+        # max time in ms to spend on a frame before the low priority redraws wait for the next one
+        self.frame_budget = self.config.get('frame_budget', 30)
+        self.frames_deferred = 0
+
+        # max time in ms a redraw can be left waiting, after this it's done however long the frame is
+        self.frame_max_defer = self.config.get('frame_max_defer', 250)
+
         # update the graphs at regular intervals (so it runs in a separate thread!!)
         # Stuff with the timer
         self.t_update = self.config['plot_interval']#self.fast_update_time*5 #update time of timer in ms
         self.timer = QtCore.QTimer()
         self.timer.setInterval(self.t_update)
-        self.timer.timeout.connect(self.update_plots)
+        self.timer.timeout.connect(self.update_frame)
         self.timer.start()
 
+        # the plots have a point per plot interval. this counts how many are due each frame
+        self.t_last_frame = None
+        self.frame_points_due = 0.0
+
+        # turns the plot refresh down if the GUI or the fastloop are short of time
+        self.governor = RefreshGovernor(self.t_update, self.config['fastdata_interval'],
+                                        adaptive = self.config.get('adaptive_refresh', False))
+
+        # timing probes for the GUI thread: anything that blocks it for longer
+        # than a plot frame makes the waveforms lag
+        for name in ('main.update_frame', 'main.update_plots', 'main.update_monitors', 'main.update_loop_plots'):
+            probes.get_probe(name, budget_ms = self.t_update)
+
+        if self.diagnostic:
+            self.timing_timer = QtCore.QTimer()
+            self.timing_timer.setInterval(self.config['slowdata_interval'])
+            self.timing_timer.timeout.connect(self.update_timing_label)
+            self.timing_timer.start()
+
 
 
 
@@ -909,32 +958,111 @@ class MainWindow(QtWidgets.QMainWindow):
     def silence_alarms(self):
         self.gui_alarm.silence_alarms()
     
+    def mark_dirty(self, region):
+        # ask for part of the screen to be redrawn on the next frame
+        # regions: 'monitors', 'loop_plots', 'stats'
+        self.dirty.setdefault(region, time.perf_counter())
+
+    @probes.timed('main.update_frame')
+    def update_frame(self):
+        """
+        Redraws whatever has changed since the last frame. The plots and
+        the monitors (which also check the alarms) are always done, the
+        loop plots and the statistics page are left for the next frame if
+        the frame budget is already used up, unless they've been waiting
+        for longer than frame_max_defer.
+        """
+        t_start = time.perf_counter()
+        self.governor.frame_load.start()
+
+        self.update_plots()
+
+        if 'monitors' in self.dirty:
+            self.dirty.pop('monitors')
+            self.update_monitors()
+
+        deferred = False
+        for region, redraw in (('loop_plots', self.update_loop_plots), ('stats', self.update_displayed_stats)):
+            if region in self.dirty:
+                over_budget = (time.perf_counter() - t_start)*1000.0 > self.frame_budget
+                overdue = (t_start - self.dirty[region])*1000.0 >= self.frame_max_defer
+                if over_budget and not overdue:
+                    deferred = True
+                    continue
+                self.dirty.pop(region)
+                redraw()
+        if deferred:
+            self.frames_deferred += 1
+
+        # see if the plot refresh rate needs changing
+        self.governor.frame_load.stop()
+        if self.governor.frame(self.fast_loop.load):
+            self.timer.setInterval(int(round(self.governor.interval)))
+            self.data_filler.set_decimation(self.governor.decimation)
+            print(f"main: {self.governor.summary()}")
+
+    def count_frame_points(self):
+        # the number of plot points due since the last frame, one per plot interval
+        t = time.monotonic()
+        if self.t_last_frame is None:
+            n_points = 1
+        else:
+            self.frame_points_due += (t - self.t_last_frame)*1000.0/self.t_update
+            n_points = min(int(round(self.frame_points_due)), self.cfg.nsamples)
+            self.frame_points_due -= n_points
+        self.t_last_frame = t
+        return n_points
+
+    def update_timing_label(self):
+        self.timing_label.setText('\n'.join([self.governor.summary(), f'frames deferred {self.frames_deferred}'] + probes.report()))
+
+    @probes.timed('main.update_plots')
     def update_plots(self):
 
+        # take the samples the fastloop has processed since the last frame
+        block = self.fast_loop.take_block()
 
         # update the plots with the new data
         if self.diagnostic:
-            self.data_line0.setData(self.fastdata.dt,   self.fastdata.insp)
-            #self.data_line1b.setData(self.fastdata.dt,   self.fastdata.p2)
-            self.data_line1.setData(self.fastdata.dt, self.fastdata.flow)
-            self.data_line2.setData(self.fastdata.dt,   self.fastdata.dflow)#flow)
-            self.data_line3.setData(self.fastdata.dt,   self.fastdata.vol*1000) #update the data
+            # the fastloop keeps writing to the vectors, so plot copies all taken at the same count
+            data = self.fast_loop.take_vectors(('t', 'insp', 'flow', 'dflow', 'vol'))
+            dt = data['t'] - data['t'][0] if len(data['t']) > 0 else data['t']
+            self.data_line0.setData(dt,   data['insp'])
+            #self.data_line1b.setData(dt,   data['p2'])
+            self.data_line1.setData(dt, data['flow'])
+            self.data_line2.setData(dt,   data['dflow'])#flow)
+            self.data_line3.setData(dt,   data['vol']*1000) #update the data
 
 
         #
         else:
-            # add the data to the plot vectors
-            for key in self.fastdata.all_fields.keys():
-                self.data_filler.add_data_point(key,self.fastdata.all_fields[key])
+            # add the data to the plot vectors. the plots have a point per plot
+            # interval, so add one for each interval since the last frame (more
+            # than one if the refresh rate was turned down or the frame is late),
+            # spread over the new samples and ending with the newest one (or the
+            # last one again if nothing new came in)
+            n_points = self.count_frame_points()
+            looping_restart = False
+            for i in range(n_points):
+                if block.n > 0:
+                    j = block.n - 1 - (n_points - 1 - i)*block.n//n_points
+                    for key in block.fields.keys():
+                        self.data_filler.add_data_point(key,block.fields[key][j])
+                else:
+                    for key in self.fastdata.all_fields.keys():
+                        self.data_filler.add_data_point(key,self.fastdata.all_fields[key])
+                looping_restart = looping_restart or self.data_filler._looping_restart
             
             # update the plots
             #self.data_filler.update_all_plots()
             self.data_filler.update_plot('pressure')
             self.data_filler.update_plot('flow')
             self.data_filler.update_plot('volume')
+            if block.n > 0 and not startup.finished():
+                startup.finish('first sample plotted')
             
             #check if the looping is restarting
-            if self.data_filler._looping_restart:
+            if looping_restart:
                 if True:
                     print('main: restarting loop on plots')
                 #self.update_vol_offset.emit(self.slowdata.t_last)
@@ -942,6 +1070,7 @@ class MainWindow(QtWidgets.QMainWindow):
         
         
         
+    @probes.timed('main.update_monitors')
     def update_monitors(self):
         """
         displayed_monitors:
@@ -971,17 +1100,7 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         
          # define the mapping between monitor names and data points   
-        self.monitor_mapping = {'peak' : self.breathpar.pip,
-                                'peep' : self.breathpar.peep,
-                                'minute_volume_measured' : self.slowdata.mve_meas,
-                                'tidal_volume' : self.breathpar.vt,
-                                'respiratory_rate': self.breathpar.rr,
-                                'i_to_e_ratio' : self.breathpar.ie,
-                                'cstat' : self.breathpar.c,
-                                'apnea_time' : self.slowdata.dt_last,
-                                'battery_low': self.slowdata.lowbatt,
-                                'battery_charging' : self.slowdata.charging}
-                    
+        self.monitor_mapping = self.get_monitor_values()
             
         for key in self.monitor_mapping.keys():
             try:
@@ -989,10 +1108,16 @@ class MainWindow(QtWidgets.QMainWindow):
                 if self.verbose:
                     print(f'main: adding to {key}: {value}')
                 self.data_filler.add_data_point(key,value)
-                self.data_filler.update_all_monitors()
             except Exception as e:
                 #print(f'main: could not update monitor {key}: ',e)
                 pass
+
+        # then show them, all at once
+        try:
+            self.data_filler.update_all_monitors()
+        except Exception as e:
+            #print(f'main: could not update monitors: ',e)
+            pass
         
         
         # update the p1 and p2 values in the rezero plot
@@ -1014,6 +1139,20 @@ class MainWindow(QtWidgets.QMainWindow):
             print('main: could not send data to guialarm: ',e)
         
             
+    def get_monitor_values(self):
+        # the current value of each monitor
+        return {'peak' : self.breathpar.pip,
+                'peep' : self.breathpar.peep,
+                'minute_volume_measured' : self.slowdata.mve_meas,
+                'tidal_volume' : self.breathpar.vt,
+                'respiratory_rate': self.breathpar.rr,
+                'i_to_e_ratio' : self.breathpar.ie,
+                'cstat' : self.breathpar.c,
+                'apnea_time' : self.slowdata.dt_last,
+                'battery_low': self.slowdata.lowbatt,
+                'battery_charging' : self.slowdata.charging}
+
+    @probes.timed('main.update_loop_plots')
     def update_loop_plots(self):
         self.line_left.setData(self.breathdata.p, self.breathdata.vol)
         self.line_right.setData(self.breathdata.p, self.breathdata.flow)
@@ -1059,17 +1198,18 @@ class MainWindow(QtWidgets.QMainWindow):
         
         # sends the stats for the selected statistic to the monitor
         stat = self.statset.stats[self.current_stat]
-        name = self.config['monitors'][self.current_stat]['name']
+        monitor = self.cfg.monitors[self.current_stat]
+        name = monitor.name
         self.stats_name.setText(name)
         self.stats_mean.setText('%0.2f'%stat.mean)
         self.stats_min.setText('%0.2f' %stat.min)
         self.stats_max.setText('%0.2f' %stat.max)
         self.stats_pcterr.setText('%0.2f' %stat.pcterr)
         self.stats_stderr.setText('%0.2f' %stat.stderr)
-        units = self.config['monitors'][self.current_stat]['units']
+        units = monitor.units
         self.stats_units.setText(units)
     
-        labelStyle = {'color': self.config['axis_line_color'], 'font-size': '18pt'}
+        labelStyle = {'color': self.cfg.axis_line_color, 'font-size': '18pt'}
         self.statplot.setLabel('left',name,units,**labelStyle)
         self.statplot.setLabel('bottom','Sample ','',**labelStyle)
         self.statline.setData(np.arange(len(stat.data)),  stat.data)
@@ -1084,7 +1224,7 @@ class MainWindow(QtWidgets.QMainWindow):
         #print(f'main: self.breathdata.tsi = {self.breathdata.tsi}')
         #print(f'main: self.breathdata.tei = {self.breathdata.tei}')
         #print(f'main: self.breathdata.tee = {self.breathdata.tee}')
-        self.update_loop_plots()
+        self.mark_dirty('loop_plots')
         self.new_breath_data.emit(self.breathdata)
     
     def update_breath_params(self,data):
@@ -1093,19 +1233,21 @@ class MainWindow(QtWidgets.QMainWindow):
             print("main: received new breath parameters from slowloop")
         self.breathpar = data
         print(f"main: peep = {self.breathpar.peep}")
-        self.update_monitors()
+        self.mark_dirty('monitors')
         
         
         # add the new data for the tracked statistics     
-        for name in self.config['statistics']:
+        values = self.get_monitor_values()
+        for name in self.cfg.statistics:
             try:
-                datapoint = self.monitor_mapping[name]
+                datapoint = values[name]
                 if True:#self.verbose:
                     print(f'adding  to statistics for {name}: {datapoint}')
                 self.statset.add_data_point(name,datapoint)
             except Exception as e:
                 print(f'main: could not update statistics for {name}',e)
-        self.update_displayed_stats()
+        self.trends.add(time.time(), values)
+        self.mark_dirty('stats')
         
         
     
@@ -1131,18 +1273,14 @@ class MainWindow(QtWidgets.QMainWindow):
             print("main: received new data from slowloop!")
         self.slowdata = data
         print(f"main: slowloop data: dt_last = {self.slowdata.dt_last}")
-        self.update_monitors()
+        self.mark_dirty('monitors')
         #os.system('cls' if os.name == 'nt' else 'clear')
         #data.print_data()
 
-    def slowloop_request(self):
-        if self.verbose:
-            print(f"main: received request for data from slowloop")
-        self.request_from_slowloop.emit(self.fastdata)
-        
     def start_fastloop(self):
         """
         Starts up the data acquisition fast loop
         """
         print('main: starting fastloop')
-        self.fast_loop.start()
\ No newline at end of file
+        self.fast_loop.start()
+        startup.mark('fastloop started')
\ No newline at end of file
@@ -3,7 +3,8 @@
 Main window helper
 """
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
+from utils.uicache import load_ui
 
 
 class MainDisplay(QtWidgets.QWidget):
@@ -18,4 +19,4 @@ class MainDisplay(QtWidgets.QWidget):
         Provides a passthrough to underlying widgets.
         """
         super(MainDisplay, self).__init__(*args)
-        uic.loadUi("maindisplay/maindisplay.ui", self)
+        load_ui("maindisplay/maindisplay.ui", self)
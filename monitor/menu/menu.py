@@ -3,7 +3,8 @@
 Menu bar helper.
 """
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
+from utils.uicache import load_ui
 
 
 class Menu(QtWidgets.QWidget):
@@ -18,4 +19,4 @@ class Menu(QtWidgets.QWidget):
         Grabs child widgets.
         """
         super(Menu, self).__init__(*args)
-        uic.loadUi("menu/menu.ui", self)
+        load_ui("menu/menu.ui", self)
@@ -3,8 +3,9 @@
 Bottom message bar that asks for user confirmation.
 """
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5 import QtCore
+from utils.uicache import load_ui
 
 
 class MessageBar(QtWidgets.QWidget):
@@ -20,7 +21,7 @@ class MessageBar(QtWidgets.QWidget):
         Grabs child widgets.
         """
         super(MessageBar, self).__init__(*args)
-        uic.loadUi("messagebar/messagebar.ui", self)
+        load_ui("messagebar/messagebar.ui", self)
 
         self.mainparent = parent
         self.bottombar = self.mainparent.bottombar
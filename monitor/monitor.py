@@ -12,15 +12,24 @@ This is the top level monitor script for the open source respiratory monitor
 @author: nlourie
 """
 
+# first, so the startup timeline includes the imports
+from utils import startup
+
 import sys
 import os
 import os.path
 from PyQt5 import QtCore, QtWidgets
 import yaml
+from datetime import datetime
 
 
 
 from gui import mainwindow
+from utils import probes
+from utils import uicache
+from utils import configcache
+
+startup.mark('imports')
 
 
 # add the main directory to the PATH
@@ -35,19 +44,24 @@ def main():
 
     settings_file = main_path + '/config/default_settings.yaml'
     print('settings file = ',settings_file)
-    with open(settings_file) as fsettings:
-        config = yaml.load(fsettings, Loader=yaml.FullLoader)
-    print('Config:', yaml.dump(config), sep='\n')
-
-
-    app = QtWidgets.QApplication(sys.argv)
+    # checked once and then read from the cache until the file changes
+    configcache.enable(not ('noconfigcache' in sys.argv))
+    config, cfg = configcache.load(settings_file)
 
     if 'verbose' in sys.argv:
         verbose = True
         print('running in verbose mode')
+        print('Config:', yaml.dump(config), sep='\n')
     else:
         verbose = False
 
+    # build the widgets from the compiled .ui files unless told not to
+    uicache.enable(config.get('ui_cache', True) and not ('nouicache' in sys.argv))
+    startup.mark('config')
+
+    app = QtWidgets.QApplication(sys.argv)
+    startup.mark('qt application')
+
     if 'sim' in sys.argv:
         simulation = True
         print('running in simulation mode')
@@ -74,19 +88,32 @@ def main():
     else:
         diagnostic = False
 
+    # time the loops and GUI updates (always on in diagnostic mode)
+    if ('probes' in sys.argv) or diagnostic:
+        probes.enable()
+        print('timing probes enabled')
+
     if 'help' in sys.argv:
         print_help()
 
     try:
-        window = mainwindow.MainWindow(config = config, main_path = main_path, mode = mode, diagnostic = diagnostic, simulation = simulation, logdata = logdata, verbose = verbose)
+        window = mainwindow.MainWindow(config = config, cfg = cfg, main_path = main_path, mode = mode, diagnostic = diagnostic, simulation = simulation, logdata = logdata, verbose = verbose)
     except Exception as e:
         print("Problem running app: ",e)
         print_help()
 
+    startup.mark('main window')
     print('opening app')
     window.show()
+    startup.mark('main window shown')
     app.exec_()
 
+    if probes.enabled():
+        filename = str(int(datetime.utcnow().timestamp())) + '_timing.txt'
+        probes.dump(filename)
+        print('\n'.join(probes.report()))
+        print(f'timing probes written to {filename}')
+
 def print_help():
     print('Help File for monitor.py:')
 
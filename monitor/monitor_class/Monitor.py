@@ -4,8 +4,9 @@ Module that implements the widget for monitored values, with alarm
 indication and snooze control.
 """
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5 import QtGui
+from utils.uicache import load_ui
 
 
 class Monitor(QtWidgets.QWidget):
@@ -25,7 +26,7 @@ class Monitor(QtWidgets.QWidget):
 
         """
         super(Monitor, self).__init__(*args)
-        uic.loadUi("monitor_class/monitor.ui", self)
+        load_ui("monitor_class/monitor.ui", self)
         self.config = config
         self.configname = name
 
@@ -65,6 +66,9 @@ class Monitor(QtWidgets.QWidget):
         self.disp_type = entry.get("disp_type", monitor_default["disp_type"])
         self.gui_alarm = None
 
+        # what the value label and bar were last set to
+        self._shown_value = None
+
         self.refresh()
         self.set_alarm_state(False)
         self.update_value(self.value)
@@ -223,5 +227,8 @@ class Monitor(QtWidgets.QWidget):
         if self.map != {}:
             string_value = self.map.get(value, string_value)
 
-        self.label_value.setText(string_value)
-        self.bar_value.setValue(self.value)
+        # only touch the widgets if what they show has changed
+        if self._shown_value != (string_value, self.value):
+            self._shown_value = (string_value, self.value)
+            self.label_value.setText(string_value)
+            self.bar_value.setValue(self.value)
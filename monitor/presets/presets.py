@@ -4,7 +4,8 @@ Widget for showing user some preset values for quickly changing
 a setting.
 """
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
+from utils.uicache import load_ui
 
 class Presets(QtWidgets.QWidget):
     """
@@ -31,7 +32,7 @@ class Presets(QtWidgets.QWidget):
         - args: Other arguments for QtWidgets.QWidget
         """
         super(Presets, self).__init__(*args)
-        uic.loadUi("presets/presets.ui", self)
+        load_ui("presets/presets.ui", self)
 
         # get the buttons from the preset dialog
         self.button_cancel = self.findChild(QtWidgets.QPushButton, "button_cancel")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+acquisition.py
+
+This defines a worker thread which polls the sensor on a fixed schedule, and
+a buffer that hands the timestamped samples over to the fast loop in blocks.
+
+The fast loop runs off a QTimer in a Qt event loop, so anything that holds up
+that event loop (GC, signal dispatch, the GUI thread hogging the GIL) used to
+show up directly as jitter in the sample times. Here the sensor is read from
+a plain python thread against the monotonic clock, and the fast loop just
+takes whatever samples have piled up each time it runs.
+
+"""
+
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+
+class sample_buffer(object):
+    """
+    Single producer, single consumer buffer of timestamped sensor samples.
+
+    The acquisition thread is the only thing that writes to it (put), and the
+    fast loop is the only thing that reads from it (get_block). The producer
+    only ever moves the write counter and the consumer only ever moves the
+    read counter, and a sample is written before the write counter is moved
+    past it, so no lock is needed.
+
+    Each row holds:
+        t    = time of the sample in seconds (same clock as the rest of the code)
+        p1   = pressure @ sensor 1 in cmH20
+        p2   = pressure @ sensor 2 in cmH20
+        dp   = differential pressure in cmH20
+        flow = flow in slpm
+    """
+    fields = ('t', 'p1', 'p2', 'dp', 'flow')
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._data = np.zeros((self.capacity, len(self.fields)))
+
+        # total samples written and read. only the producer changes _written and
+        # only the consumer changes _read
+        self._written = 0
+        self._read = 0
+
+        # number of samples thrown away because the consumer didn't keep up
+        self.dropped = 0
+
+    def __len__(self):
+        return self._written - self._read
+
+    def put(self, t, p1, p2, dp, flow):
+        # called by the producer. returns False if the buffer was full and the sample was dropped
+        written = self._written
+        if written - self._read >= self.capacity:
+            self.dropped += 1
+            return False
+
+        row = self._data[written % self.capacity]
+        row[0] = t
+        row[1] = p1
+        row[2] = p2
+        row[3] = dp
+        row[4] = flow
+
+        # publish the sample
+        self._written = written + 1
+        return True
+
+    def get_block(self, max_samples = None):
+        # called by the consumer. returns a copy of all the samples waiting in the
+        # buffer (oldest first) as an array of shape (n_samples, len(fields))
+        read = self._read
+        n = self._written - read
+        if not max_samples is None:
+            n = min(n, max_samples)
+
+        start = read % self.capacity
+        n_first = min(n, self.capacity - start)
+        block = np.empty((n, len(self.fields)))
+        block[:n_first] = self._data[start:start + n_first]
+        block[n_first:] = self._data[:n - n_first]
+
+        # free up the space for the producer
+        self._read = read + n
+        return block
+
+
+class acquisition_thread(threading.Thread):
+    """
+    Reads the sensor every `interval` ms and puts the samples in a sample_buffer.
+
+    The read schedule is kept against time.monotonic(), so the samples don't
+    drift if one read takes a bit longer. If a read stalls for more than a
+    full interval the missed slots are skipped (and counted) rather than
+    trying to catch up with a burst of back to back reads.
+    """
+
+    def __init__(self, sensor, interval, buffer_size = 1024, verbose = False):
+        threading.Thread.__init__(self, name = 'acquisition')
+        # don't keep the program alive just for this thread
+        self.daemon = True
+
+        self.sensor = sensor
+        self.verbose = verbose
+
+        # time between sensor reads (ms)
+        self.interval = interval
+
+        # where the samples go
+        self.buffer = sample_buffer(buffer_size)
+
+        # number of read slots skipped because we fell behind
+        self.overruns = 0
+
+        # number of failed sensor reads
+        self.read_errors = 0
+
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        period = self.interval/1000.0
+
+        # the sample times are taken from the monotonic clock, but converted to
+        # the same timestamps the rest of the code uses
+        t0_mono = time.monotonic()
+        t0 = datetime.utcnow().timestamp()
+
+        if self.verbose:
+            print(f"acquisition: starting sensor reads every {self.interval} ms")
+
+        self.running = True
+        next_read = t0_mono
+        while self.running:
+            wait = next_read - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            t_read = time.monotonic()
+            try:
+                self.sensor.read()
+                self.buffer.put(t0 + (t_read - t0_mono),
+                                self.sensor.p1, self.sensor.p2, self.sensor.dp, self.sensor.flow)
+            except Exception as e:
+                self.read_errors += 1
+                print("acquisition: could not read sensor: ",e)
+
+            next_read += period
+
+            # if we're more than a whole period behind, skip the missed reads
+            behind = time.monotonic() - next_read
+            if behind > period:
+                missed = int(behind/period)
+                self.overruns += missed
+                next_read += missed*period
+                if self.verbose:
+                    print(f"acquisition: fell behind, skipped {missed} reads")
+
+        if self.verbose:
+            print("acquisition: stopped")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+flowcal.py
+
+Flow calibration: converts the differential pressure across the mouthpiece
+(cmH20) to flow (slpm) using the polynomial in the mouthpiece calibration file,
+    flow = sign(dp) * polyval(coeffs, |dp|)
+
+The sensor calls this once per sample, and for a single float np.polyval
+spends most of its time building arrays, so the polynomial is evaluated
+here with Horner's method in plain python floats. Blocks of samples go
+through numpy, and there is an optional lookup table for when speed
+matters more than the last few digits.
+
+A flow_calibration is never changed once it's made: the sensor, the
+acquisition thread and the replay engine can share one, and a different
+table is a different object.
+
+"""
+
+import numpy as np
+
+
+# calibrations that have already been loaded, by (filename, table range). the
+# files never change while we're running so switching mouthpiece doesn't reload them
+_calibrations = dict()
+
+
+def load_flow_calibration(calfile, lut_dp_max = None):
+    # get the calibration for the file, only reading it the first time.
+    # lut_dp_max (cmH20) builds a lookup table up to that dp, None or 0 for none
+    lut_dp_max = float(lut_dp_max) if lut_dp_max else None
+    key = (calfile, lut_dp_max)
+    if not key in _calibrations:
+        coeffs = np.loadtxt(calfile, delimiter = '\t', skiprows = 1)
+        _calibrations[key] = flow_calibration(coeffs, lut_dp_max = lut_dp_max)
+    return _calibrations[key]
+
+
+class flow_calibration(object):
+    """
+    Constituents:
+        coeffs      =   polynomial coefficients, highest power first (np.polyval order)
+        lut_dp_max  =   top of the lookup table range in cmH20, None if there's no table
+    """
+
+    def __init__(self, coeffs, lut_dp_max = None, n_points = 4096):
+        self.coeffs = np.atleast_1d(np.asarray(coeffs, dtype = float))
+        self._coeffs = [float(c) for c in self.coeffs]
+
+        # the lookup table, if asked for one
+        self.lut_dp_max = None
+        self._lut = None
+        if lut_dp_max:
+            self._build_lut(float(lut_dp_max), n_points)
+
+    def __call__(self, dp):
+        # convert a single dp or an array of them
+        if np.ndim(dp) == 0:
+            return self.flow(dp)
+        return self.flow_block(dp)
+
+    def flow(self, dp):
+        # scalar path: Horner's method, in the same order of operations as np.polyval
+        dp = float(dp)
+        if dp > 0:
+            sign = 1.0
+        elif dp < 0:
+            sign = -1.0
+            dp = -dp
+        else:
+            # zero (or nan) goes straight through
+            return dp
+
+        if not self._lut is None and dp < self.lut_dp_max:
+            # linear interpolation in the table
+            x = dp*self._lut_scale
+            i = min(int(x), self._lut_imax)
+            frac = x - i
+            lut = self._lut_values
+            return sign*(lut[i] + frac*(lut[i + 1] - lut[i]))
+
+        y = 0.0
+        for c in self._coeffs:
+            y = y*dp + c
+        return sign*y
+
+    def flow_block(self, dp):
+        # vectorized path for an array of dp
+        dp = np.asarray(dp, dtype = float)
+        abs_dp = np.abs(dp)
+        if self._lut is None:
+            flow = np.polyval(self.coeffs, abs_dp)
+        else:
+            flow = np.interp(abs_dp, self._lut_dp, self._lut)
+            outside = abs_dp >= self.lut_dp_max
+            if np.any(outside):
+                flow[outside] = np.polyval(self.coeffs, abs_dp[outside])
+        return np.sign(dp)*flow
+
+    def _build_lut(self, dp_max, n_points):
+        """
+        Tabulate the polynomial on n_points evenly spaced dp values in [0, dp_max].
+        Samples inside the range are linearly interpolated from the table, and
+        anything beyond it still goes through the polynomial. The error is
+        bounded by the polynomial's curvature times the square of the spacing.
+        Only called from __init__, before anyone can use the table.
+        """
+        self._lut_dp = np.linspace(0.0, dp_max, n_points)
+        self._lut = np.polyval(self.coeffs, self._lut_dp)
+        self._lut_scale = (n_points - 1)/dp_max
+        self._lut_imax = n_points - 2
+        self._lut_values = self._lut.tolist()
+        self.lut_dp_max = dp_max
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+rawlog.py
+
+Binary log format for the raw sensor data.
+
+The file is a short header followed by fixed size records of float64, one
+value per field:
+
+    magic       8 bytes     b'ORMRAW01'
+    length      uint32      length of the json header text in bytes
+    header      json        {"fields": ["t", "p1", "p2", "dp"], "dtype": "<f8", ...}
+    padding     zeros up to the next multiple of 8 bytes
+    records     n_records x n_fields float64
+
+Since it's just a flat array after the header, a log can be opened as an
+np.memmap and used straight away no matter how long it is, instead of
+parsing hours of text with np.loadtxt. Records only ever get appended, so
+a log that is still being written (or was cut off by a crash) can be read
+too: a partly written last record is ignored.
+
+The writer collects the samples into chunks and a background thread writes
+the full chunks to disk, so a slow SD card doesn't hold up the fast loop.
+
+Run it with a text *_sensor_raw.txt file to convert it:
+    python rawlog.py 1590534414_sensor_raw.txt
+
+"""
+
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+
+MAGIC = b'ORMRAW01'
+DTYPE = np.dtype('<f8')
+
+# fields that the fast loop logs
+SENSOR_FIELDS = ('t', 'p1', 'p2', 'dp')
+
+
+def _pack_header(fields, info = None):
+    header = {'fields': list(fields), 'dtype': DTYPE.str, 'version': 1,
+              'created': datetime.utcnow().timestamp()}
+    if not info is None:
+        header.update(info)
+    text = json.dumps(header).encode('utf-8')
+    head = MAGIC + struct.pack('<I', len(text)) + text
+
+    # pad so the records start 8 byte aligned
+    head += b'\0'*(-len(head) % 8)
+    return head
+
+
+def _unpack_header(f):
+    # reads the header from the open file, returns (header dict, offset of first record)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('not a binary raw sensor log')
+    (length,) = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(length).decode('utf-8'))
+    offset = len(MAGIC) + 4 + length
+    offset += -offset % 8
+    return header, offset
+
+
+def is_raw_log(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class raw_log_writer(object):
+    """
+    Writes records to a binary raw log from a background thread.
+
+    write() and write_columns() just copy the values into the current chunk.
+    When a chunk fills up (or flush_interval seconds have gone by since the
+    last one was handed off) it is put on a queue for the writer thread,
+    and a fresh chunk is started.
+
+    Constituents:
+        filename        =   file being written
+        fields          =   names of the values in each record
+        chunk_size      =   number of records per chunk
+        flush_interval  =   max time in seconds samples sit in memory
+    """
+
+    def __init__(self, filename, fields = SENSOR_FIELDS, chunk_size = 512, flush_interval = 1.0, info = None):
+        self.filename = filename
+        self.fields = tuple(fields)
+        self.chunk_size = int(chunk_size)
+        self.flush_interval = flush_interval
+
+        self._file = open(filename, 'wb')
+        self._file.write(_pack_header(self.fields, info))
+        self._file.flush()
+
+        self._chunk = np.empty((self.chunk_size, len(self.fields)), dtype = DTYPE)
+        self._n = 0
+        self._t_flush = time.monotonic()
+
+        # number of records handed to the writer thread
+        self.records = 0
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target = self._run, name = 'rawlog', daemon = True)
+        self._thread.start()
+
+    def write(self, *values):
+        # add one record
+        self._chunk[self._n] = values
+        self._n += 1
+        self._check_chunk()
+
+    def write_columns(self, *columns):
+        # add a block of records given one array per field
+        n_new = len(columns[0])
+        start = 0
+        while start < n_new:
+            n = min(n_new - start, self.chunk_size - self._n)
+            for i, column in enumerate(columns):
+                self._chunk[self._n:self._n + n, i] = column[start:start + n]
+            self._n += n
+            start += n
+            self._check_chunk()
+
+    def _check_chunk(self):
+        if self._n == self.chunk_size or (time.monotonic() - self._t_flush) > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        # hand whatever is in the current chunk over to the writer thread
+        if self._n > 0:
+            self._queue.put(self._chunk[:self._n])
+            self.records += self._n
+            self._chunk = np.empty((self.chunk_size, len(self.fields)), dtype = DTYPE)
+            self._n = 0
+        self._t_flush = time.monotonic()
+
+    def close(self):
+        # write out everything left and close the file
+        if self._file is None:
+            return
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        self._file = None
+
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            try:
+                self._file.write(chunk.tobytes())
+                self._file.flush()
+            except Exception as e:
+                print("rawlog: could not write to log file: ",e)
+
+
+class raw_log(object):
+    """
+    A binary raw log opened for reading.
+
+    Constituents:
+        header  =   dict from the file header
+        fields  =   names of the values in each record
+        data    =   np.memmap of the records, shape (n_records, n_fields)
+
+    log['p1'] (or log.column('p1')) is a view of one field over all records.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.header, offset = _unpack_header(f)
+        self.fields = tuple(self.header['fields'])
+        dtype = np.dtype(self.header.get('dtype', DTYPE.str))
+
+        record_size = dtype.itemsize*len(self.fields)
+        n_records = (os.path.getsize(filename) - offset)//record_size
+        if n_records > 0:
+            self.data = np.memmap(filename, dtype = dtype, mode = 'r', offset = offset, shape = (n_records, len(self.fields)))
+        else:
+            self.data = np.empty((0, len(self.fields)), dtype = dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def column(self, name):
+        return self.data[:, self.fields.index(name)]
+
+
+def load_sensor_data(filename, skiprows = 0):
+    """
+    Loads the time, p1, p2 and dp columns of a sensor log, either binary or
+    the old text format. For the text format skiprows includes the header
+    line; for the binary format it's the number of records to skip.
+    """
+    if is_raw_log(filename):
+        log = raw_log(filename)
+        return tuple(log.column(name)[skiprows:] for name in SENSOR_FIELDS)
+    else:
+        # the text logs start with a 'time p1 p2 dp' header line (with the first sample stuck on the end)
+        if skiprows == 0:
+            with open(filename) as f:
+                if f.readline().startswith('time'):
+                    skiprows = 1
+        return tuple(np.loadtxt(filename, delimiter = '\t', skiprows = skiprows, unpack = True))
+
+
+def convert_text_log(filename, outfile = None):
+    # converts a text sensor log to the binary format, returns the new filename
+    if outfile is None:
+        outfile = os.path.splitext(filename)[0] + '.bin'
+    columns = np.loadtxt(filename, delimiter = '\t', skiprows = 1, unpack = True)
+    writer = raw_log_writer(outfile, fields = SENSOR_FIELDS, info = {'source': os.path.basename(filename)})
+    writer.write_columns(*columns)
+    writer.close()
+    return outfile
+
+
+if __name__ == "__main__":
+    for filename in sys.argv[1:]:
+        outfile = convert_text_log(filename)
+        print(f"rawlog: converted {filename} to {outfile} ({len(raw_log(outfile))} records)")
@@ -35,6 +35,13 @@ except Exception as e:
 main_path = os.path.dirname(os.getcwd())
 sys.path.insert(1, main_path)
 
+from sensor import flowcal
+from sensor import rawlog
+
+# flow calibration file for each mouthpiece, relative to the main path
+calibration_files = {'hamilton' : '/calibration/flow_calibration_hamilton.txt',
+                     'iqspiro'  : '/calibration/flow_calibration_iqspiro.txt'}
+
 
 class sensor(object):
 
@@ -55,7 +62,7 @@ class sensor(object):
         flow = flow in slpm
     """
 
-    def __init__(self,main_path, mouthpiece = 'hamilton',dp_thresh = 0.0,verbose = False):
+    def __init__(self,main_path, mouthpiece = 'hamilton',dp_thresh = 0.0,lut_dp_max = None,verbose = False):
 
         # run in verbose mode?
         self.verbose = verbose
@@ -90,6 +97,9 @@ class sensor(object):
         # Load the flow calibration polynomial coefficients
         self.main_path = main_path
 
+        # dp range of the flow calibration lookup table, None to use the polynomial
+        self.lut_dp_max = lut_dp_max
+
 
         # define the calibration file based on the mouthpiece
         self.set_mouthpiece(mouthpiece)
@@ -126,20 +136,17 @@ class sensor(object):
         # define the calibration file based on the mouthpiece
         self.mouthpiece = mouthpiece
         print('sensor: set calibration to: ',self.mouthpiece)
-        if self.mouthpiece.lower() == 'hamilton':
-            self.calfile = '/calibration/flow_calibration_hamilton.txt'
-        elif self.mouthpiece.lower() == 'iqspiro':
-            self.calfile = '/calibration/flow_calibration_iqspiro.txt'
-        else:
+        if not self.mouthpiece.lower() in calibration_files:
             raise ImportError('specified mouthpiece not defined')
+        self.calfile = calibration_files[self.mouthpiece.lower()]
         
-        # now load the calibration data for the mouthpiece
-        self.flowcal = np.loadtxt(self.main_path + self.calfile,delimiter = '\t',skiprows = 1)
+        # now load the calibration data for the mouthpiece (cached after the first time)
+        self.calibration = flowcal.load_flow_calibration(self.main_path + self.calfile, lut_dp_max = self.lut_dp_max)
+        self.flowcal = self.calibration.coeffs
             
     def dp2flow(self,dp_cmh20):
-        flow_sign = np.sign(dp_cmh20)
-        flow = flow_sign*np.polyval(self.flowcal,np.abs(dp_cmh20))
-        return flow
+        # works on a single dp or an array of them
+        return self.calibration(dp_cmh20)
     
     def update_ambient_pressure(self):
         samples = 5
@@ -246,18 +253,30 @@ class fakesensor(object):
         dp = differential pressure (p2 - p1) in cmH20
     """
 
-    def __init__(self,main_path, mouthpiece = 'iqspiro',datafile = '/calibration/Simulated_Data.txt',dp_thresh = 0.0,verbose = False):
+    def __init__(self,main_path, mouthpiece = 'iqspiro',datafile = '/calibration/Simulated_Data.txt',dp_thresh = 0.0,realtime = False,speed = 1.0,lut_dp_max = None,verbose = False):
         #datafile = '/calibration/1590534414_sensor_raw.txt'
         self.datafile = main_path + datafile
         self.verbose = verbose
-        self.time_arr,self.p1_arr,self.p2_arr,self.dp_arr = np.loadtxt(self.datafile,delimiter = '\t',skiprows = 100,unpack = True)
+        # the recording can be either a text or binary (rawlog) sensor log
+        self.time_arr,self.p1_arr,self.p2_arr,self.dp_arr = rawlog.load_sensor_data(self.datafile,skiprows = 100)
         
         self.linenum = 0
         
         self.lastline = len(self.time_arr)-1
+
+        # in realtime mode each read returns the sample recorded at the time
+        # that has passed since the first read (times speed), instead of just
+        # the next line. the recording loops around when it runs out
+        self.realtime = realtime
+        self.speed = speed
+        self.t_start = None
+        self.duration = self.time_arr[self.lastline] - self.time_arr[0]
         
         # Load the flow calibration polynomial coefficients
         self.main_path = main_path
+
+        # dp range of the flow calibration lookup table, None to use the polynomial
+        self.lut_dp_max = lut_dp_max
         
         # define the calibration file based on the mouthpiece
         self.set_mouthpiece(mouthpiece)
@@ -290,20 +309,17 @@ class fakesensor(object):
         # define the calibration file based on the mouthpiece
         self.mouthpiece = mouthpiece
         print('sensor: set calibration to: ',self.mouthpiece)
-        if self.mouthpiece.lower() == 'hamilton':
-            self.calfile = '/calibration/flow_calibration_hamilton.txt'
-        elif self.mouthpiece.lower() == 'iqspiro':
-            self.calfile = '/calibration/flow_calibration_iqspiro.txt'
-        else:
+        if not self.mouthpiece.lower() in calibration_files:
             raise ImportError('specified mouthpiece not defined')
+        self.calfile = calibration_files[self.mouthpiece.lower()]
         
-        # now load the calibration data for the mouthpiece
-        self.flowcal = np.loadtxt(self.main_path + self.calfile,delimiter = '\t',skiprows = 1)
+        # now load the calibration data for the mouthpiece (cached after the first time)
+        self.calibration = flowcal.load_flow_calibration(self.main_path + self.calfile, lut_dp_max = self.lut_dp_max)
+        self.flowcal = self.calibration.coeffs
             
     def dp2flow(self,dp_cmh20):
-        flow_sign = np.sign(dp_cmh20)
-        flow = flow_sign*np.polyval(self.flowcal,np.abs(dp_cmh20))
-        return flow
+        # works on a single dp or an array of them
+        return self.calibration(dp_cmh20)
 
     def rezero(self):
         self.p1_offset = self.p1
@@ -330,12 +346,23 @@ class fakesensor(object):
 
     def read(self):
 
+        if self.realtime:
+            # find the line that was recorded at this point in the replay
+            if self.t_start is None:
+                self.t_start = time.monotonic()
+            elapsed = (time.monotonic() - self.t_start)*self.speed
+            t_rec = self.time_arr[0] + elapsed % self.duration
+            self.linenum = min(int(np.searchsorted(self.time_arr, t_rec, side = 'right')) - 1, self.lastline - 1)
+
         # read the fake data from the current line
         self.p1 = self.p1_arr[self.linenum] - self.p1_offset
         self.p2 = self.p2_arr[self.linenum] - self.p2_offset
         self.dp = (self.p2 - self.p1) - self.dp_offset
         # Calculate the flow
         self.flow = self.dp2flow(self.dp)
+        if self.realtime:
+            return
+
         # increment the line number
         self.linenum += 1
 
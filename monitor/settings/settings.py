@@ -5,11 +5,12 @@ Settings ui helper
 
 import sys
 import copy
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from presets.presets import Presets
 from messagebox import MessageBox
 from communication import ESP32Exception
 from .settingsfile import SettingsFile
+from utils.uicache import load_ui
 
 
 class Settings(QtWidgets.QMainWindow):
@@ -24,7 +25,7 @@ class Settings(QtWidgets.QMainWindow):
         Initialized the Settings overlay widget.
         """
         super(Settings, self).__init__(*args)
-        uic.loadUi("settings/settings.ui", self)
+        load_ui("settings/settings.ui", self)
 
         self._debug = True
         self.mainparent = mainparent
@@ -3,7 +3,8 @@
 Settings bar helper
 """
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
+from utils.uicache import load_ui
 
 
 class SettingsBar(QtWidgets.QWidget):
@@ -18,4 +19,4 @@ class SettingsBar(QtWidgets.QWidget):
         Provides a passthrough to underlying widgets.
         """
         super(SettingsBar, self).__init__(*args)
-        uic.loadUi("settings/settingsbar.ui", self)
+        load_ui("settings/settingsbar.ui", self)
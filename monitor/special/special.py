@@ -4,9 +4,10 @@ This module handles the Special Operations for the MVM GUI.
 This includes country-specific-procedurings, pause functions, and freezing functions.
 """
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5 import QtCore
 from messagebox import MessageBox
+from utils.uicache import load_ui
 
 
 class SpecialBar(QtWidgets.QWidget):
@@ -20,7 +21,7 @@ class SpecialBar(QtWidgets.QWidget):
         Provides a passthrough to underlying widgets.
         """
         super(SpecialBar, self).__init__(*args)
-        uic.loadUi("special/special.ui", self)
+        load_ui("special/special.ui", self)
 
         self.button_expause.pressed.connect(
             lambda: self.paused_pressed('pause_exhale'))
@@ -60,9 +61,24 @@ class SpecialBar(QtWidgets.QWidget):
 
     def _get_lung_recruit_eta(self):
         """
-        Retrieves the Lungh Recruitment ETA from the esp32 and displays the result in Stop button
+        Asks the esp32 for the Lungh Recruitment ETA, _show_lung_recruit_eta displays it
         """
-        eta = float(self._esp32.get("pause_lg_time"))
+        self._esp32.get_async("pause_lg_time", self._show_lung_recruit_eta)
+
+    def _show_lung_recruit_eta(self, request):
+        """
+        Displays the Lungh Recruitment ETA in the Stop button, once the esp32 has replied
+
+        arguments:
+        - request: the ESP32Request of the ETA
+        """
+        if not self._lung_recruit:
+            return
+        try:
+            eta = float(request.result())
+        except Exception as error:
+            print("SpecialBar: could not get the lung recruitment ETA:", error)
+            return
         if eta == 0:
             self.stop_lung_recruit()
             self._lung_recruit_timer.stop()
@@ -80,9 +96,10 @@ class SpecialBar(QtWidgets.QWidget):
         self.button_lung_recruit.setText(
             "Stop\nLung Recruitment\n %d" % lr_time)
 
-        self._esp32.set("pause_lg_p", lr_pres)
-        self._esp32.set("pause_lg_time", lr_time)
-        self._esp32.set("pause_lg", 1)
+        # queued, the esp32 gets them in this order
+        self._esp32.set_async("pause_lg_p", lr_pres)
+        self._esp32.set_async("pause_lg_time", lr_time)
+        self._esp32.set_async("pause_lg", 1)
 
         self._lung_recruit_timer = QtCore.QTimer()
         self._lung_recruit_timer.timeout.connect(self._get_lung_recruit_eta)
@@ -93,7 +110,7 @@ class SpecialBar(QtWidgets.QWidget):
         Stops the lung recruitment procedure
         """
         self._lung_recruit = False
-        self._esp32.set("pause_lg", 0)
+        self._esp32.set_async("pause_lg", 0)
         self._lung_recruit_timer.stop()
         self.button_lung_recruit.setText("Country-Specific\nProcedures")
 
@@ -53,9 +53,13 @@ class StartStopWorker():
 
         self._backup_ackowledged = False
 
-        self._esp32_io()
+        # the status is read from the ESP asynchronously: _polling is True
+        # while a read is queued, and the settings panel is initialized when
+        # the first status arrives
+        self._polling = False
+        self._settings_initialized = False
 
-        self._init_settings_panel()
+        self._esp32_io()
 
         self._timer = QTimer()
         self._timer.timeout.connect(self._esp32_io)
@@ -79,37 +83,76 @@ class StartStopWorker():
         else:
             # If the ESP is running, read the current
             # parameters from the ESP and set those
-            # values to the settings panels
-            for param, esp_name in self._config['esp_settable_param'].items():
-                value = float(self._esp32.get(esp_name))
-                print('Reading Settings parameters from ESP:', param, value)
-                if esp_name == 'ratio':
-                    converted_value = (value**-1 - 1)**-1
-                    self._settings.update_spinbox_value(param, converted_value)
-                else:
-                    self._settings.update_spinbox_value(param, value)
+            # values to the settings panels.
+            # The gets are sent as one batch and the replies
+            # are handled in _settings_received.
+            self._esp32.get_many_async(self._config['esp_settable_param'].values(),
+                                       self._settings_received)
 
-    def _esp32_io(self):
-        '''
-        The callback function called every time the
-        QTimer times out.
+    def _settings_received(self, request):
         '''
+        Sets the parameters read from the ESP in the
+        settings panel.
 
+        arguments:
+        - request: the ESP32Request of the batch of gets
+        '''
         try:
-            self._call_esp32()
+            values = request.result()
         except ESP32Exception as error:
             self._raise_comm_error(str(error))
+            return
+
+        for param, esp_name in self._config['esp_settable_param'].items():
+            value = float(values[esp_name])
+            print('Reading Settings parameters from ESP:', param, value)
+            if esp_name == 'ratio':
+                converted_value = (value**-1 - 1)**-1
+                self._settings.update_spinbox_value(param, converted_value)
+            else:
+                self._settings.update_spinbox_value(param, value)
+
+    def _esp32_io(self):
+        '''
+        The callback function called every time the
+        QTimer times out. Doesn't wait for the ESP:
+        if the last status hasn't arrived yet it
+        does nothing.
+        '''
+
+        if self._polling:
+            return
+        self._polling = True
+        self._call_esp32()
 
     def _call_esp32(self):
         '''
-        Gets the run, mode and backup vairables
-        from the ESP, and passes them to the
+        Queues the gets of the run, mode and backup
+        variables from the ESP, as one batch.
+        _status_received passes them to the
         StartStopWorker class.
         '''
 
-        run = int(self._esp32.get('run'))
-        mode = int(self._esp32.get('mode'))
-        backup = int(self._esp32.get('backup'))
+        self._esp32.get_many_async(['run', 'mode', 'backup'], self._status_received)
+
+    def _status_received(self, request):
+        '''
+        Handles the run, mode and backup variables
+        from the ESP, on the GUI thread.
+
+        arguments:
+        - request: the ESP32Request of the batch of gets
+        '''
+        self._polling = False
+        try:
+            values = request.result()
+        except ESP32Exception as error:
+            self._raise_comm_error(str(error))
+            return
+
+        run = int(values['run'])
+        mode = int(values['mode'])
+        backup = int(values['backup'])
 
         if backup:
             if not self._backup_ackowledged:
@@ -118,11 +161,13 @@ class StartStopWorker():
         else:
             self._backup_ackowledged = False
 
-        if run == self._run and mode == self._mode:
-            return
+        if run != self._run or mode != self._mode:
+            self.set_run(run)
+            self.set_mode(mode)
 
-        self.set_run(run)
-        self.set_mode(mode)
+        if not self._settings_initialized:
+            self._settings_initialized = True
+            self._init_settings_panel()
 
     def _open_backup_warning(self):
         '''
@@ -178,9 +223,22 @@ class StartStopWorker():
         Toggles between desired mode (MODE_PCV or MODE_PSV).
         """
         if self._mode == self.MODE_PCV:
-            result = self._esp32.set('mode', self.MODE_PSV)
+            self._esp32.set_async('mode', self.MODE_PSV,
+                                  lambda request: self._mode_set(request, self.MODE_PSV))
+        else:
+            self._esp32.set_async('mode', self.MODE_PCV,
+                                  lambda request: self._mode_set(request, self.MODE_PCV))
+
+    def _mode_set(self, request, mode):
+        '''
+        Called when the ESP has replied to setting the mode.
 
-            if result:
+        arguments:
+        - request: the ESP32Request of the set
+        - mode: the mode that was set
+        '''
+        if mode == self.MODE_PSV:
+            if self._result(request):
                 self._mode_text = "PSV"
                 self._button_mode.setText("Set\nPCV")
                 self.update_startstop_text()
@@ -189,9 +247,7 @@ class StartStopWorker():
                 self._raise_comm_error('Cannot set PSV mode.')
 
         else:
-            result = self._esp32.set('mode', self.MODE_PCV)
-
-            if result:
+            if self._result(request):
                 self._mode_text = "PCV"
                 self._button_mode.setText("Set\nPSV")
                 self.update_startstop_text()
@@ -199,6 +255,18 @@ class StartStopWorker():
             else:
                 self._raise_comm_error('Cannot set PCV mode.')
 
+    @staticmethod
+    def _result(request):
+        '''
+        Returns the result of a finished ESP32Request,
+        or None if it failed.
+        '''
+        try:
+            return request.result()
+        except ESP32Exception as error:
+            print('StartStopWorker: ESP request failed:', error)
+            return None
+
     def update_startstop_text(self):
         '''
         Updates the text in the Start/Stop button
@@ -215,9 +283,13 @@ class StartStopWorker():
         Callback for when the Start button is pressed
         '''
         # Send signal to ESP to start running
-        result = self._esp32.set('run', self.DO_RUN)
+        self._esp32.set_async('run', self.DO_RUN, self._started)
 
-        if result:
+    def _started(self, request):
+        '''
+        Called when the ESP has replied to the start
+        '''
+        if self._result(request):
             self._run = self.DO_RUN
             self.show_stop_button()
         else:
@@ -246,9 +318,13 @@ class StartStopWorker():
         Callback for when the Stop button is pressed
         '''
         # Send signal to ESP to stop running
-        result = self._esp32.set('run', self.DONOT_RUN)
+        self._esp32.set_async('run', self.DONOT_RUN, self._stopped)
 
-        if result:
+    def _stopped(self, request):
+        '''
+        Called when the ESP has replied to the stop
+        '''
+        if self._result(request):
             self._run = self.DONOT_RUN
             self.show_start_button()
         else:
@@ -6,35 +6,53 @@ Created on Tue Jun  2 12:55:04 2020
 @author: nlourie
 """
 
+import math
 import numpy as np
 
-def add_new_point(arr,new_point,maxlen):
-       # adds a new data point to the array,
-       # and keeps gets rid of the oldest point
-
-       if len(arr) < maxlen:
-           arr = np.append(arr,new_point)
-       else:
-           arr[:-1] = arr[1:]
-           arr[-1] = new_point
-
-       return arr
+from utils.estimators import RunningStats, WindowedVariance, WindowedMinMax, QuantileSketch
 
 
 class Stats():
     """
-    this calculates and stores the statistics on an array
+    this keeps the statistics of a tracked variable, updated as each point
+    comes in rather than recalculated from all the points:
+        - over the last maxlen points: n_points, mean, min, max, stderr, pcterr
+        - over the whole session (since the last reset): session.n, session.mean,
+          session.variance(), session.min, session.max, and percentile(p)
     """
     
-    def __init__(self,array = np.array([])):
+    def __init__(self,maxlen = 10):
         
-        self.data = array 
+        # the mean and variance of the last maxlen data points, which it holds for the stats plot
+        self.window = WindowedVariance(maxlen)
+        self.extrema = WindowedMinMax(maxlen)
+        self.session = RunningStats()
+        self.sketch = QuantileSketch()
+        self.update_stats()
+    
+    @property
+    def data(self):
+        return self.window.history.view()
+    
+    def add_data_point(self,data_point):
+        # the slow loop gives None or nan for parameters it couldn't calculate (eg. the
+        # peep of a breath with no expiration), they'd stick in the running sums so skip them
+        if data_point is None or not math.isfinite(data_point):
+            return False
+        self.window.push(data_point)
+        self.extrema.push(data_point)
+        self.session.push(data_point)
+        self.sketch.push(data_point)
         self.update_stats()
+        return True
+    
+    def percentile(self,p):
+        # approximate percentile over the whole session
+        return self.sketch.percentile(p)
     
     def update_stats(self):
-           
         
-        self.n_points = len(self.data)
+        self.n_points = len(self.window)
         if self.n_points == 0:
             self.stderr = np.nan
             self.pcterr = np.nan
@@ -44,11 +62,18 @@ class Stats():
             
         else:
             
-            self.stderr = np.std(self.data)/np.sqrt(self.n_points)
+            self.mean = self.window.mean
+            self.stderr = np.sqrt(self.window.variance())/np.sqrt(self.n_points)
             self.pcterr = 100.0*(self.stderr/self.mean)
-            self.min = np.min(self.data)
-            self.max = np.max(self.data)
-            self.mean = np.mean(self.data)
+            self.min = self.extrema.min
+            self.max = self.extrema.max
+    
+    def clear(self):
+        self.window.clear()
+        self.extrema.clear()
+        self.session.clear()
+        self.sketch.clear()
+        self.update_stats()
         
         
 class Statset():
@@ -57,20 +82,20 @@ class Statset():
     this class holds a dictionary of statistics for the tracked varibles.
     """
     
-    def __init__(self):
+    def __init__(self,maxlen = 10):
         self.names = []
         self.stats = dict()
+        self.maxlen = maxlen
         
     def add_stat(self,name):
         self.names.append(name)
         
         # create a new Stats instance
-        stat = Stats()
+        stat = Stats(self.maxlen)
         self.stats.update({name : stat})
     
     def add_data_point(self,name,data_point):
-        self.stats[name].data = add_new_point(self.stats[name].data, data_point, 10)
-        self.stats[name].update_stats()
+        return self.stats[name].add_data_point(data_point)
         #print(f'stats: stat[{name}].data = {self.stats[name].data}')
     
     def reset_all(self):
@@ -79,5 +104,4 @@ class Statset():
         """
         print('stats: clearing stats')
         for name in self.names:            
-            self.stats[name].data = []
-            self.stats[name].update_stats()
\ No newline at end of file
+            self.stats[name].clear()
\ No newline at end of file
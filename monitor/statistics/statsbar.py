@@ -2,7 +2,8 @@
 """
 Main window helper
 """
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
+from utils.uicache import load_ui
 
 
 
@@ -14,4 +15,4 @@ class statsbar(QtWidgets.QWidget):
         
     def __init__(self, parent=None):
         super(statsbar, self).__init__(parent)
-        uic.loadUi('statistics/statsbar.ui', self)
\ No newline at end of file
+        load_ui('statistics/statsbar.ui', self)
\ No newline at end of file
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+trends.py
+
+Long term trends of the breath parameters, for days of ventilation.
+
+Every breath is added to a set of tiers of increasing time resolution:
+one row per breath, then one row per minute, per 15 minutes and per hour.
+Each row holds the min, mean, max and number of breaths of each tracked
+parameter over the row's interval. Each tier is a RingBuffer of fixed size
+with a structured dtype, so the memory used is fixed however long the
+monitor runs, adding a breath is O(1), and the rows for a time range are
+found by a binary search on the row times. The row of each tier that is
+still being filled in is included, so the last minutes are never missing.
+
+With the default tier sizes the store covers the last ~2 h breath by
+breath, 72 h by the minute, a week by the quarter hour and 30 days by the
+hour, in about 4 MB.
+
+"""
+
+import numpy as np
+
+from utils.ringbuffer import RingBuffer
+
+
+# (tier name, row interval in s (0 = one row per breath), number of rows kept)
+TIERS = (('breath', 0, 4096),
+         ('1 min', 60, 72*60),
+         ('15 min', 900, 7*24*4),
+         ('1 h', 3600, 30*24))
+
+
+class TrendTier(object):
+    """
+    One resolution of the trend store.
+
+    Constituents:
+        name        =   tier name
+        interval    =   time covered by each row in s, 0 for one row per breath
+        rows        =   RingBuffer of rows: t (start of the interval) and
+                        <param>_min, <param>_mean, <param>_max, <param>_n
+                        for each parameter
+    """
+
+    def __init__(self, name, interval, capacity, params):
+        self.name = name
+        self.interval = interval
+        self.params = tuple(params)
+        fields = [('t', float)]
+        for param in self.params:
+            fields += [(param + '_min', float), (param + '_mean', float),
+                       (param + '_max', float), (param + '_n', np.int32)]
+        self.rows = RingBuffer(capacity, dtype = fields)
+
+        # the row that is still being filled in, as arrays over the parameters
+        n = len(self.params)
+        self._t_open = None
+        self._min = np.empty(n)
+        self._max = np.empty(n)
+        self._sum = np.empty(n)
+        self._n = np.zeros(n, dtype = np.int32)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, t, values, valid):
+        """
+        Adds one breath.
+
+        arguments:
+        - t: (float) time of the breath (s since the epoch)
+        - values: (array) the parameters, in the order of self.params
+        - valid: (bool array) False for parameters that weren't calculated
+        """
+        if self.interval == 0:
+            self._start_row(t)
+            self._accumulate(values, valid)
+            self._close_row()
+            return
+
+        t_row = np.floor(t/self.interval)*self.interval
+        if t_row != self._t_open:
+            self._close_row()
+            self._start_row(t_row)
+        self._accumulate(values, valid)
+
+    def _start_row(self, t):
+        self._t_open = t
+        self._min[:] = np.inf
+        self._max[:] = -np.inf
+        self._sum[:] = 0.0
+        self._n[:] = 0
+
+    def _accumulate(self, values, valid):
+        np.minimum(self._min, values, out = self._min, where = valid)
+        np.maximum(self._max, values, out = self._max, where = valid)
+        np.add(self._sum, values, out = self._sum, where = valid)
+        self._n += valid
+
+    def _close_row(self):
+        # append the open row, if anything went into it
+        if self._t_open is None or not self._n.any():
+            return
+        self.rows.append(self.current())
+
+    def current(self):
+        # the row being filled in, as a tuple in the rows' field order
+        row = [self._t_open]
+        for i in range(len(self.params)):
+            if self._n[i] == 0:
+                row += [np.nan, np.nan, np.nan, 0]
+            else:
+                row += [self._min[i], self._sum[i]/self._n[i], self._max[i], self._n[i]]
+        return tuple(row)
+
+    @property
+    def open(self):
+        # is there a row being filled in? (never for the per breath tier)
+        return self.interval > 0 and not self._t_open is None and self._n.any()
+
+    def query(self, t_start, t_end):
+        """
+        The rows overlapping t_start to t_end, oldest first. The stored rows
+        are a view, not a copy! If the row that is still being filled in is
+        in the range it goes last, and then the rows are a copy.
+        """
+        rows = self.rows.view()
+        t = rows['t']
+        if self.interval == 0:
+            start = np.searchsorted(t, t_start, side = 'left')
+        else:
+            start = np.searchsorted(t, t_start - self.interval, side = 'right')
+        rows = rows[start:np.searchsorted(t, t_end, side = 'right')]
+
+        if self.open and t_start < self._t_open + self.interval and self._t_open <= t_end:
+            rows = np.concatenate((rows, np.array([self.current()], dtype = rows.dtype)))
+        return rows
+
+    def clear(self):
+        self.rows.clear()
+        self._t_open = None
+        self._n[:] = 0
+
+
+class TrendStore(object):
+    """
+    Holds the trend tiers for a set of breath parameters.
+
+    Constituents:
+        params  =   names of the tracked parameters (monitor names, eg. 'peep')
+        tiers   =   list of TrendTiers, finest first
+        t_first =   time of the first breath added
+    """
+
+    def __init__(self, params, tiers = TIERS):
+        self.params = tuple(params)
+        self.tiers = [TrendTier(name, interval, capacity, self.params) for name, interval, capacity in tiers]
+        self.t_first = None
+        self._values = np.zeros(len(self.params))
+        self._valid = np.zeros(len(self.params), dtype = bool)
+
+    def add(self, t, values):
+        """
+        Adds a breath to all the tiers.
+
+        arguments:
+        - t: (float) time of the breath (s since the epoch)
+        - values: (dict) parameter name -> value. missing or None values are skipped
+        """
+        for i, param in enumerate(self.params):
+            value = values.get(param)
+            self._valid[i] = not value is None and np.isfinite(value)
+            self._values[i] = value if self._valid[i] else 0.0
+        if self.t_first is None:
+            self.t_first = t
+        for tier in self.tiers:
+            tier.add(t, self._values, self._valid)
+
+    def tier(self, name):
+        for tier in self.tiers:
+            if tier.name == name:
+                return tier
+        raise KeyError(f'no trend tier called {name}')
+
+    def query(self, t_start, t_end, max_rows = None):
+        """
+        Returns (tier, rows) for the time range: the rows of the finest tier
+        that goes back to t_start (or to the first breath) and has no more
+        than max_rows rows in the range, oldest first, up to and including
+        the row still being filled in (see TrendTier.query). Falls back to
+        the coarsest tier if none of them fit.
+        """
+        for tier in self.tiers:
+            if len(tier) == 0 and not tier.open:
+                continue
+            covers = not tier.rows.full or tier.rows.first()['t'] <= max(t_start, self.t_first)
+            rows = tier.query(t_start, t_end)
+            if covers and (max_rows is None or len(rows) <= max_rows):
+                return tier, rows
+        tier = self.tiers[-1]
+        return tier, tier.query(t_start, t_end)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+        self.t_first = None
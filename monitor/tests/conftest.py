@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+conftest.py
+
+The monitor runs with the monitor directory as its working directory and
+imports its packages from there (utils, statistics, data_handler, ...), so
+the tests put it first on the path. Run them from the repository root or
+the monitor directory:
+    python -m pytest monitor/tests
+
+"""
+
+import os
+import sys
+
+MONITOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MONITOR_DIR)
+
+# the monitor's statistics package has the same name as the standard library module
+if 'statistics' in sys.modules and not hasattr(sys.modules['statistics'], '__path__'):
+    del sys.modules['statistics']
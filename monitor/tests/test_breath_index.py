@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+test_breath_index.py
+
+The breath index (data_handler/breath_index.py): adding breaths, handing the
+parameters over from the slow loop, and looking the breaths up again.
+"""
+
+import numpy as np
+
+from data_handler.breath_index import breath_index
+from utils.ringbuffer import RingBuffer
+
+
+class breath(object):
+    # the parts of a breath_data the index reads
+    def __init__(self, i, t):
+        self.isi, self.iei, self.iee = i, i + 20, i + 50
+        self.tsi, self.tei, self.tee = t, t + 0.2, t + 0.5
+
+
+class params(object):
+    def __init__(self, vt):
+        self.pip, self.peep, self.pp, self.vt = 20.0, 5.0, 18.0, vt
+        self.mve_inf, self.rr, self.ie, self.c = 6.0, 12.0, 0.5, None
+
+
+def test_params_are_only_written_by_apply_params():
+    index = breath_index(4)
+    for j in range(3):
+        assert index.add(breath(50*j, 0.5*j)) == j
+
+    index.set_params(1, params(400.0))
+    assert np.isnan(index.get(1)['vt'])
+    assert index.apply_params() == 1
+    assert len(index.pending) == 0
+
+    record = index.get(1)
+    assert record['vt'] == 400.0 and record['pip'] == 20.0
+    assert np.isnan(record['c'])
+    # the other breaths and the breath's own fields are left alone
+    assert record['i_start'] == 50 and record['t_end'] == 1.0
+    assert np.isnan(index.get(0)['vt']) and np.isnan(index.get(2)['vt'])
+
+
+def test_params_of_breaths_that_have_gone_are_dropped():
+    index = breath_index(2)
+    index.add(breath(0, 0.0))
+    index.set_params(0, params(300.0))
+    index.add(breath(50, 0.5))
+    index.add(breath(100, 1.0))
+    assert index.get(0) is None
+    assert index.apply_params() == 0
+    assert len(index) == 2 and index.count == 3
+
+
+def test_lookups():
+    index = breath_index(8)
+    for j in range(10):
+        index.add(breath(50*j, 0.5*j))
+    assert list(index.last(3)['number']) == [7, 8, 9]
+    assert list(index.between(2.0, 3.0)['number']) == [4, 5, 6]
+    assert index.get(1) is None and index.get(10) is None
+
+    # the samples of a breath in a fast data vector
+    p = RingBuffer(200, headroom = 10)
+    p.extend(np.arange(500))
+    assert list(index.samples(index.get(9), p)) == list(range(450, 500))
+    assert index.samples(index.get(4), p) is None
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+test_configcache.py
+
+Loading the config through utils/configcache.py: the checks, the compiled
+config and when the pickled copy is used. The cache goes in a temporary
+directory, not the monitor's.
+"""
+
+import os
+import shutil
+
+import pytest
+
+from conftest import MONITOR_DIR
+from utils import configcache
+
+
+SETTINGS = os.path.join(MONITOR_DIR, 'config', 'default_settings.yaml')
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    # a copy of the default settings, cached under tmp_path
+    monkeypatch.setattr(configcache, 'CACHE_DIR', str(tmp_path/'cache'))
+    monkeypatch.setattr(configcache, '_enabled', True)
+    filename = str(tmp_path/'default_settings.yaml')
+    shutil.copy(SETTINGS, filename)
+    return filename
+
+
+def test_the_default_settings_compile(settings):
+    config, cfg = configcache.load(settings)
+    assert configcache.validate(config)[0] == []
+    assert cfg.fastdata_interval == config['fastdata_interval']
+    assert cfg.plots.plot_top.color == config['plots']['plot_top']['color']
+    assert cfg['monitors']['peep'].units == config['monitors']['peep']['units']
+    assert cfg.get('not_a_setting', 3) == 3
+    assert isinstance(cfg.displayed_monitors, tuple)
+    # the sections only have slots for the keys in the file
+    with pytest.raises(AttributeError):
+        cfg.not_a_setting = 1
+    with pytest.raises(KeyError):
+        cfg['not_a_setting']
+
+
+def test_the_pickle_is_used_until_the_file_changes(settings, monkeypatch):
+    config, _ = configcache.load(settings)
+    assert os.path.exists(configcache._cache_file(settings))
+
+    parsed = []
+    parse = configcache.parse
+    def counting_parse(text):
+        parsed.append(text)
+        return parse(text)
+    monkeypatch.setattr(configcache, 'parse', counting_parse)
+
+    assert configcache.load(settings)[0] == config
+    assert len(parsed) == 0
+
+    with open(settings, 'a') as f:
+        f.write('\nnew_setting: 12\n')
+    assert configcache.load(settings)[0]['new_setting'] == 12
+    assert len(parsed) == 1
+
+    # a pickle from an older version of the checks isn't trusted either
+    monkeypatch.setattr(configcache, 'CACHE_VERSION', configcache.CACHE_VERSION + 1)
+    configcache.load(settings)
+    assert len(parsed) == 2
+
+    # nor is a broken one
+    with open(configcache._cache_file(settings), 'wb') as f:
+        f.write(b'not a pickle')
+    assert configcache.load(settings)[0]['new_setting'] == 12
+    assert len(parsed) == 3
+
+
+def test_disabled_cache_writes_nothing(settings):
+    configcache.enable(False)
+    try:
+        configcache.load(settings)
+    finally:
+        configcache.enable(True)
+    assert not os.path.exists(configcache.CACHE_DIR)
+
+
+def test_bad_configs(settings):
+    config, _ = configcache.load(settings)
+    del config['nsamples']
+    config['line_width'] = True
+    config['plots']['plot_top']['min'] = 'low'
+    config['displayed_monitors'] = list(config['displayed_monitors']) + ['not_a_monitor']
+    errors, warnings = configcache.validate(config)
+    assert errors == ['nsamples is missing',
+                      'line_width should be int or float, not True',
+                      "plots.plot_top.min should be int or float, not 'low'"]
+    assert 'displayed_monitors lists not_a_monitor, which is not a monitor' in warnings
+
+    with open(settings, 'a') as f:
+        f.write('\nnsamples: many\n')
+    with pytest.raises(ValueError, match = 'nsamples should be int'):
+        configcache.load(settings)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+test_data_filler.py
+
+What DataFiller (data_handler/data_filler.py) hands to the plots, with
+stand-ins for the pyqtgraph items so no display is needed.
+"""
+
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from conftest import MONITOR_DIR
+
+pytest.importorskip('pyqtgraph')
+from data_handler.data_filler import DataFiller
+
+
+class plot_data_item(object):
+    # keeps what setData was given, like pyqtgraph's PlotDataItem
+    def setData(self, x, y):
+        self.xData = x
+        self.yData = y
+
+
+class plot_item(object):
+    def setMouseEnabled(self, x, y):
+        self.mouse_enabled = (x, y)
+
+
+@pytest.fixture
+def config():
+    with open(os.path.join(MONITOR_DIR, 'config', 'default_settings.yaml')) as f:
+        return yaml.load(f, Loader = yaml.FullLoader)
+
+
+@pytest.mark.parametrize('looping', [False, True])
+def test_frozen_plots_keep_their_data(config, looping):
+    config['use_looping_plots'] = looping
+    filler = DataFiller(config)
+    filler._plots['pressure'] = plot_data_item()
+    filler._qtgraphs['pressure'] = plot_item()
+    filler._data['pressure'] = filler._new_data_vector()
+    filler._looping_data_idx['pressure'] = 0
+
+    for i in range(50):
+        filler.add_data_point('pressure', float(i))
+    filler.freeze()
+    frozen = np.array(filler._plots['pressure'].yData)
+
+    # the data keeps coming in, but what the cursor reads doesn't move
+    for i in range(50, 80):
+        filler.add_data_point('pressure', float(i))
+    assert np.array_equal(filler._plots['pressure'].yData, frozen)
+    assert filler._get_data('pressure').max() == 79.0
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+test_esp32serial.py
+
+The ESP32 serial client (communication/esp32serial.py) against the pty
+emulator of the firmware (communication/esp32emulator.py): the commands,
+the order of the replies in a window, the batches, and what happens when
+the line drops or garbles bytes or is closed with commands still queued.
+"""
+
+import time
+
+import pytest
+
+pytest.importorskip('serial')
+pytest.importorskip('PyQt5')
+from communication.esp32emulator import ESP32Emulator
+from communication.esp32serial import ESP32Serial, ESP32Exception
+
+
+FIELDS = ['pressure', 'flow', 'o2', 'bpm', 'tidal', 'peep', 'temperature', 'battery_powered', 'battery_charge',
+          'peak', 'total_inspired_volume', 'total_expired_volume', 'volume_minute', 'run', 'alarm']
+
+
+@pytest.fixture
+def emulator():
+    emulator = ESP32Emulator(FIELDS, seed = 1)
+    emulator.start()
+    yield emulator
+    emulator.stop()
+
+
+@pytest.fixture
+def connect(emulator):
+    # opens clients on the emulator's port, and closes them after the test
+    clients = []
+    def connect(**kwargs):
+        kwargs.setdefault('timeout', 0.2)
+        esp32 = ESP32Serial({'port': emulator.port, 'get_all_fields': FIELDS}, **kwargs)
+        clients.append(esp32)
+        return esp32
+    yield connect
+    for esp32 in clients:
+        esp32.close()
+
+
+def queue_together(esp32, submit):
+    # queue the requests while the I/O thread can't take any, so the windows are full
+    with esp32._condition:
+        return submit()
+
+
+def record_writes(esp32):
+    # the number of lines in each write to the line
+    writes = []
+    write = esp32.connection.write
+    def counting_write(data):
+        writes.append(data.count(b'\n'))
+        return write(data)
+    esp32.connection.write = counting_write
+    return writes
+
+
+def test_get_set_and_get_all(emulator, connect):
+    esp32 = connect()
+    assert esp32.get('rate') == '17.0'
+    assert esp32.set('rate', 20) == 'OK'
+    assert esp32.get('rate') == '20'
+    assert emulator.set_params['rate'] == '20'
+
+    values = esp32.get_all()
+    assert list(values) == FIELDS
+    assert values['run'] == '0'
+    assert all(float(value) == float(value) for value in values.values())
+
+    # an unknown command is answered, the answer is the error
+    assert esp32.get('rate extra') == 'ERROR'
+
+
+def test_replies_resolve_in_order_within_a_window(emulator, connect):
+    esp32 = connect(max_in_flight = 4)
+    writes = record_writes(esp32)
+
+    def submit():
+        requests = []
+        for i in range(5):
+            requests.append(esp32.set_async('value_%d' % (i % 2), i))
+            requests.append(esp32.get_async('value_%d' % (i % 2)))
+        return requests
+    requests = queue_together(esp32, submit)
+
+    assert [request.result(timeout = 5) for request in requests] == ['OK', '0', 'OK', '1', 'OK', '2', 'OK', '3', 'OK', '4']
+    assert writes == [4, 4, 2]
+    assert emulator.counts['commands'] == 10
+
+
+def test_transactions(emulator, connect):
+    esp32 = connect(max_in_flight = 2)
+    writes = record_writes(esp32)
+
+    # a batch goes out in one write, even if it's longer than max_in_flight
+    assert esp32.transaction([('set', 'ptarget', 30), ('get', 'ptarget'), ('get', 'rate')]) == ['OK', '30', '17.0']
+    assert writes == [3]
+
+    assert esp32.set_many_async({'rate': 12, 'ratio': 0.5}).result(timeout = 5) == {'rate': 'OK', 'ratio': 'OK'}
+    assert esp32.get_many_async(['rate', 'ratio']).result(timeout = 5) == {'rate': '12', 'ratio': '0.5'}
+
+    with pytest.raises(ValueError):
+        esp32.transaction([('reset', 'rate')])
+
+
+def test_retries_on_a_noisy_line(emulator, connect):
+    emulator.drop_rate = 0.01
+    emulator.garble_rate = 0.01
+    esp32 = connect(timeout = 0.1, retries = 5, max_in_flight = 4)
+
+    requests = [esp32.set_async('noisy', i) for i in range(100)]
+    failed = 0
+    for request in requests:
+        try:
+            # there's no checksum: a damaged reply can still parse, as something else than OK
+            request.result(timeout = 30)
+        except ESP32Exception:
+            failed += 1
+    assert emulator.counts['dropped'] + emulator.counts['garbled'] > 0
+    # the windows with a bad reply were sent again
+    assert emulator.counts['commands'] > 100
+    assert failed < 10
+
+    # and once the line is clean again everything gets through
+    emulator.drop_rate = emulator.garble_rate = 0.0
+    requests = [esp32.set_async('clean', i) for i in range(20)] + [esp32.get_async('clean')]
+    assert [request.result(timeout = 5) for request in requests] == ['OK']*20 + ['19']
+
+
+def test_exhausted_retries_raise(emulator, connect):
+    esp32 = connect(timeout = 0.05, retries = 2)
+    emulator.drop_rate = 1.0
+    with pytest.raises(ESP32Exception) as error:
+        esp32.get('rate')
+    assert error.value.verb == 'get' and error.value.line == 'get rate'
+    assert 'no reply' in error.value.output
+    assert emulator.counts['commands'] == 2
+
+    # the line is resynchronised, the next command isn't confused by the lost replies
+    emulator.drop_rate = 0.0
+    assert esp32.get('rate') == '17.0'
+
+
+def test_close_fails_the_pending_requests(emulator, connect):
+    emulator.latency = 0.1
+    esp32 = connect(timeout = 1, max_in_flight = 1)
+    requests = queue_together(esp32, lambda: [esp32.get_async('rate') for i in range(5)])
+    # close once the first one is on the line
+    t_stop = time.monotonic() + 5
+    while len(esp32._pending) > 4 and time.monotonic() < t_stop:
+        time.sleep(0.001)
+    esp32.close()
+
+    assert all(request.done() for request in requests)
+    # what was on the line when it closed finishes, the rest fail
+    assert requests[0].result() == '17.0'
+    for request in requests[1:]:
+        with pytest.raises(ESP32Exception, match = 'connection closed'):
+            request.result()
+
+    # and so does anything asked for afterwards
+    with pytest.raises(ESP32Exception, match = 'connection closed'):
+        esp32.get_async('rate').result(timeout = 1)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+test_estimators.py
+
+The streaming estimators (utils/estimators.py) against numpy reductions
+over the same windows.
+"""
+
+import numpy as np
+import pytest
+
+from utils.estimators import (WindowedMean, WindowedSlope, WindowedMinMax,
+                              RunningStats, WindowedVariance, QuantileSketch)
+
+
+def windows(values, window):
+    # the window ending at each value, as numpy would slice it
+    return [values[max(0, i + 1 - window):i + 1] for i in range(len(values))]
+
+
+def blocks(values, seed = 0):
+    # the values split into blocks of random sizes, some of them empty
+    rng = np.random.default_rng(seed)
+    start = 0
+    while start < len(values):
+        stop = start + int(rng.integers(0, 12))
+        yield values[start:stop]
+        start = stop
+
+
+@pytest.fixture
+def values():
+    return np.random.default_rng(0).normal(10.0, 3.0, 500)
+
+
+def test_windowed_mean(values):
+    expected = [np.mean(w) for w in windows(values, 25)]
+
+    mean = WindowedMean(25)
+    assert np.allclose([mean.push(x) for x in values], expected)
+    assert mean.sum == pytest.approx(np.sum(values[-25:]))
+
+    mean = WindowedMean(25)
+    assert np.allclose(np.concatenate([mean.extend(block) for block in blocks(values)]), expected)
+    assert len(mean) == 25
+
+    mean.clear()
+    assert len(mean) == 0 and mean.value == 0.0
+
+
+def test_windowed_slope(values):
+    expected = [(w[-1] - w[0])/(len(w) - 1) if i >= 9 else -1.0
+                for i, w in enumerate(windows(values, 20))]
+
+    slope = WindowedSlope(20, min_count = 10, default = -1.0)
+    assert np.allclose([slope.push(x) for x in values], expected)
+    assert slope.ready
+
+    slope = WindowedSlope(20, min_count = 10, default = -1.0)
+    assert np.allclose(np.concatenate([slope.extend(block) for block in blocks(values)]), expected)
+
+    # by default the window has to fill up first
+    slope = WindowedSlope(5)
+    assert [slope.push(x) for x in (1.0, 2.0, 4.0, 7.0)] == [0.0]*4
+    assert slope.push(11.0) == 2.5
+
+
+def test_windowed_min_max(values):
+    minmax = WindowedMinMax(30)
+    assert minmax.min is None and minmax.max is None
+    for x, w in zip(values, windows(values, 30)):
+        minmax.push(x)
+        assert minmax.min == w.min() and minmax.max == w.max()
+    assert len(minmax) == 30
+
+
+def test_running_stats_skip_nan(values):
+    stats = RunningStats()
+    assert np.isnan(stats.variance())
+    with_nan = np.insert(values, [3, 100, 250], [np.nan, np.inf, -np.inf])
+    stats.extend(with_nan)
+    assert len(stats) == len(values)
+    assert stats.mean == pytest.approx(np.mean(values))
+    assert stats.variance() == pytest.approx(np.var(values))
+    assert stats.variance(ddof = 1) == pytest.approx(np.var(values, ddof = 1))
+    assert stats.min == values.min() and stats.max == values.max()
+
+
+def test_windowed_variance_skips_nan(values):
+    variance = WindowedVariance(40)
+    finite = []
+    for i, x in enumerate(values):
+        if i % 50 == 7:
+            variance.push(np.nan)
+        variance.push(x)
+        finite.append(x)
+        window = finite[-40:]
+        assert variance.mean == pytest.approx(np.mean(window))
+        assert variance.variance() == pytest.approx(np.var(window), abs = 1e-9)
+    assert len(variance) == 40
+
+    # a constant signal, where a running sum of squares goes negative
+    variance = WindowedVariance(10)
+    variance.extend(np.full(100, 1e8 + 0.1))
+    assert variance.variance() == pytest.approx(0.0, abs = 1e-6)
+
+
+def test_quantile_sketch():
+    sketch = QuantileSketch(size = 64)
+    assert np.isnan(sketch.quantile(0.5))
+
+    # exact while there are fewer distinct values than bins
+    sketch.extend([1.0, 2.0, 2.0, 3.0, np.nan])
+    assert len(sketch) == 4
+    assert sketch.quantile(0.5) == 2.0
+    assert sketch.quantile(0.0) == 1.0 and sketch.quantile(1.0) == 3.0
+
+    # and close after
+    values = np.random.default_rng(3).normal(0.0, 1.0, 5000)
+    sketch = QuantileSketch(size = 64)
+    sketch.extend(values)
+    assert len(sketch._centres) == 64
+    for p in (5, 25, 50, 75, 95):
+        assert sketch.percentile(p) == pytest.approx(np.percentile(values, p), abs = 0.05)
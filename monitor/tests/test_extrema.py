@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+test_extrema.py
+
+The streaming minima/maxima detector (utils/extrema.py) against
+scipy.signal.find_peaks on made up signals.
+"""
+
+import numpy as np
+import pytest
+
+from utils.extrema import ExtremaDetector, NEW_MINIMUM, NEW_MAXIMUM, NOTHING
+
+
+def minima_of(detector, t, x):
+    found = []
+    for ti, xi in zip(t, x):
+        if detector.push(ti, xi) & NEW_MINIMUM:
+            if detector.replaced:
+                found[-1] = detector.minima_t.last()
+            else:
+                found.append(detector.minima_t.last())
+    return np.array(found)
+
+
+def test_minima_match_find_peaks():
+    signal = pytest.importorskip('scipy.signal')
+    fs = 100.0
+    t = np.arange(0, 40, 1/fs)
+    rng = np.random.default_rng(1)
+    x = 0.5*np.sin(2*np.pi*t/3.7) + 0.2*np.sin(2*np.pi*t/11) + rng.normal(0, 0.005, len(t))
+
+    i_min, _ = signal.find_peaks(-x, prominence = 0.05, distance = 1.5*fs, width = 0.3*fs)
+    found = minima_of(ExtremaDetector(prominence = 0.05, distance = 1.5, width = 0.3), t, x)
+    assert len(found) == len(i_min)
+    assert np.allclose(found, t[i_min], atol = 0.1)
+
+
+def test_narrow_dips_are_not_minima():
+    fs = 100.0
+    t = np.arange(0, 20, 1/fs)
+    x = 1 - np.cos(2*np.pi*t/4)
+    # a few samples wide dips at the tops of the waves
+    for t_dip in (2.0, 6.0, 10.0):
+        i = int(t_dip*fs)
+        x[i:i + 3] -= 0.5
+
+    found = minima_of(ExtremaDetector(prominence = 0.05, distance = 1.5, width = 0.3), t, x)
+    assert np.allclose(found, [4.0, 8.0, 12.0, 16.0], atol = 0.02)
+
+    # without the width limit the dips are found too
+    found = minima_of(ExtremaDetector(prominence = 0.05, distance = 1.5), t, x)
+    assert np.any(np.abs(found - 2.0) < 0.05)
+
+
+def test_sharp_but_deep_troughs_are_minima():
+    # a sawtooth that falls slowly and jumps back up, like the volume integral
+    # restarting at each breath: the trough is wide halfway up, if not at the bottom
+    fs = 100.0
+    t = np.arange(0, 12, 1/fs)
+    x = -(t % 3.0)/3.0
+    found = minima_of(ExtremaDetector(prominence = 0.05, distance = 1.5, width = 0.3), t, x)
+    assert np.allclose(found, [2.99, 5.99, 8.99], atol = 0.02)
+
+
+def test_minimum_and_maximum_from_one_sample():
+    detector = ExtremaDetector(prominence = 1.0, width = 0.1)
+    results = [detector.push(0.1*i, x) for i, x in enumerate([5, 3, 0, 0, 0, 2, 2.5, 1.0])]
+    # the trough fell by 5 but only came back up by 2.5: it's measured when the maximum is confirmed
+    assert results[1] == NEW_MAXIMUM
+    assert results[2:-1] == [NOTHING]*5
+    assert results[-1] == NEW_MINIMUM | NEW_MAXIMUM
+    assert detector.minima_x.last() == 0 and detector.maxima_x.last() == 2.5
+
+
+def test_max_minimum_and_distance():
+    t = np.arange(0, 10, 0.01)
+    x = np.cos(2*np.pi*t)
+    detector = ExtremaDetector(prominence = 0.5, distance = 1.5, max_minimum = -0.5)
+    found = minima_of(detector, t, x)
+    assert np.all(np.diff(found) >= 1.5)
+    assert np.all(detector.minima_x.view() <= -0.5)
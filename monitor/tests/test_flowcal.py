@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+test_flowcal.py
+
+The flow calibration (sensor/flowcal.py): the scalar and block paths against
+np.polyval, and the calibrations with lookup tables load_flow_calibration
+makes on request.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from conftest import MONITOR_DIR
+from sensor import flowcal
+
+
+CALFILE = os.path.join(MONITOR_DIR, 'calibration', 'flow_calibration_iqspiro.txt')
+
+
+def polyval_flow(coeffs, dp):
+    # what the sensor did before the calibration object
+    return np.sign(dp)*np.polyval(coeffs, np.abs(dp))
+
+
+def test_scalar_and_block_paths_match_polyval():
+    calibration = flowcal.flow_calibration([0.5, -2.0, 30.0, 0.1])
+    dp = np.linspace(-3, 3, 301)
+    assert np.allclose([calibration(x) for x in dp], polyval_flow(calibration.coeffs, dp), rtol = 1e-12)
+    assert np.allclose(calibration(dp), polyval_flow(calibration.coeffs, dp), rtol = 1e-12)
+    assert calibration(0.0) == 0.0 and np.isnan(calibration(np.nan))
+
+
+def test_lookup_table_calibrations_are_separate_objects():
+    plain = flowcal.load_flow_calibration(CALFILE)
+    calibration = flowcal.load_flow_calibration(CALFILE, lut_dp_max = 2.0)
+    assert plain.lut_dp_max is None and calibration.lut_dp_max == 2.0
+
+    # cached: the same objects come back, and asking for one never changes another
+    assert flowcal.load_flow_calibration(CALFILE, lut_dp_max = 2) is calibration
+    assert flowcal.load_flow_calibration(CALFILE, lut_dp_max = 0) is plain
+    assert calibration.lut_dp_max == 2.0 and plain.lut_dp_max is None
+
+    dp = np.linspace(-3, 3, 601)
+    exact = polyval_flow(calibration.coeffs, dp)
+    scale = np.abs(exact).max()
+    assert np.allclose([calibration(x) for x in dp], exact, atol = 1e-4*scale)
+    assert np.allclose(calibration(dp), exact, atol = 1e-4*scale)
+    # beyond the table it's the polynomial again
+    assert calibration(2.5) == pytest.approx(polyval_flow(calibration.coeffs, 2.5), rel = 1e-12)
+    assert np.array_equal(plain(dp), exact)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+test_pipeline.py
+
+The fast pipeline (data_handler/pipeline.py) on a made up breath signal:
+processing blocks of samples, and handing the samples over to another
+thread with take_block.
+"""
+
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from conftest import MONITOR_DIR
+from data_handler.pipeline import fast_pipeline
+
+
+@pytest.fixture
+def config():
+    with open(os.path.join(MONITOR_DIR, 'config', 'default_settings.yaml')) as f:
+        return yaml.load(f, Loader = yaml.FullLoader)
+
+
+def breaths(n, ts = 0.01, t0 = 1589499917.0, seed = 0):
+    # n samples of a 4 s breath cycle with some noise, as (t, p1, p2, dp, flow)
+    rng = np.random.default_rng(seed)
+    t = t0 + ts*np.arange(n)
+    flow = 30*np.sin(2*np.pi*t/4.0) + rng.normal(0, 0.5, n)
+    p1 = 5 + 10*np.clip(np.sin(2*np.pi*t/4.0), 0, None) + rng.normal(0, 0.1, n)
+    p2 = p1 - 0.01*flow
+    return t, p1, p2, p1 - p2, flow
+
+
+@pytest.mark.parametrize('correct_vol', [False, True])
+def test_blocks_match_one_sample_at_a_time(config, correct_vol):
+    n = 3000
+    t, p1, p2, dp, flow = breaths(n)
+    # the sample times jitter, like the sensor reads do
+    t = t + np.random.default_rng(1).normal(0, 0.0005, n)
+
+    by_block = fast_pipeline(config, ts_sample = 10, correct_vol = correct_vol)
+    rng = np.random.default_rng(2)
+    start = 0
+    while start < n:
+        # sizes either side of SMALL_BLOCK, so both routes through process_block are taken
+        stop = min(start + int(rng.integers(1, 40)), n)
+        by_block.process_block(t[start:stop], p1[start:stop], p2[start:stop], dp[start:stop], flow[start:stop])
+        start = stop
+
+    by_sample = fast_pipeline(config, ts_sample = 10, correct_vol = correct_vol)
+    for i in range(n):
+        by_sample.process_sample(None, t[i], p1[i], p2[i], dp[i], flow[i])
+
+    for name, buffer in by_block.fastdata.buffers.items():
+        assert buffer.count == by_sample.fastdata.buffers[name].count, name
+        assert np.array_equal(buffer.view(), by_sample.fastdata.buffers[name].view(), equal_nan = True), name
+    assert by_block.fastdata.fs == by_sample.fastdata.fs
+    assert by_block.breaths.count == by_sample.breaths.count > 0
+    assert np.array_equal(by_block.breaths.last(len(by_block.breaths))['t_start'],
+                          by_sample.breaths.last(len(by_sample.breaths))['t_start'])
+
+
+def test_take_block_redoes_a_copy_the_pipeline_wrote_over(config):
+    pipeline = fast_pipeline(config, ts_sample = 10, correct_vol = True)
+    t, p1, p2, dp, flow = breaths(1500)
+    pipeline.process_block(t[:1000], p1[:1000], p2[:1000], dp[:1000], flow[:1000])
+
+    # the fast loop runs a short block in the middle of the first copy, short
+    # enough that the samples copied aren't overwritten, but the volume
+    # correction could have changed them
+    snapshot_view = pipeline.snapshot_view
+    calls = []
+    def interrupted_view(name, count):
+        view = snapshot_view(name, count)
+        if len(calls) == 0:
+            pipeline.process_block(t[1000:1005], p1[1000:1005], p2[1000:1005], dp[1000:1005], flow[1000:1005])
+        calls.append(name)
+        return view
+    pipeline.snapshot_view = interrupted_view
+
+    block = pipeline.take_block()
+    assert block.count == 1005
+    assert len(calls) == 8
+    n = block.n
+    assert np.array_equal(block.t, pipeline.fastdata.t[-n:])
+    assert np.allclose(block.fields['volume'], 1000*pipeline.fastdata.vol[-n:])
+    assert np.array_equal(block.fields['pressure'], pipeline.fastdata.p1[-n:])
+
+    # and the next block has only what came after
+    pipeline.snapshot_view = snapshot_view
+    pipeline.process_block(t[1005:1015], p1[1005:1015], p2[1005:1015], dp[1005:1015], flow[1005:1015])
+    block = pipeline.take_block()
+    assert block.n == 10 and block.dropped == 0
+
+
+def test_take_vectors_are_copies_at_one_count(config):
+    pipeline = fast_pipeline(config, ts_sample = 10, correct_vol = True)
+    assert all(len(v) == 0 for v in pipeline.take_vectors(('t', 'insp')).values())
+    t, p1, p2, dp, flow = breaths(1200)
+    pipeline.process_block(t[:100], p1[:100], p2[:100], dp[:100], flow[:100])
+
+    # a block comes in between copying the first vector and the next
+    snapshot_view = pipeline.snapshot_view
+    calls = []
+    def interrupted_view(name, count):
+        view = snapshot_view(name, count)
+        if len(calls) == 0:
+            pipeline.process_block(t[100:105], p1[100:105], p2[100:105], dp[100:105], flow[100:105])
+        calls.append(name)
+        return view
+    pipeline.snapshot_view = interrupted_view
+
+    vectors = pipeline.take_vectors(('t', 'insp', 'vol'))
+    assert len(calls) == 6
+    assert len(vectors['t']) == len(vectors['insp']) == len(vectors['vol']) == 105
+    assert vectors['insp'].dtype == bool
+    assert np.array_equal(vectors['vol'], pipeline.fastdata.vol)
+
+    # and they don't change when the pipeline carries on
+    pipeline.snapshot_view = snapshot_view
+    held = vectors['t'].copy()
+    pipeline.process_block(t[105:], p1[105:], p2[105:], dp[105:], flow[105:])
+    assert np.array_equal(vectors['t'], held)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+test_replay.py
+
+Replaying sensor logs (data_handler/replay.py) made up in the text format.
+"""
+
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from conftest import MONITOR_DIR
+
+pytest.importorskip('scipy')
+from data_handler.replay import replay_engine
+
+
+@pytest.fixture
+def config():
+    with open(os.path.join(MONITOR_DIR, 'config', 'default_settings.yaml')) as f:
+        return yaml.load(f, Loader = yaml.FullLoader)
+
+
+def write_log(filename, t, p1, p2):
+    with open(filename, 'w') as f:
+        f.write('time \t p1 \t p2 \t dp\n')
+        for row in zip(t, p1, p2, p2 - p1):
+            f.write('%.6f\t%.6f\t%.6f\t%.6f\n' % row)
+
+
+def breathing_log(filename, t, dp_offset):
+    # ten samples a second: 10 s at rest, then breaths every 4 s, with an offset on p2
+    tt = np.arange(len(t))*0.1
+    dp = np.where(tt > 10, 0.3*np.sin(2*np.pi*tt/4), 0.0)
+    p1 = 5 + 5*np.clip(np.sin(2*np.pi*tt/4), 0, None)*(tt > 10)
+    write_log(filename, t, p1, p1 + dp + dp_offset)
+
+
+def test_whole_second_timestamps(config, tmp_path):
+    filename = str(tmp_path/'whole_seconds.txt')
+    n = 600
+    # ten samples a second, all stamped with the second they were taken in
+    t = 1588972688 + np.floor(np.arange(n)*0.1)
+    breathing_log(filename, t, 0.0)
+
+    engine = replay_engine(MONITOR_DIR, config, filename, t_start = 0.0)
+    assert engine.ts_recorded == pytest.approx(59/(n - 1)*1000)
+    assert np.all(np.diff(engine.t) > 0)
+    engine.run()
+    assert engine.fast_pipeline.fastdata.buffers['t'].count == n
+
+
+def test_dp_offset_is_zeroed(config, tmp_path):
+    filename = str(tmp_path/'offset.txt')
+    t = 1589499917 + np.arange(600)*0.1
+    breathing_log(filename, t, 0.05)
+
+    engine = replay_engine(MONITOR_DIR, config, filename)
+    assert engine.dp_offset == pytest.approx(0.05, abs = 1e-6)
+    assert np.abs(engine.dp[:100]).max() < 1e-6
+
+    engine = replay_engine(MONITOR_DIR, config, filename, zero_samples = 0)
+    assert engine.dp_offset == 0.0
+    assert engine.dp[:100] == pytest.approx(0.05, abs = 1e-6)
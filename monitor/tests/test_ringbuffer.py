@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+test_ringbuffer.py
+
+Wraparound, views and the overwriting methods of utils.ringbuffer.RingBuffer,
+and what another thread sees if it reads in the middle of a write.
+"""
+
+import numpy as np
+
+from utils.ringbuffer import RingBuffer
+
+
+def test_append_and_extend_wrap_around():
+    buf = RingBuffer(5, headroom = 2)
+    reference = []
+    for i, block in enumerate([[0], [1, 2, 3], [4], list(range(5, 14)), [14, 15], list(range(16, 40))]):
+        if len(block) == 1 and i % 2 == 0:
+            buf.append(block[0])
+        else:
+            buf.extend(block)
+        reference += block
+        assert buf.count == len(reference)
+        assert list(buf.view()) == reference[-5:]
+        assert buf.last() == reference[-1]
+        assert buf.first() == reference[-5:][0]
+    assert buf.full
+
+
+def test_view_at_until_the_headroom_runs_out():
+    buf = RingBuffer(4, headroom = 3)
+    buf.extend(np.arange(10))
+    count = buf.count
+    for i in range(3):
+        buf.append(100 + i)
+        assert buf.valid_at(count)
+        assert list(buf.view_at(count)) == [6, 7, 8, 9]
+    buf.append(200)
+    assert not buf.valid_at(count)
+    assert buf.view_at(count) is None
+
+
+def test_view_at_before_the_buffer_is_full():
+    buf = RingBuffer(8, headroom = 4)
+    buf.extend([1, 2, 3])
+    buf.extend([4, 5])
+    assert list(buf.view_at(3)) == [1, 2, 3]
+    assert list(buf.view_at(5)) == [1, 2, 3, 4, 5]
+
+
+class interrupted_ringbuffer(RingBuffer):
+    # calls on_write after every piece of a block is stored, like another
+    # thread getting to run in the middle of extend()
+    on_write = None
+
+    def _write(self, start, values):
+        super()._write(start, values)
+        if not self.on_write is None:
+            self.on_write()
+
+
+def test_reading_in_the_middle_of_extend():
+    buf = interrupted_ringbuffer(8, headroom = 4)
+    buf.extend(np.arange(10))
+    count = buf.count
+    expected = list(range(2, 10))
+
+    seen = []
+    def read():
+        # the new values aren't counted yet, so the old count is still the newest
+        assert buf.count == count
+        view = buf.view_at(count)
+        seen.append(None if view is None else list(view))
+        seen.append(buf.valid_at(count))
+
+    # a block that fits in the headroom leaves the data at count alone
+    buf.on_write = read
+    buf.extend([10, 11, 12])
+    assert len(seen) > 0
+    assert seen == [expected, True]*(len(seen)//2)
+    assert list(buf.view_at(count)) == expected
+
+    # a block that wraps past the headroom: whatever was read is reported as overwritten
+    buf.on_write = None
+    buf.extend([13])
+    count = buf.count
+    seen.clear()
+    buf.on_write = read
+    buf.extend(np.arange(14, 20))
+    assert all(valid is False for valid in seen[1::2])
+
+
+def test_set_at_and_set_last():
+    buf = RingBuffer(4, headroom = 2)
+    buf.extend(np.arange(7))
+    assert buf.set_at(5, 50)
+    assert list(buf.view()) == [3, 4, 50, 6]
+    # no longer held, or not appended yet
+    assert not buf.set_at(2, -1)
+    assert not buf.set_at(7, -1)
+    buf.set_last([60, 70])
+    assert list(buf.view()) == [3, 4, 60, 70]
+    # the second copy of the storage has been kept in step
+    buf.extend([8, 9, 10])
+    assert list(buf.view()) == [70, 8, 9, 10]
+
+
+def test_structured_records():
+    dtype = np.dtype([('a', float), ('b', int)])
+    buf = RingBuffer(3, dtype = dtype)
+    for i in range(5):
+        buf.append((i*0.5, i))
+    assert list(buf.view()['b']) == [2, 3, 4]
+    assert buf.set_at(3, (9.0, 9))
+    assert buf.view()[1]['a'] == 9.0
+
+
+def test_set_all_keeps_view_at_in_step():
+    buf = RingBuffer(4, headroom = 2)
+    buf.extend([1, 2])
+    buf.set_all([5, 6, 7])
+    assert buf.count == 3
+    assert list(buf.view()) == [5, 6, 7]
+    assert list(buf.view_at(3)) == [5, 6, 7]
+    buf.append(8)
+    assert list(buf.view_at(4)) == [5, 6, 7, 8]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the breath statistics (statistics/statistics.py) against numpy.
+"""
+
+import numpy as np
+
+from statistics.statistics import Stats, Statset
+
+
+def test_stats_match_numpy():
+    rng = np.random.default_rng(0)
+    values = rng.normal(5.0, 2.0, 57)
+    stat = Stats(10)
+    for x in values:
+        stat.add_data_point(x)
+    last = values[-10:]
+    assert np.isclose(stat.mean, np.mean(last))
+    assert np.isclose(stat.min, np.min(last))
+    assert np.isclose(stat.max, np.max(last))
+    assert np.isclose(stat.stderr, np.std(last)/np.sqrt(10))
+    assert np.isclose(stat.session.mean, np.mean(values))
+    assert np.isclose(stat.session.variance(), np.var(values))
+    assert np.allclose(stat.data, last)
+
+
+def test_nan_then_good_data_recovers():
+    stat = Stats(10)
+    assert not stat.add_data_point(np.nan)
+    values = np.arange(1.0, 12.0)
+    for x in values:
+        assert stat.add_data_point(x)
+    assert np.isclose(stat.mean, np.mean(values[-10:]))
+    assert np.isfinite(stat.stderr) and np.isfinite(stat.pcterr)
+    assert np.isclose(stat.session.mean, np.mean(values))
+    assert np.isfinite(stat.percentile(50))
+
+
+def test_none_and_inf_are_skipped_by_all_the_estimators():
+    stat = Stats(10)
+    stat.add_data_point(1.0)
+    assert not stat.add_data_point(None)
+    assert not stat.add_data_point(np.inf)
+    stat.add_data_point(3.0)
+    assert len(stat.window) == stat.session.n == stat.sketch.n == 2
+    assert stat.mean == 2.0
+    assert stat.max == 3.0
+
+
+def test_statset_reset():
+    statset = Statset(5)
+    statset.add_stat('peep')
+    statset.add_data_point('peep', 4.0)
+    statset.reset_all()
+    assert statset.stats['peep'].n_points == 0
+    assert np.isnan(statset.stats['peep'].mean)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+test_trends.py
+
+The long term trend store (statistics/trends.py): the per breath and per
+interval rows, and which tier a time range is read from.
+"""
+
+import numpy as np
+import pytest
+
+from statistics.trends import TrendStore, TrendTier
+
+
+T0 = 1589500800.0   # on the hour
+
+
+def test_rows_per_interval():
+    tier = TrendTier('1 min', 60, 10, ('peep', 'vt'))
+    for i, (peep, vt) in enumerate([(5.0, 400.0), (7.0, None), (6.0, 420.0), (4.0, 380.0)]):
+        # three breaths in the first minute, one in the next
+        t = T0 + (10*i if i < 3 else 70)
+        valid = np.array([True, not vt is None])
+        tier.add(t, np.array([peep, vt or 0.0]), valid)
+
+    # the open row isn't stored until the next interval starts
+    assert len(tier) == 1
+    row = tier.rows.last()
+    assert row['t'] == T0
+    assert (row['peep_min'], row['peep_mean'], row['peep_max'], row['peep_n']) == (5.0, 6.0, 7.0, 3)
+    assert (row['vt_min'], row['vt_mean'], row['vt_max'], row['vt_n']) == (400.0, 410.0, 420.0, 2)
+    assert tier.current()[0] == T0 + 60
+
+
+def test_breaths_with_nothing_valid_leave_no_row():
+    store = TrendStore(('peep', 'vt'))
+    store.add(T0, {'peep': None, 'vt': np.nan})
+    store.add(T0 + 5, {'peep': 5.0})
+    rows = store.tier('breath').rows.view()
+    assert len(rows) == 1
+    assert rows['peep_mean'][0] == 5.0 and rows['vt_n'][0] == 0 and np.isnan(rows['vt_mean'][0])
+
+
+def test_query_picks_the_finest_tier_that_fits():
+    tiers = (('breath', 0, 100), ('1 min', 60, 100), ('1 h', 3600, 100))
+    store = TrendStore(('peep',), tiers = tiers)
+    # a breath every 10 s for 3 h
+    for i in range(3*360):
+        store.add(T0 + 10*i, {'peep': float(i)})
+
+    # the last 100 breaths are still there breath by breath
+    tier, rows = store.query(T0 + 10*1000, T0 + 10*1079)
+    assert tier.name == 'breath' and len(rows) == 80
+    assert rows['peep_mean'][0] == 1000.0
+
+    # further back than the breath tier goes, but too many rows for max_rows
+    tier, rows = store.query(T0, T0 + 3*3600, max_rows = 50)
+    assert tier.name == '1 h' and list(rows['t']) == [T0, T0 + 3600, T0 + 7200]
+    assert rows['peep_mean'][0] == np.mean(np.arange(360))
+    assert rows['peep_n'][-1] == 360
+
+    # the last half hour is too far back for the breaths, but not the minutes
+    tier, rows = store.query(T0 + 3*3600 - 1800, T0 + 3*3600)
+    assert tier.name == '1 min' and len(rows) == 30
+    assert rows['t'][0] == T0 + 3*3600 - 1800 and rows['t'][-1] == T0 + 3*3600 - 60
+    assert rows['peep_n'][-1] == 6
+
+
+def test_queries_include_the_open_rows():
+    store = TrendStore(('peep',))
+    # 50 breaths 3 s apart, the last ones in a minute that isn't over
+    for i in range(50):
+        store.add(T0 + 3*i, {'peep': float(i)})
+    t_end = T0 + 3*49
+
+    rows = store.tier('1 min').query(T0, t_end)
+    assert list(rows['t']) == [T0, T0 + 60, T0 + 120]
+    assert list(rows['peep_n']) == [20, 20, 10]
+    assert rows['peep_max'][-1] == 49.0
+    for name in ('15 min', '1 h'):
+        rows = store.tier(name).query(T0, t_end)
+        assert len(rows) == 1 and rows['peep_n'][0] == 50 and rows['peep_mean'][0] == 24.5
+
+    # the coarse tiers have no stored rows yet, but can still be picked
+    tier, rows = store.query(T0, t_end, max_rows = 1)
+    assert tier.name == '15 min' and rows['peep_n'][0] == 50
+
+    # the open row isn't there before it starts, and is a copy
+    assert len(store.tier('1 min').query(T0, T0 + 119)) == 2
+    rows = store.tier('1 min').query(T0, t_end)
+    store.add(t_end + 1, {'peep': 100.0})
+    assert rows['peep_n'][-1] == 10
+
+    with pytest.raises(KeyError):
+        store.tier('1 day')
+    store.clear()
+    assert store.t_first is None and all(len(tier) == 0 for tier in store.tiers)
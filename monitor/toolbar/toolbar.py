@@ -4,8 +4,9 @@ Module containing the Toolbar class
 which shows the current status of the
 ventilator
 '''
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5 import QtGui, QtCore
+from utils.uicache import load_ui
 
 class Toolbar(QtWidgets.QWidget):
     '''
@@ -18,7 +19,7 @@ class Toolbar(QtWidgets.QWidget):
         Provides a passthrough to underlying widgets.
         """
         super(Toolbar, self).__init__(*args)
-        uic.loadUi("toolbar/toolbar.ui", self)
+        load_ui("toolbar/toolbar.ui", self)
 
         self.label_status = self.findChild(QtWidgets.QLabel, "label_status")
         self.button_unlockscreen = self.findChild(
@@ -3,7 +3,8 @@
 Main window helper
 """
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
+from utils.uicache import load_ui
 
 
 class tools(QtWidgets.QWidget):
@@ -18,4 +19,4 @@ class tools(QtWidgets.QWidget):
         Provides a passthrough to underlying widgets.
         """
         super(QtWidgets.QWidget, self).__init__(*args)
-        uic.loadUi("tools/tools.ui", self)
+        load_ui("tools/tools.ui", self)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+configcache.py
+
+Loads config/default_settings.yaml once: checks it, keeps the checked
+config as a pickle so later starts don't parse the YAML again, and compiles
+it into objects with __slots__ so the code that runs every frame reads
+attributes (cfg.plots.plot_top.color) instead of chained dict lookups
+(config['plots']['plot_top']['color']).
+
+The pickle is kept in the cache directory with the SHA-1 of the YAML file it
+was made from, and is only used if the YAML file still has that hash and it
+was written by the same version of this module. Anything going wrong with
+the cache falls back to parsing the YAML.
+
+load() returns both forms. The dict is still what gets passed around and
+what the settings and alarms change at run time; the compiled config is a
+read only snapshot of the file, for the values that don't change.
+
+Usage:
+    from utils import configcache
+    config, cfg = configcache.load('config/default_settings.yaml')
+    cfg.line_width, cfg.plots.plot_top.color, cfg.monitors['peep'].units
+
+"""
+
+import hashlib
+import os
+import pickle
+
+import yaml
+
+
+# where the pickles go, relative to the working directory (the monitor directory)
+CACHE_DIR = '__configcache__'
+
+# change this when the checks change, so old pickles aren't trusted
+CACHE_VERSION = 1
+
+_enabled = True
+
+number = (int, float)
+
+# required top level keys and their types
+SCHEMA = {
+    'display_time':         number,
+    'fastdata_interval':    number,
+    'slowdata_interval':    number,
+    'plot_interval':        number,
+    'nsamples':             int,
+    'line_width':           number,
+    'axis_line_width':      number,
+    'axis_line_color':      str,
+    'n_major_ticks':        int,
+    'n_minor_ticks':        int,
+    'left_ax_label_space':  number,
+    'show_x_axis_labels':   bool,
+    'show_x_axis_ticks':    bool,
+    'use_looping_plots':    bool,
+    'get_all_fields':       list,
+    'statistics':           list,
+    'displayed_monitors':   list,
+    'monitors':             dict,
+    'alarms':               dict,
+    'plots':                dict,
+}
+
+# required keys of each entry of the sections that are dicts of entries
+ENTRY_SCHEMA = {
+    'monitors': {'name': str},
+    'alarms':   {'observable': str, 'linked_monitor': str},
+    'plots':    {'name': str, 'observable': str, 'color': str, 'units': str, 'min': number, 'max': number},
+}
+
+# lists of names that should all be monitors
+MONITOR_LISTS = ('statistics', 'displayed_monitors', 'trends')
+
+
+def enable(on = True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+class ConfigNode(object):
+    """
+    Base of the compiled config sections. Each section gets a subclass with
+    its keys as __slots__; the values are read as attributes, or by name
+    like a dict for the code that looks them up with a variable.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def get(self, key, default = None):
+        return getattr(self, key, default)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def keys(self):
+        return self.__slots__
+
+    def values(self):
+        return tuple(getattr(self, key) for key in self.__slots__)
+
+    def items(self):
+        return tuple((key, getattr(self, key)) for key in self.__slots__)
+
+    def __repr__(self):
+        return 'ConfigNode(' + ', '.join(f'{key}={getattr(self, key)!r}' for key in self.__slots__) + ')'
+
+
+# one ConfigNode subclass per set of keys
+_node_classes = {}
+
+
+def _node_class(keys):
+    node_class = _node_classes.get(keys)
+    if node_class is None:
+        node_class = type('ConfigNode', (ConfigNode,), {'__slots__': keys})
+        _node_classes[keys] = node_class
+    return node_class
+
+
+def compile_config(value):
+    """
+    Returns the compiled form of a config value: dicts become ConfigNodes
+    (or stay dicts if their keys aren't all names, eg. the monitors' maps)
+    and lists become tuples.
+    """
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) and key.isidentifier() for key in value):
+            return {key: compile_config(item) for key, item in value.items()}
+        keys = tuple(value)
+        node = _node_class(keys)()
+        for key in keys:
+            setattr(node, key, compile_config(value[key]))
+        return node
+    if isinstance(value, list):
+        return tuple(compile_config(item) for item in value)
+    return value
+
+
+def _type_name(types):
+    if isinstance(types, tuple):
+        return ' or '.join(t.__name__ for t in types)
+    return types.__name__
+
+
+def _check_type(value, types):
+    # bools are ints to python, but not numbers in the config
+    if isinstance(value, bool) and not (types is bool):
+        return False
+    return isinstance(value, types)
+
+
+def validate(config):
+    """
+    Checks the config. Returns (errors, warnings), lists of messages: errors
+    are missing keys or values of the wrong type that the monitor can't run
+    without, warnings are names that don't refer to anything.
+    """
+    errors = []
+    warnings = []
+    if not isinstance(config, dict):
+        return ['the config is not a dict of settings'], warnings
+
+    for key, types in SCHEMA.items():
+        if not key in config:
+            errors.append(f'{key} is missing')
+        elif not _check_type(config[key], types):
+            errors.append(f'{key} should be {_type_name(types)}, not {config[key]!r}')
+
+    for section, entry_schema in ENTRY_SCHEMA.items():
+        entries = config.get(section)
+        if not isinstance(entries, dict):
+            continue
+        for name, entry in entries.items():
+            if not isinstance(entry, dict):
+                errors.append(f'{section}.{name} should be a dict of settings')
+                continue
+            for key, types in entry_schema.items():
+                if not key in entry:
+                    errors.append(f'{section}.{name}.{key} is missing')
+                elif not _check_type(entry[key], types):
+                    errors.append(f'{section}.{name}.{key} should be {_type_name(types)}, not {entry[key]!r}')
+
+    monitors = config.get('monitors')
+    if isinstance(monitors, dict):
+        for key in MONITOR_LISTS:
+            for name in config.get(key) or []:
+                if not name in monitors:
+                    warnings.append(f'{key} lists {name}, which is not a monitor')
+        for name, alarm in (config.get('alarms') or {}).items():
+            if isinstance(alarm, dict) and not alarm.get('linked_monitor') in monitors:
+                warnings.append(f'alarms.{name} is linked to {alarm.get("linked_monitor")}, which is not a monitor')
+
+    return errors, warnings
+
+
+def _cache_file(filename):
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(CACHE_DIR, name + '.pickle')
+
+
+def _read_cache(pickle_file, sha1):
+    # the cached config if it was made from a file with this hash, otherwise None
+    try:
+        with open(pickle_file, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['version'] == CACHE_VERSION and cached['sha1'] == sha1:
+            return cached['config']
+    except Exception:
+        pass
+    return None
+
+
+def _write_cache(pickle_file, sha1, config):
+    # write to a temporary file first so a half written file is never read
+    os.makedirs(CACHE_DIR, exist_ok = True)
+    tmpfile = pickle_file + '.tmp'
+    with open(tmpfile, 'wb') as f:
+        pickle.dump({'version': CACHE_VERSION, 'sha1': sha1, 'config': config}, f, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpfile, pickle_file)
+
+
+def parse(text):
+    """
+    Parses and checks the YAML text of a config file. Prints the warnings and
+    raises ValueError listing the errors if there are any.
+    """
+    config = yaml.load(text, Loader = yaml.FullLoader)
+    errors, warnings = validate(config)
+    for warning in warnings:
+        print(f'configcache: warning: {warning}')
+    if len(errors) > 0:
+        raise ValueError('bad config:\n  ' + '\n  '.join(errors))
+    return config
+
+
+def load(filename):
+    """
+    Loads a config file. Returns (config, cfg): the config as a dict and its
+    compiled form.
+    """
+    with open(filename, 'rb') as f:
+        text = f.read()
+
+    config = None
+    if _enabled:
+        sha1 = hashlib.sha1(text).hexdigest()
+        pickle_file = _cache_file(filename)
+        config = _read_cache(pickle_file, sha1)
+
+    if config is None:
+        config = parse(text)
+        if _enabled:
+            try:
+                _write_cache(pickle_file, sha1, config)
+            except Exception as e:
+                print(f'configcache: could not cache {filename}: {e}')
+
+    return config, compile_config(config)
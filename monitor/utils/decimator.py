@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+decimator.py
+
+Peak preserving min/max decimation of a plot's data vector, kept up to date
+one point at a time.
+
+The points are grouped into columns of points_per_column consecutive
+points, and each column is drawn as two points: its min and its max, in
+the order they came in. A window of any length is then drawn with
+2*n_columns points, and a pressure spike or flow peak can't fall between
+two drawn points the way it can with plain subsampling.
+
+Each new point only updates the min/max of the column it falls in, so
+keeping the decimated data up to date costs the same per point however
+long the window is.
+
+Scrolling plots keep the columns in a mirrored ring (like RingBuffer) so
+the newest column, which is still filling up, is always drawn at the right
+hand edge. Looping plots overwrite the columns in place as the write
+position goes round.
+
+"""
+
+import numpy as np
+
+
+class MinMaxDecimator(object):
+    """
+    Constituents:
+        n_samples           =   number of points in the full data vector
+        n_columns           =   number of columns drawn
+        points_per_column   =   number of points per column
+        looping             =   True for looping plots, False for scrolling ones
+        x                   =   x values of the drawn points (two per column)
+    """
+
+    def __init__(self, n_samples, n_columns, looping = False, fill = 0.0):
+        self.n_samples = int(n_samples)
+        self.points_per_column = max(int(np.ceil(self.n_samples/int(n_columns))), 1)
+        self.n_columns = int(np.ceil(self.n_samples/self.points_per_column))
+        self.looping = looping
+
+        # scrolling: two copies of the ring of min/max pairs, back to back.
+        # looping: the pairs in column order
+        self._ring = 2*self.n_columns
+        n_storage = 2*self._ring if not looping else self._ring
+        self._storage = np.full(n_storage, fill, dtype = float)
+
+        # scrolling: slot after the newest pair. looping: write position in the full vector
+        self._head = 0
+        self._index = 0
+
+        # the column that is filling up: number of points in it, min, max and
+        # whether the min came before the max
+        self._n_fill = 0
+        self._min = 0.0
+        self._max = 0.0
+        self._min_first = True
+
+        self.x = np.zeros(self._ring)
+
+    def set_x(self, xdata):
+        """
+        Works out the x values of the drawn points from the x values of the
+        full data vector.
+
+        arguments:
+        - xdata: (array) the x values of the full vector
+        """
+        xdata = np.asarray(xdata, dtype = float)
+        if self.looping:
+            # each column at the x of its first point
+            columns = xdata[::self.points_per_column]
+        else:
+            # newest column at the right hand edge, the rest spaced out to the left
+            dx = (xdata[-1] - xdata[0])/max(self.n_samples - 1, 1)
+            columns = xdata[-1] - dx*self.points_per_column*np.arange(self.n_columns - 1, -1, -1)
+        self.x[0::2] = columns[:self.n_columns]
+        self.x[1::2] = columns[:self.n_columns]
+
+    def push(self, value):
+        # add a point, starting a new column if the last one is full
+        if self._n_fill == self.points_per_column or (self.looping and self._index % self.points_per_column == 0):
+            self._n_fill = 0
+        if self._n_fill == 0:
+            self._min = value
+            self._max = value
+            self._min_first = True
+            if not self.looping:
+                self._head += 2
+                if self._head == self._ring:
+                    self._head = 0
+        elif value < self._min:
+            self._min = value
+            self._min_first = False
+        elif value > self._max:
+            self._max = value
+            self._min_first = True
+        self._n_fill += 1
+
+        # write the pair for the column in the order the min and max came in
+        if self._min_first:
+            first, second = self._min, self._max
+        else:
+            first, second = self._max, self._min
+        if self.looping:
+            slot = 2*(self._index//self.points_per_column)
+            self._storage[slot] = first
+            self._storage[slot + 1] = second
+            self._index += 1
+            if self._index == self.n_samples:
+                self._index = 0
+                self._n_fill = 0
+        else:
+            slot = self._head - 2
+            if slot < 0:
+                slot += self._ring
+            self._storage[slot] = first
+            self._storage[slot + 1] = second
+            self._storage[slot + self._ring] = first
+            self._storage[slot + self._ring + 1] = second
+
+    def rebuild(self, values, index = 0):
+        """
+        Recalculates all the columns from the full data vector, O(N).
+
+        arguments:
+        - values: (array) the full data vector, oldest point first for scrolling plots
+        - index: (int) the write position in the vector, for looping plots
+        """
+        self._head = 0
+        self._index = 0
+        self._n_fill = 0
+        for value in values:
+            self.push(value)
+
+        if self.looping:
+            # start the current column again from the first point of this lap,
+            # the points after index are from the last lap
+            self._index = index - index % self.points_per_column
+            self._n_fill = 0
+            for value in values[self._index:index]:
+                self.push(value)
+
+    def view(self):
+        # the drawn points, ordered to match x. This is not a copy!
+        if self.looping:
+            return self._storage
+        return self._storage[self._head:self._head + self._ring]
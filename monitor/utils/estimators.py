@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+estimators.py
+
+Streaming estimators over a sliding window of the last N values, or over
+everything since they were last cleared.
+
+These are updated one value at a time (push) or a block at a time (extend)
+and cost the same per value no matter how long the window is, so the loops
+don't have to redo numpy reductions over the whole data vectors every tick.
+For WindowedMean and WindowedSlope push returns a plain float and doesn't
+allocate, and extend returns an array with the estimate after each value
+of the block, exactly as if the values had been pushed one by one. The
+statistics ones (RunningStats, WindowedVariance, QuantileSketch) are read
+through their attributes instead, and skip values that aren't finite: a
+nan would otherwise stay in their running sums for good.
+
+"""
+
+import bisect
+import math
+from collections import deque
+import numpy as np
+
+from utils.ringbuffer import RingBuffer
+
+
+def _window_values(old, new, idx):
+    # values at positions idx of the old vector followed by the new block,
+    # without concatenating them. negative positions are clipped to the start
+    idx = np.maximum(idx, 0)
+    n_old = len(old)
+    in_old = idx < n_old
+    out = np.empty(len(idx))
+    out[in_old] = old[idx[in_old]]
+    out[~in_old] = new[idx[~in_old] - n_old]
+    return out
+
+
+class WindowedMean(object):
+    """
+    Mean (and sum) of the last `window` values.
+
+    A running sum is kept, with the value leaving the window subtracted as
+    each new one comes in. It is recomputed from scratch once every window's
+    worth of values so rounding errors can't build up.
+    """
+
+    def __init__(self, window):
+        self.window = int(window)
+        self.history = RingBuffer(self.window)
+        self.sum = 0.0
+        self._since_resync = 0
+
+    def __len__(self):
+        return len(self.history)
+
+    @property
+    def value(self):
+        n = len(self.history)
+        if n == 0:
+            return 0.0
+        return self.sum/n
+
+    def push(self, x):
+        history = self.history
+        if history.full:
+            self.sum -= history.first()
+        history.append(x)
+        self.sum += x
+        self._count_update(1)
+        return self.value
+
+    def extend(self, values):
+        values = np.asarray(values, dtype = float)
+        n_new = len(values)
+        if n_new == 0:
+            return np.empty(0)
+        old = self.history.view()
+        n_old = len(old)
+        pos = n_old + np.arange(n_new)
+
+        # the value that falls out of the window as each new one is added
+        leaving = _window_values(old, values, pos - self.window)
+        leaving[pos < self.window] = 0.0
+
+        sums = self.sum + np.cumsum(values - leaving)
+        means = sums/np.minimum(pos + 1, self.window)
+
+        self.history.extend(values)
+        self.sum = sums[-1]
+        self._count_update(n_new)
+        return means
+
+    def _count_update(self, n):
+        self._since_resync += n
+        if self._since_resync >= self.window:
+            self.sum = float(np.sum(self.history.view()))
+            self._since_resync = 0
+
+    def clear(self):
+        self.history.clear()
+        self.sum = 0.0
+        self._since_resync = 0
+
+
+class WindowedSlope(object):
+    """
+    Mean change per value over the last `window` values.
+
+    The mean of the first differences telescopes down to the change across
+    the window over the number of differences:
+        mean(x[-N+1:] - x[-N:-1]) = (x[-1] - x[-N])/(N - 1)
+    so only the newest and oldest values in the window are needed.
+
+    Until `min_count` values have been pushed the slope isn't trusted and
+    `default` is returned instead. If min_count is less than the window the
+    slope is taken over however many values there are so far.
+    """
+
+    def __init__(self, window, min_count = None, default = 0.0):
+        self.window = int(window)
+        if min_count is None:
+            min_count = self.window
+        self.min_count = max(int(min_count), 2)
+        self.default = default
+        self.history = RingBuffer(self.window)
+        self.value = default
+
+    def __len__(self):
+        return len(self.history)
+
+    @property
+    def ready(self):
+        return self.history.count >= self.min_count
+
+    def push(self, x):
+        history = self.history
+        history.append(x)
+        if history.count >= self.min_count:
+            self.value = (x - history.first())/(len(history) - 1)
+        else:
+            self.value = self.default
+        return self.value
+
+    def extend(self, values):
+        values = np.asarray(values, dtype = float)
+        n_new = len(values)
+        if n_new == 0:
+            return np.empty(0)
+        old = self.history.view()
+        n_old = len(old)
+        pos = n_old + np.arange(n_new)
+        n_held = np.minimum(pos + 1, self.window)
+        count = self.history.count + np.arange(1, n_new + 1)
+
+        # oldest value in the window after each new one is added
+        oldest = _window_values(old, values, pos - n_held + 1)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            slopes = np.where(count >= self.min_count, (values - oldest)/(n_held - 1), self.default)
+
+        self.history.extend(values)
+        self.value = slopes[-1]
+        return slopes
+
+    def clear(self):
+        self.history.clear()
+        self.value = self.default
+
+
+class WindowedMinMax(object):
+    """
+    Minimum and maximum of the last `window` values.
+
+    Uses the usual monotonic queues: the max queue only keeps values that
+    are bigger than everything pushed after them (and the other way round
+    for the min), so the front of each queue is the extreme of the window.
+    Each value goes in and out of a queue once, so a push is O(1) on average.
+    """
+
+    def __init__(self, window):
+        self.window = int(window)
+        self.count = 0
+        self._max = deque()
+        self._min = deque()
+
+    def __len__(self):
+        return min(self.count, self.window)
+
+    @property
+    def max(self):
+        if self.count == 0:
+            return None
+        return self._max[0][1]
+
+    @property
+    def min(self):
+        if self.count == 0:
+            return None
+        return self._min[0][1]
+
+    def push(self, x):
+        count = self.count
+        qmax = self._max
+        qmin = self._min
+
+        while qmax and qmax[-1][1] <= x:
+            qmax.pop()
+        qmax.append((count, x))
+        while qmin and qmin[-1][1] >= x:
+            qmin.pop()
+        qmin.append((count, x))
+
+        # drop whatever has slid out of the window
+        oldest = count + 1 - self.window
+        if qmax[0][0] < oldest:
+            qmax.popleft()
+        if qmin[0][0] < oldest:
+            qmin.popleft()
+
+        self.count = count + 1
+
+    def extend(self, values):
+        for x in values:
+            self.push(x)
+
+    def clear(self):
+        self.count = 0
+        self._max.clear()
+        self._min.clear()
+
+
+class RunningStats(object):
+    """
+    Count, mean, variance, min and max of every value pushed since the last
+    clear, with Welford's update so the variance doesn't lose precision the
+    way sum(x**2) - n*mean**2 does.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return self.n
+
+    def push(self, x):
+        if not math.isfinite(x):
+            return
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta/self.n
+        self._m2 += delta*(x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def extend(self, values):
+        for x in values:
+            self.push(x)
+
+    def variance(self, ddof = 0):
+        if self.n <= ddof:
+            return np.nan
+        return max(self._m2, 0.0)/(self.n - ddof)
+
+    def clear(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+
+class WindowedVariance(object):
+    """
+    Mean and variance of the last `window` values.
+
+    Welford's update run forwards for the value coming in and backwards for
+    the value leaving the window. Like WindowedMean it's recomputed from
+    scratch once every window's worth of values so rounding errors can't
+    build up.
+    """
+
+    def __init__(self, window):
+        self.window = int(window)
+        self.history = RingBuffer(self.window)
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._since_resync = 0
+
+    def __len__(self):
+        return len(self.history)
+
+    def push(self, x):
+        if not math.isfinite(x):
+            return
+        history = self.history
+        if history.full:
+            # take the oldest value back out
+            old = history.first()
+            n = len(history) - 1
+            if n == 0:
+                self.mean = 0.0
+                self._m2 = 0.0
+            else:
+                delta = old - self.mean
+                self.mean -= delta/n
+                self._m2 -= delta*(old - self.mean)
+        history.append(x)
+        n = len(history)
+        delta = x - self.mean
+        self.mean += delta/n
+        self._m2 += delta*(x - self.mean)
+
+        self._since_resync += 1
+        if self._since_resync >= self.window:
+            data = history.view()
+            self.mean = float(np.mean(data))
+            self._m2 = float(np.sum((data - self.mean)**2))
+            self._since_resync = 0
+
+    def extend(self, values):
+        for x in values:
+            self.push(x)
+
+    def variance(self, ddof = 0):
+        n = len(self.history)
+        if n <= ddof:
+            return np.nan
+        return max(self._m2, 0.0)/(n - ddof)
+
+    def clear(self):
+        self.history.clear()
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._since_resync = 0
+
+
+class QuantileSketch(object):
+    """
+    Approximate quantiles of every value pushed, in bounded memory.
+
+    A streaming histogram (Ben-Haim & Tom-Tov): at most `size` bins, each a
+    (centre, count) pair kept in order. A new value gets a bin of its own,
+    and if that makes one too many the two bins with the closest centres
+    are merged into one at their weighted mean. The quantiles are read off
+    the cumulative counts, interpolating between the bin centres, so they're
+    exact until there are more than `size` distinct values and close after.
+    Each push is O(size), however many values have gone in.
+    """
+
+    def __init__(self, size = 64):
+        self.size = int(size)
+        self.clear()
+
+    def __len__(self):
+        return self.n
+
+    def push(self, x):
+        if not math.isfinite(x):
+            return
+        self.n += 1
+        centres = self._centres
+        counts = self._counts
+        i = bisect.bisect_left(centres, x)
+        if i < len(centres) and centres[i] == x:
+            counts[i] += 1
+            return
+        centres.insert(i, x)
+        counts.insert(i, 1)
+        if len(centres) <= self.size:
+            return
+
+        # merge the closest pair of neighbouring bins
+        gaps = [centres[j + 1] - centres[j] for j in range(len(centres) - 1)]
+        j = gaps.index(min(gaps))
+        count = counts[j] + counts[j + 1]
+        centres[j] = (centres[j]*counts[j] + centres[j + 1]*counts[j + 1])/count
+        counts[j] = count
+        del centres[j + 1]
+        del counts[j + 1]
+
+    def extend(self, values):
+        for x in values:
+            self.push(x)
+
+    def quantile(self, q):
+        """
+        Value below which a fraction q (0 to 1) of the values fall, or nan
+        if nothing has been pushed.
+        """
+        if self.n == 0:
+            return np.nan
+        # each bin's count is taken to be centred on its centre
+        cumulative = np.cumsum(self._counts) - 0.5*np.asarray(self._counts)
+        return float(np.interp(q*self.n, cumulative, self._centres))
+
+    def percentile(self, p):
+        return self.quantile(p/100.0)
+
+    def clear(self):
+        self.n = 0
+        self._centres = []
+        self._counts = []
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+extrema.py
+
+Finds the peaks and troughs of a signal as the samples come in, looking at
+each new sample once instead of running scipy.signal.find_peaks over the
+whole window every time.
+
+It's a zigzag detector with hysteresis: while the signal is falling the
+lowest value so far is the trough candidate, and it's confirmed as a
+minimum once the signal has come back up by at least `prominence` (and the
+other way round for the maxima). Like find_peaks' prominence and distance
+arguments, a dip smaller than `prominence` isn't a minimum, and of two
+minima closer together than `distance` only the lower one is kept.
+
+A minimum is only confirmed once the signal has risen again, so it's
+reported a little after it happened. The confirmed minima and maxima are
+kept as (t, x) in small RingBuffers.
+
+Like find_peaks' width argument, the minima can also be made to have a
+minimum `width`, measured halfway up the trough: halfway between its bottom
+and the lower of the maximum the signal fell from and the one it rises to
+(find_peaks measures the prominence against the highest point back to a
+lower trough, so on a drifting signal its widths come out wider). That
+needs both sides of the trough, so a trough that has risen by the
+prominence is held until the signal has come back up as far as it fell,
+or a maximum after it is confirmed, and the width is then measured from
+the last samples, which are kept for it. Narrow dips, like the steps where
+the volume integral restarts, are not minima.
+
+"""
+
+import numpy as np
+
+from utils.ringbuffer import RingBuffer
+
+
+# what push() found
+NOTHING = 0
+NEW_MINIMUM = 1
+NEW_MAXIMUM = 2
+
+
+class ExtremaDetector(object):
+    """
+    Constituents:
+        prominence      =   how far the signal has to come back from an extreme to confirm it
+        distance        =   min time between two minima (or two maxima)
+        max_minimum     =   minima above this are ignored (None = no limit)
+        width           =   min width of a minimum, halfway up the trough (0 = no limit)
+        history_t/x     =   RingBuffers of the last samples, to measure the width on
+        minima_t/x      =   RingBuffers of the times and values of the last minima
+        maxima_t/x      =   the same for the maxima
+        replaced        =   True if the last NEW_MINIMUM/NEW_MAXIMUM replaced the
+                            previous one (it was within distance of it) rather than adding one
+    """
+
+    def __init__(self, prominence, distance = 0.0, max_minimum = None, width = 0.0, n_keep = 64, n_history = 2048):
+        self.prominence = prominence
+        self.distance = distance
+        self.max_minimum = max_minimum
+        self.width = width
+        self.minima_t = RingBuffer(n_keep)
+        self.minima_x = RingBuffer(n_keep)
+        self.maxima_t = RingBuffer(n_keep)
+        self.maxima_x = RingBuffer(n_keep)
+        self.history_t = RingBuffer(n_history if width > 0 else 0)
+        self.history_x = RingBuffer(n_history if width > 0 else 0)
+        self.replaced = False
+        self.clear()
+
+    def push(self, t, x):
+        """
+        Adds a sample. Returns NEW_MINIMUM or NEW_MAXIMUM if it confirmed
+        one, NEW_MINIMUM | NEW_MAXIMUM if it confirmed both (a maximum, and
+        the minimum before it that was waiting to be measured), otherwise
+        NOTHING.
+        """
+        # the sample's number, to find it in the history
+        i = self._n_pushed
+        self._n_pushed += 1
+        if self.width > 0:
+            self.history_t.append(t)
+            self.history_x.append(x)
+
+        if self._direction == 0:
+            # don't know which way it's going yet, follow both extremes
+            if x < self._lo_x:
+                self._lo_i, self._lo_t, self._lo_x = i, t, x
+            if x > self._hi_x:
+                self._hi_i, self._hi_t, self._hi_x = i, t, x
+            if x - self._lo_x >= self.prominence:
+                self._direction = 1
+                self._hi_i, self._hi_t, self._hi_x = i, t, x
+                return self._found_minimum(x)
+            if self._hi_x - x >= self.prominence:
+                self._direction = -1
+                self._lo_i, self._lo_t, self._lo_x = i, t, x
+                return self._confirm_maximum()
+            return NOTHING
+
+        if self._direction < 0:
+            # falling: looking for the bottom
+            if x < self._lo_x:
+                self._lo_i, self._lo_t, self._lo_x = i, t, x
+            elif x - self._lo_x >= self.prominence:
+                self._direction = 1
+                self._hi_i, self._hi_t, self._hi_x = i, t, x
+                return self._found_minimum(x)
+        else:
+            # rising: looking for the top
+            if x > self._hi_x:
+                self._hi_i, self._hi_t, self._hi_x = i, t, x
+                if self._pending and x - self._lo_x >= self._fall:
+                    # back up as far as it fell, the trough can be measured
+                    return self._measure_minimum(self._fall)
+            elif self._hi_x - x >= self.prominence:
+                found = NOTHING
+                if self._pending:
+                    # the rise is over, the trough is as deep as it'll get
+                    found = self._measure_minimum(min(self._fall, self._hi_x - self._lo_x))
+                self._direction = -1
+                self._lo_i, self._lo_t, self._lo_x = i, t, x
+                return found | self._confirm_maximum()
+        return NOTHING
+
+    def _found_minimum(self, x):
+        # the signal has risen by the prominence from the bottom of a trough
+        if self.width <= 0:
+            return self._confirm_minimum()
+        # how far it fell to the bottom, from the highest sample since the last maximum
+        # (if the bottom is older than the history it's measured from the start)
+        self._fall = self._history_max(self._fall_start, self._lo_i) - self._lo_x
+        if self._fall == -np.inf:
+            self._fall = np.inf
+        self._pending = True
+        if x - self._lo_x >= self._fall:
+            return self._measure_minimum(self._fall)
+        return NOTHING
+
+    def _history_max(self, i_start, i_stop):
+        # the highest sample from sample number i_start up to i_stop, of the ones still held
+        xs = self.history_x.view()
+        offset = self._n_pushed - len(xs)
+        if i_stop < offset:
+            return -np.inf
+        return np.max(xs[max(i_start - offset, 0):i_stop - offset + 1])
+
+    def _measure_minimum(self, depth):
+        # confirm the trough that was waiting if it's wide enough halfway up its depth
+        self._pending = False
+        if depth <= 0:
+            # it didn't fall into it, like a peak at the edge of the data
+            return NOTHING
+        ts = self.history_t.view()
+        xs = self.history_x.view()
+        i_lo = self._lo_i - (self._n_pushed - len(xs))
+        if i_lo < 0:
+            # the bottom is older than the history, it's a wide trough
+            return self._confirm_minimum()
+        level = self._lo_x + 0.5*depth
+
+        # the last sample at or above the level before the bottom, and the first after it
+        left = np.flatnonzero(xs[:i_lo] >= level)
+        right = np.flatnonzero(xs[i_lo:] >= level)
+        t_left = ts[0] if len(left) == 0 else self._crossing(ts, xs, left[-1], left[-1] + 1, level)
+        t_right = ts[-1] if len(right) == 0 else self._crossing(ts, xs, i_lo + right[0] - 1, i_lo + right[0], level)
+        if t_right - t_left < self.width:
+            return NOTHING
+        return self._confirm_minimum()
+
+    def _crossing(self, ts, xs, i, j, level):
+        # the time the line between samples i and j crosses the level
+        if xs[j] == xs[i]:
+            return ts[j]
+        return ts[i] + (ts[j] - ts[i])*(level - xs[i])/(xs[j] - xs[i])
+
+    def _confirm_minimum(self):
+        t, x = self._lo_t, self._lo_x
+        if not self.max_minimum is None and x > self.max_minimum:
+            return NOTHING
+        return self._keep(self.minima_t, self.minima_x, t, x, x < self.minima_x.last(np.inf))
+
+    def _confirm_maximum(self):
+        t, x = self._hi_t, self._hi_x
+        # the next trough's fall is measured from here
+        self._fall_start = self._hi_i
+        return self._keep(self.maxima_t, self.maxima_x, t, x, x > self.maxima_x.last(-np.inf))
+
+    def _keep(self, times, values, t, x, more_extreme):
+        # add the extreme, or if it's too close to the last one keep whichever is more extreme
+        if len(times) > 0 and t - times.last() < self.distance:
+            if not more_extreme:
+                return NOTHING
+            times.set_at(times.count - 1, t)
+            values.set_at(values.count - 1, x)
+            self.replaced = True
+        else:
+            times.append(t)
+            values.append(x)
+            self.replaced = False
+        return NEW_MINIMUM if times is self.minima_t else NEW_MAXIMUM
+
+    def clear(self):
+        self.minima_t.clear()
+        self.minima_x.clear()
+        self.maxima_t.clear()
+        self.maxima_x.clear()
+        self.history_t.clear()
+        self.history_x.clear()
+        self._n_pushed = 0
+        self._direction = 0
+        self._lo_i, self._lo_t, self._lo_x = 0, 0.0, np.inf
+        self._hi_i, self._hi_t, self._hi_x = 0, 0.0, -np.inf
+        self._fall_start = 0
+        self._fall = 0.0
+        self._pending = False
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+governor.py
+
+Adapts how often the plots are redrawn to how loaded the CPU is.
+
+The governor watches what each GUI frame costs and whether the fast loop
+still gets to run on time. When either runs short of time it steps the plot
+refresh down (longer frame interval, then decimated plots); once there's
+time to spare again for a while it steps back up. Only the plots are ever
+slowed down: the acquisition runs in its own thread and the monitors and
+alarms are updated on every frame regardless (see MainWindow.update_frame).
+
+"""
+
+import time
+
+
+class LoadMeter(object):
+    """
+    Smoothed cost of a regularly called function and the time between its
+    calls, in ms.
+
+    Constituents:
+        cost        =   smoothed time from start() to stop()
+        period      =   smoothed time between consecutive start()s
+        smoothing   =   weight of the newest call in the averages
+    """
+
+    def __init__(self, smoothing = 0.1):
+        self.smoothing = smoothing
+        self.cost = 0.0
+        self.period = None
+        self._t_start = None
+
+    def start(self):
+        t = time.perf_counter()
+        if not self._t_start is None:
+            period = (t - self._t_start)*1000.0
+            if self.period is None:
+                self.period = period
+            else:
+                self.period += self.smoothing*(period - self.period)
+        self._t_start = t
+
+    def stop(self):
+        cost = (time.perf_counter() - self._t_start)*1000.0
+        self.cost += self.smoothing*(cost - self.cost)
+
+
+class RefreshGovernor(object):
+    """
+    Picks the plot refresh interval and decimation.
+
+    Constituents:
+        base_interval   =   plot interval (ms) when there's time to spare
+        fast_interval   =   interval (ms) the fast loop is meant to run at
+        level           =   index into LEVELS, 0 is full rate
+        interval        =   current plot interval (ms)
+        decimation      =   current plot decimation factor
+        adaptive        =   if False the refresh is never changed, only the frames counted
+        frames          =   frames drawn
+        dropped         =   frames that weren't drawn at the full refresh rate
+        late            =   frames that came more than half an interval late
+    """
+
+    # (plot interval as a multiple of base_interval, decimation) for each level
+    LEVELS = ((1.0, 1), (1.5, 1), (2.0, 2), (3.0, 2), (4.0, 4))
+
+    def __init__(self, base_interval, fast_interval, adaptive = True, hold_time = 1.0, recover_time = 5.0, smoothing = 0.2):
+        self.base_interval = base_interval
+        self.fast_interval = fast_interval
+        self.adaptive = adaptive
+
+        # min time in s between two steps down, and time with spare capacity before a step up
+        self.hold_time = hold_time
+        self.recover_time = recover_time
+
+        self.frame_load = LoadMeter(smoothing)
+        self.level = 0
+        self.frames = 0
+        self.dropped = 0
+        self.late = 0
+
+        self._t_first = None
+        self._t_last = None
+        self._t_changed = 0.0
+        self._t_spare_since = None
+
+    @property
+    def interval(self):
+        return self.base_interval*self.LEVELS[self.level][0]
+
+    @property
+    def decimation(self):
+        return self.LEVELS[self.level][1]
+
+    def frame(self, fast_load = None):
+        """
+        Call at the end of each frame (after frame_load.stop()), with the
+        fast loop's LoadMeter. Returns True if the interval or decimation
+        should change.
+        """
+        t = time.monotonic()
+        self.frames += 1
+        if self._t_first is None:
+            self._t_first = t
+        else:
+            if (t - self._t_last)*1000.0 > 1.5*self.interval:
+                self.late += 1
+            self.dropped = max(int((t - self._t_first)*1000.0/self.base_interval) - self.frames + 1, 0)
+        self._t_last = t
+        if not self.adaptive:
+            return False
+
+        # is the GUI or the fast loop short of time?
+        frame_cost = self.frame_load.cost
+        fast_busy = False
+        fast_spare = True
+        if not fast_load is None and not fast_load.period is None:
+            fast_busy = (fast_load.period > 1.5*self.fast_interval) or (fast_load.cost > 0.5*self.fast_interval)
+            fast_spare = (fast_load.period < 1.2*self.fast_interval) and (fast_load.cost < 0.25*self.fast_interval)
+        overloaded = (frame_cost > 0.5*self.interval) or fast_busy
+        spare = (frame_cost < 0.2*self.interval) and fast_spare
+
+        if overloaded:
+            self._t_spare_since = None
+            if self.level < len(self.LEVELS) - 1 and (t - self._t_changed) > self.hold_time:
+                self.level += 1
+                self._t_changed = t
+                return True
+        elif spare and self.level > 0:
+            if self._t_spare_since is None:
+                self._t_spare_since = t
+            elif (t - self._t_spare_since) > self.recover_time:
+                self.level -= 1
+                self._t_changed = t
+                self._t_spare_since = t
+                return True
+        else:
+            self._t_spare_since = None
+        return False
+
+    def summary(self):
+        return (f"plot refresh {1000.0/self.interval:.1f} Hz (level {self.level}, decimation {self.decimation}), "
+                f"frame cost {self.frame_load.cost:.1f} ms, frames {self.frames}, dropped {self.dropped}, late {self.late}")
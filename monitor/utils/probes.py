@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+probes.py
+
+Optional timing probes for the hot paths (the fast and slow loop updates
+and the GUI updates).
+
+Each probe keeps two fixed size histograms: how long each call took and
+the time between the starts of consecutive calls. The first shows whether
+a loop is overrunning its tick, the second whether its thread is being
+starved (a timer that should fire every 50 ms but only gets to run every
+200 ms). Nothing is allocated per call, so the probes can stay on while
+the monitor is running.
+
+The probes are off unless enable() is called (monitor.py does that in
+diagnostic mode or with the 'probes' flag), and a disabled probe just
+calls straight through to the function.
+
+Usage:
+    from utils import probes
+
+    @probes.timed('fast_loop.update')
+    def update(self):
+        ...
+
+    probes.get_probe('fast_loop.update', budget_ms = 25)  # count overruns
+    print('\\n'.join(probes.report()))
+
+"""
+
+import functools
+import time
+
+
+# histogram bins: SUB_BITS bits of resolution per power of two, so each bin
+# is at most 1/2**SUB_BITS of its value wide, from 1 ns up to 2**N_OCTAVES ns (~18 min)
+SUB_BITS = 3
+N_SUB = 1 << SUB_BITS
+N_OCTAVES = 40
+N_BINS = (N_OCTAVES - SUB_BITS + 1)*N_SUB
+
+_enabled = False
+_probes = {}
+
+
+def _bin_index(ns):
+    # values below N_SUB get a bin each, above that it's a log scale
+    if ns < N_SUB:
+        return max(ns, 0)
+    shift = ns.bit_length() - SUB_BITS - 1
+    index = (shift + 1)*N_SUB + (ns >> shift) - N_SUB
+    return min(index, N_BINS - 1)
+
+
+def _bin_edges(index):
+    # returns the (lower, upper) edge of a bin in ns
+    if index < N_SUB:
+        return index, index + 1
+    shift = index//N_SUB - 1
+    mantissa = index % N_SUB + N_SUB
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+class Histogram(object):
+    """
+    Fixed size histogram of times in ns.
+
+    Constituents:
+        bins    =   list of N_BINS counts
+        count   =   number of values added
+        total   =   sum of the values (ns)
+        max     =   largest value (ns)
+    """
+
+    def __init__(self):
+        self.bins = [0]*N_BINS
+        self.clear()
+
+    def clear(self):
+        for i in range(N_BINS):
+            self.bins[i] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        self.bins[_bin_index(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.total/self.count
+
+    def percentile(self, q):
+        # value (ns) below which q percent of the values fall, to within a bin
+        if self.count == 0:
+            return 0.0
+        target = q/100.0*self.count
+        seen = 0
+        for index, n in enumerate(self.bins):
+            seen += n
+            if n > 0 and seen >= target:
+                lower, upper = _bin_edges(index)
+                return min(0.5*(lower + upper), self.max)
+        return self.max
+
+
+class TimingProbe(object):
+    """
+    Times the calls of one function.
+
+    Constituents:
+        name        =   probe name, e.g. 'fast_loop.update'
+        duration    =   Histogram of how long each call took
+        period      =   Histogram of the time between the starts of consecutive calls
+        budget_ns   =   calls longer than this count as overruns (None = no budget)
+        overruns    =   number of calls over budget
+    """
+
+    def __init__(self, name, budget_ms = None):
+        self.name = name
+        self.duration = Histogram()
+        self.period = Histogram()
+        self.set_budget(budget_ms)
+        self.overruns = 0
+        self._t_start = 0
+        self._t_last_start = None
+
+    def set_budget(self, budget_ms):
+        if budget_ms is None:
+            self.budget_ns = None
+        else:
+            self.budget_ns = int(budget_ms*1e6)
+
+    def start(self):
+        t = time.perf_counter_ns()
+        if not self._t_last_start is None:
+            self.period.add(t - self._t_last_start)
+        self._t_last_start = t
+        self._t_start = t
+
+    def stop(self):
+        dt = time.perf_counter_ns() - self._t_start
+        self.duration.add(dt)
+        if not self.budget_ns is None and dt > self.budget_ns:
+            self.overruns += 1
+
+    def clear(self):
+        self.duration.clear()
+        self.period.clear()
+        self.overruns = 0
+        self._t_last_start = None
+
+    def summary(self):
+        d = self.duration
+        p = self.period
+        line = (f"{self.name:<22} n={d.count:<7d} p50={_format_time(d.percentile(50))} "
+                f"p99={_format_time(d.percentile(99))} max={_format_time(d.max)}")
+        if not self.budget_ns is None:
+            line += f" over {self.budget_ns/1e6:g} ms: {self.overruns}"
+        if p.count > 0:
+            line += f" | period p50={_format_time(p.percentile(50))} p99={_format_time(p.percentile(99))} max={_format_time(p.max)}"
+        return line
+
+
+def _format_time(ns):
+    # short fixed width text for a time in ns
+    if ns < 1e6:
+        return f"{ns/1e3:6.0f}us"
+    elif ns < 1e9:
+        return f"{ns/1e6:6.1f}ms"
+    else:
+        return f"{ns/1e9:6.2f}s "
+
+
+def enable(on = True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def get_probe(name, budget_ms = None):
+    # returns the probe with this name, creating it the first time
+    probe = _probes.get(name)
+    if probe is None:
+        probe = TimingProbe(name, budget_ms)
+        _probes[name] = probe
+    elif not budget_ms is None:
+        probe.set_budget(budget_ms)
+    return probe
+
+
+def timed(name):
+    """
+    Decorator that times every call of the function with the probe called
+    name, while the probes are enabled.
+    """
+    def decorator(function):
+        probe = get_probe(name)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            probe.start()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                probe.stop()
+        return wrapper
+    return decorator
+
+
+def clear():
+    for probe in _probes.values():
+        probe.clear()
+
+
+def report():
+    # one line per probe that has been called
+    return [probe.summary() for probe in _probes.values() if probe.duration.count > 0]
+
+
+def dump(filename):
+    """
+    Writes the summaries and the full histograms of all the probes to a
+    text file.
+    """
+    with open(filename, 'w') as f:
+        f.write('\n'.join(report()) + '\n')
+        for probe in _probes.values():
+            for kind, hist in (('duration', probe.duration), ('period', probe.period)):
+                if hist.count == 0:
+                    continue
+                f.write(f"\n# {probe.name} {kind}: bin_lower_ns\tbin_upper_ns\tcount\n")
+                for index, n in enumerate(hist.bins):
+                    if n > 0:
+                        lower, upper = _bin_edges(index)
+                        f.write(f"{lower}\t{upper}\t{n}\n")
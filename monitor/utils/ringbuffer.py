@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ringbuffer.py
+
+Fixed capacity, array backed ring buffer used for the realtime data vectors.
+
+Every sample is written twice: once at its slot in the ring and once at the
+same slot offset by the ring length. This means the most recent samples are
+always stored contiguously somewhere in the storage array, so we can hand out
+an ordered (oldest -> newest) numpy view of the data without copying it, and
+appending a point is O(1) instead of the O(N) shift of the old add_new_point.
+
+The ring can be given some headroom: slots beyond the capacity that are
+written but not part of the held data. A view of the data as it was at a
+given count (view_at) then stays intact until headroom more values have
+been appended, which lets another thread read the data without copying it
+or stopping the writer.
+
+For that the writers keep to an order: the number of values being written
+(_claimed) goes up before any of them is stored, and count only goes up
+once they all are, after _head and _n. The slot a count ends at is always
+count modulo the ring length, so view_at() works it out from the count it's
+given and never has to read _head, which may belong to a later write.
+
+"""
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """
+    Holds the last `capacity` values appended to it.
+
+    Constituents:
+        capacity    = the maximum number of values held
+        dtype       = numpy dtype of the storage array
+        count       = total number of values ever appended
+        headroom    = extra slots in the ring, see view_at()
+
+    The view() returned is a numpy view into the storage, so it is only
+    valid until the buffer wraps around onto it again. Hang on to it for one
+    loop iteration, not forever.
+    """
+
+    def __init__(self, capacity, dtype = float, fill = None, headroom = 0):
+        self.capacity = int(capacity)
+        self.headroom = int(headroom)
+        self.dtype = np.dtype(dtype)
+
+        # the ring has room for the held values plus the headroom
+        self._ring = self.capacity + self.headroom
+
+        # the storage holds two copies of the ring, back to back
+        self._storage = np.zeros(2*self._ring, dtype = self.dtype)
+
+        # index of the slot that the next value will be written to
+        self._head = 0
+
+        # number of valid values currently held
+        self._n = 0
+
+        # total number of values appended since the buffer was created
+        self.count = 0
+
+        # count plus the values that are being written but aren't counted yet
+        self._claimed = 0
+
+        # start out full of a constant value if requested (used by the plots)
+        if not fill is None:
+            self._storage[:] = fill
+            self._n = self.capacity
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, key):
+        return self.view()[key]
+
+    @property
+    def full(self):
+        return self._n == self.capacity
+
+    def append(self, value):
+        # add a single point to the buffer, overwriting the oldest point if full
+        self._claimed = self.count + 1
+        head = self._head
+        self._storage[head] = value
+        self._storage[head + self._ring] = value
+
+        head += 1
+        if head == self._ring:
+            head = 0
+        self._head = head
+
+        if self._n < self.capacity:
+            self._n += 1
+        self.count = self._claimed
+
+    def extend(self, values):
+        # add a block of points to the buffer
+        values = np.asarray(values, dtype = self.dtype)
+        n_new = len(values)
+        if n_new == 0:
+            return
+        self._claimed = self.count + n_new
+
+        # only the last ring length values can possibly survive
+        if n_new > self._ring:
+            values = values[-self._ring:]
+        n_write = len(values)
+
+        # write the block in (at most) two contiguous pieces, the values
+        # that were skipped still move the head along
+        start = (self._head + n_new - n_write) % self._ring
+        n_first = min(n_write, self._ring - start)
+        self._write(start, values[:n_first])
+        if n_write > n_first:
+            self._write(0, values[n_first:])
+
+        self._head = (start + n_write) % self._ring
+        self._n = min(self._n + n_new, self.capacity)
+        self.count = self._claimed
+
+    def _write(self, start, values):
+        stop = start + len(values)
+        self._storage[start:stop] = values
+        self._storage[start + self._ring:stop + self._ring] = values
+
+    def view(self):
+        # ordered view of the held data, oldest point first. This is not a copy!
+        start = self._head - self._n
+        if start < 0:
+            start += self._ring
+        return self._storage[start:start + self._n]
+
+    def view_at(self, count):
+        """
+        Ordered view of the data that was held when count values had been
+        appended, or None if the buffer has moved on by more than the
+        headroom since then (so some of it has been overwritten). This is
+        not a copy either: check valid_at(count) again after using it if
+        the writer might have carried on in the meantime.
+        """
+        if not self.valid_at(count):
+            return None
+        n = min(self._n, count)
+        stop = count % self._ring
+        if stop < n:
+            stop += self._ring
+        return self._storage[stop - n:stop]
+
+    def valid_at(self, count):
+        # is the data held at count still intact? the values being written
+        # right now count as written, their slots may already be changed
+        return count <= self.count and self._claimed - count <= self.headroom
+
+    def set_at(self, index, value):
+        # overwrite the value that was appended as the index'th (counting
+        # from 0, like count) if it's still held. returns False if it isn't
+        back = self.count - index
+        if back < 1 or back > self._n:
+            return False
+        slot = (self._head - back) % self._ring
+        self._storage[slot] = value
+        self._storage[slot + self._ring] = value
+        return True
+
+    def set_last(self, values):
+        # overwrite the newest len(values) values held with the values given, oldest first
+        values = np.asarray(values, dtype = self.dtype)
+        n_write = len(values)
+        if n_write == 0:
+            return
+        if n_write > self._n:
+            raise ValueError(f'can only overwrite the {self._n} values held, not {n_write}')
+        start = (self._head - n_write) % self._ring
+        n_first = min(n_write, self._ring - start)
+        self._write(start, values[:n_first])
+        if n_write > n_first:
+            self._write(0, values[n_first:])
+
+    def first(self, default = None):
+        # the oldest value held
+        if self._n == 0:
+            return default
+        return self._storage[self._head - self._n + self._ring]
+
+    def last(self, default = None):
+        # the most recently appended value
+        if self._n == 0:
+            return default
+        return self._storage[self._head - 1 + self._ring]
+
+    def set_all(self, values):
+        # replace the contents of the buffer with the values given, this is O(N)
+        # so only use it when the whole vector has to be recalculated.
+        # the values are written into the slots ending at the current head,
+        # so the running count of points isn't disturbed (unless there are
+        # more values than were ever appended, then the count moves up to
+        # them and the head with it, to stay at count modulo the ring length)
+        values = np.array(values, dtype = self.dtype)[-self.capacity:]
+        n_write = len(values)
+        if self.capacity == 0:
+            return
+
+        count = max(self.count, n_write)
+        self._claimed = count
+        head = count % self._ring
+        start = (head - n_write) % self._ring
+        n_first = min(n_write, self._ring - start)
+        self._write(start, values[:n_first])
+        if n_write > n_first:
+            self._write(0, values[n_first:])
+
+        self._head = head
+        self._n = n_write
+        self.count = count
+
+    def clear(self):
+        self._head = 0
+        self._n = 0
+        self.count = 0
+        self._claimed = 0
+
+
+class ring_field(object):
+    """
+    Exposes the ordered view of one of the RingBuffers in an object's
+    `buffers` dictionary as a plain attribute, so the rest of the code can
+    keep reading eg. fastdata.flow[-1] like it's an array.
+
+    Assigning a full array to the attribute replaces the buffer contents.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, objtype = None):
+        if obj is None:
+            return self
+        return obj.buffers[self.name].view()
+
+    def __set__(self, obj, values):
+        obj.buffers[self.name].set_all(values)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+snapshot.py
+
+Versioned, double buffered snapshot of a few values that one thread
+publishes and other threads read, seqlock style: no lock is taken, the
+writer never waits, and a reader can tell whether what it read was changed
+under it and tries again.
+
+The writer fills the slot that readers aren't using and bumps the version
+before and after, so the version is odd while a write is in progress. A
+reader takes the slot of the last finished write and checks afterwards that
+the writer hasn't started on that same slot again in the meantime.
+
+The values are meant to be small (numbers, counts); larger data should stay
+where it is and be referred to by the count it had when the snapshot was
+published, see RingBuffer.view_at(). For that the writer calls begin()
+before it changes that data, so the version is already odd while it does,
+and a reader that copied some of it checks changed_since() afterwards.
+
+"""
+
+
+class VersionedSnapshot(object):
+    """
+    Constituents:
+        fields  =   names of the values in the snapshot
+        version =   twice the number of finished writes (+1 while writing)
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self._slots = [dict.fromkeys(self.fields), dict.fromkeys(self.fields)]
+        self.version = 0
+
+    def begin(self):
+        # start a write early, before the data the snapshot refers to is changed
+        if self.version % 2 == 0:
+            self.version += 1
+
+    def publish(self, values):
+        # only one thread may publish
+        self.begin()
+        slot = self._slots[(self.version//2 + 1) % 2]
+        slot.update(values)
+        self.version += 1
+
+    def read(self):
+        """
+        Returns (version, dict of values) for the last finished write.
+        """
+        while True:
+            version = self.version
+            last = version//2
+            values = self._slots[last % 2].copy()
+
+            # the slot is written again by write last + 2, which starts when
+            # the version gets to 2*last + 3
+            if self.version < 2*last + 3:
+                return 2*last, values
+
+    def changed_since(self, version):
+        # has a write started since read() returned this version?
+        return self.version != version
+
+    @property
+    def published(self):
+        # has anything been published yet?
+        return self.version >= 2
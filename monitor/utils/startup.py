@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+startup.py
+
+Timeline of the monitor starting up, from the process starting to the
+first sample being plotted.
+
+monitor.py imports this before anything else, and each phase of the start
+up calls mark() when it's done. When the first sample has been plotted
+finish() prints how long each phase took, along with how long the system
+had been up when the monitor was started (on Linux), so the time from a
+power cycle to the first waveform can be followed.
+
+Usage:
+    from utils import startup
+    startup.mark('config loaded')
+    ...
+    startup.finish('first sample plotted')
+
+"""
+
+import os
+import time
+
+
+# the timeline is measured from when this module was imported
+_t_import = time.perf_counter()
+_marks = []
+_finished = False
+
+
+def _read_proc_times():
+    # returns (system uptime, age of this process) in s when this module was imported, or None
+    try:
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        with open('/proc/self/stat') as f:
+            # the fields after the command name, which is in brackets and can contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        t_started = int(fields[19])/os.sysconf('SC_CLK_TCK')
+        return uptime, uptime - t_started
+    except Exception:
+        return None
+
+_proc_times = _read_proc_times()
+
+
+def mark(phase):
+    # note the time a phase of the start up finished
+    if not _finished:
+        _marks.append((phase, time.perf_counter()))
+
+
+def finished():
+    return _finished
+
+
+def finish(phase):
+    # mark the last phase and print the timeline, only the first time it's called
+    global _finished
+    if _finished:
+        return
+    mark(phase)
+    _finished = True
+    print('\n'.join(report()))
+
+
+def report():
+    # one line per phase: time since the start and how long the phase took
+    lines = ['startup timeline:']
+    if not _proc_times is None:
+        uptime, age = _proc_times
+        lines.append(f'  system up {uptime - age:.1f} s when the monitor was started, '
+                     f'{age:.2f} s to start python and import the timeline')
+    t_last = _t_import
+    for phase, t in _marks:
+        lines.append(f'  {t - _t_import:7.3f} s  (+{t - t_last:6.3f} s)  {phase}')
+        t_last = t
+    return lines
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+uicache.py
+
+Loads the Qt Designer .ui files from Python compiled ahead of time instead
+of parsing the XML every time a widget is made.
+
+uic.loadUi parses and interprets the .ui file on every call, and there's a
+call for every Monitor, toolbar, alarm and settings widget, which adds up
+to seconds at startup on the Pi. load_ui() compiles each .ui file once with
+uic.compileUi into the cache directory and from then on imports the
+compiled module (which Python itself then keeps as bytecode) and calls its
+setupUi on the widget.
+
+Each compiled file starts with the modification time and SHA-1 of the .ui
+file it was made from. If the mtime has changed the hash is checked, and the
+file is only recompiled if the contents have changed too. If anything goes
+wrong with the cache the .ui file is loaded with uic.loadUi as before.
+
+Usage:
+    from utils.uicache import load_ui
+    load_ui('monitor_class/monitor.ui', self)    # instead of uic.loadUi
+
+"""
+
+import hashlib
+import io
+import importlib.util
+import os
+
+from PyQt5 import uic
+
+
+# where the compiled modules go, relative to the working directory (the monitor directory)
+CACHE_DIR = '__uicache__'
+
+_enabled = True
+
+# the Ui_ class of each .ui file that has been loaded this run
+_classes = {}
+
+
+def enable(on = True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def load_ui(uifile, widget):
+    """
+    Sets up the widget from a .ui file, like uic.loadUi(uifile, widget).
+    The child widgets are added to the widget as attributes by their
+    object names.
+    """
+    if not _enabled:
+        return uic.loadUi(uifile, widget)
+    try:
+        ui_class = _classes.get(uifile)
+        if ui_class is None:
+            ui_class = _load_class(uifile)
+            _classes[uifile] = ui_class
+    except Exception as e:
+        print(f'uicache: could not use the compiled {uifile}, loading it instead: {e}')
+        return uic.loadUi(uifile, widget)
+
+    ui = ui_class()
+    ui.setupUi(widget)
+    # loadUi puts the children straight on the widget, setupUi on the Ui object
+    for name, child in vars(ui).items():
+        setattr(widget, name, child)
+    return widget
+
+
+def _cache_file(uifile):
+    # eg. monitor_class/monitor.ui -> __uicache__/ui_monitor_class_monitor.py
+    name = os.path.splitext(os.path.normpath(uifile))[0].replace(os.sep, '_').replace('.', '_')
+    return os.path.join(CACHE_DIR, 'ui_' + name + '.py')
+
+
+def _file_hash(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _read_header(pyfile):
+    # returns (mtime, sha1) from the first line of a compiled file, or (None, None)
+    try:
+        with open(pyfile) as f:
+            fields = f.readline().split()
+        return float(fields[2]), fields[4]
+    except (OSError, IndexError, ValueError):
+        return None, None
+
+
+def _write(pyfile, mtime, sha1, body):
+    # write to a temporary file first so a half written file is never imported
+    tmpfile = pyfile + '.tmp'
+    with open(tmpfile, 'w') as f:
+        f.write(f'# mtime: {mtime!r} sha1: {sha1} (compiled from the .ui file by utils/uicache.py, do not edit)\n')
+        f.write(body)
+    os.replace(tmpfile, pyfile)
+
+
+def _load_class(uifile):
+    pyfile = _cache_file(uifile)
+    mtime = os.stat(uifile).st_mtime
+    cached_mtime, cached_sha1 = _read_header(pyfile)
+
+    if cached_mtime != mtime:
+        sha1 = _file_hash(uifile)
+        os.makedirs(CACHE_DIR, exist_ok = True)
+        if cached_sha1 == sha1:
+            # only touched, the compiled code is still good
+            with open(pyfile) as f:
+                f.readline()
+                body = f.read()
+        else:
+            print(f'uicache: compiling {uifile}')
+            stream = io.StringIO()
+            uic.compileUi(uifile, stream)
+            body = stream.getvalue()
+        _write(pyfile, mtime, sha1, body)
+
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(pyfile))[0], pyfile)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for name, value in vars(module).items():
+        if name.startswith('Ui_') and hasattr(value, 'setupUi'):
+            return value
+    raise ValueError(f'no Ui_ class in {pyfile}')
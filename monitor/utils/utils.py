@@ -10,9 +10,11 @@ This is just a collection of useful functions used elsewhere in the code
 
 @author: nlourie
 """
-from scipy import signal
 import numpy as np
 
+# scipy takes a while to import and isn't needed to get the monitor going,
+# so each function that uses scipy.signal imports it the first time it's called
+
 def breath_detect_coarse(flow,fs,minpeak = 0.05,plotflag = False):
     """
     %% This function detects peaks of flow signal
@@ -44,6 +46,7 @@ def breath_detect_coarse(flow,fs,minpeak = 0.05,plotflag = False):
     minPeak = minpeak # flow threshold = 0.05 (L/s)
     minpeakprominence = 0.05
     
+    from scipy import signal
     peak_index, _  = signal.find_peaks(flow, 
                                     height = minPeak,
                                     distance = peakdistance,
@@ -83,6 +86,7 @@ def zerophase_lowpass(x,lf,fs,force_length = False):
             #print('made odd: l_lfilter = ',l_lfilter)
         
     # filter flow signal
+    from scipy import signal
     x_filt = signal.savgol_filter(x,polyorder = N,window_length = l_lfilter)
     return x_filt
 
@@ -90,5 +94,6 @@ def butter_lowpass(cutoff, fs, order=5):
     #from here: https://stackoverflow.com/a/25192640
     nyq = 0.5 * fs
     normal_cutoff = cutoff / nyq
+    from scipy import signal
     b, a = signal.butter(order, normal_cutoff, btype='low', analog=False)
     return b, a
\ No newline at end of file